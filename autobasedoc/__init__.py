@@ -18,6 +18,7 @@ from autobasedoc.autorpt import base_fonts, addPlugin
 @author: oliver, johannes
 """
 import sys
+from contextvars import ContextVar
 from .version import version
 
 from reportlab.lib import colors
@@ -49,16 +50,101 @@ def setup_color_dict(colors):
 
 setup_color_dict(colors)
 
+# the active DocumentContext and the tokens to leave the ones entered
+_context = ContextVar("autobasedoc_context", default=None)
+_entered = ContextVar("autobasedoc_entered", default=())
+
+
+class DocumentContext(object):
+    """
+    the fonts, colors, id counters and plot font of a document
+
+    :func:`base_fonts` and :func:`color_dict` return the dicts of the
+    active context, or the ones of the package if there is none, so that
+    fonts set by ``setFonts`` or ``setTtfFonts`` only apply to the documents
+    of the context. The Header, Footer and Bookmark flowables created in a
+    context are numbered from 0 in it.
+
+    A context is active inside its ``with`` block, in the thread or asyncio
+    task entering it, and in the builds of an AutoDocTemplate it was given
+    to. So that reports can be rendered at once in a thread pool::
+
+        def report(data):
+            with DocumentContext() as context:
+                setFonts('serif')
+                doc = AutoDocTemplate(BytesIO(), context=context, ...)
+                doc.build(makeStory(data))
+                return doc.filename.getvalue()
+
+        with ThreadPoolExecutor(8) as pool:
+            pdfs = list(pool.map(report, datasets))
+
+    A context starts with copies of the fonts and colors of the package, or
+    of the dicts given. It is meant for one document, or for documents built
+    one after another.
+
+    :param fonts: the base fonts, see :func:`base_fonts`
+    :param colors: the colors by name, see :func:`color_dict`
+    :param fontprop: the matplotlib FontProperties of the figures,
+                     see ``autoplot.fontProperties``
+    """
+
+    def __init__(self, fonts=None, colors=None, fontprop=None):
+        self.fonts = dict(_baseFontNames if fonts is None else fonts)
+        self.colors = dict(_color_dict if colors is None else colors)
+        self.fontprop = fontprop
+        self._ids = {}
+
+    def next_id(self, kind):
+        """
+        returns the next number of the counter kind, starting with 0
+        """
+        n = self._ids.get(kind, 0)
+        self._ids[kind] = n + 1
+        return n
+
+    def __enter__(self):
+        _entered.set(_entered.get() + (_context.set(self),))
+        return self
+
+    def __exit__(self, *exc):
+        entered = _entered.get()
+        _entered.set(entered[:-1])
+        _context.reset(entered[-1])
+
+
+def current_context():
+    """
+    returns the active DocumentContext, or None
+    """
+    return _context.get()
+
+
+def next_id(cls):
+    """
+    returns the next id of the objects of cls, counted in the active
+    DocumentContext if there is one, else by the counter ``cls._ids``
+    """
+    context = _context.get()
+    if context is None:
+        return next(cls._ids)
+    return context.next_id(cls.__name__)
+
+
 def base_fonts():
     """
     there should be one base font per document
     this is how to obtain that dictionary
     of the different font weights of that base font
+
+    these are the fonts of the active DocumentContext, if there is one
     """
-    return _baseFontNames
+    context = _context.get()
+    return _baseFontNames if context is None else context.fonts
 
 def color_dict():
     """
-    base colors
+    base colors, of the active DocumentContext if there is one
     """
-    return _color_dict
+    context = _context.get()
+    return _color_dict if context is None else context.colors
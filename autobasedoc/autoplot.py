@@ -10,14 +10,53 @@ autoplot
 .. moduleauthor:: Johannes Eckstein
 
 Created on Wed Sep 16 11:11:12 2015
+
+Figures can be rendered in worker processes. Inside a :class:`FigurePool`
+the decorated functions return :class:`FuturePdfImage` placeholders, which
+``AutoDocTemplate.build`` resolves in story order::
+
+    with ap.FigurePool(processes=8):
+        for data in datasets:
+            story.append(my_plot(data))
+
+        doc.multiBuild(story)
+
+Rendered figures can be kept on disk between runs. Inside a
+:class:`FigureCache` a decorated function is only called if it was not
+called with the same arguments before::
+
+    with ap.FigureCache("~/.cache/autobasedoc", maxbytes=2**30) as cache:
+        story.append(my_plot(data))
+
+    print(cache.stats())
+
+With ``figureForms = True``, figures outside of pools and caches are drawn
+directly into a :class:`~autobasedoc.figureform.FigureForm`, without saving
+them to PDF and parsing them again. Their text is drawn as paths then, it
+can not be searched or selected in the PDF. Figures the form renderer does
+not support are saved to PDF as by default.
+
+pyplot is only imported on the first use of ``autoplot.plt``. Plot functions
+creating their figures with :func:`figure` or :func:`subplots` instead
+do not touch the global state of pyplot and can run in threads, see
+:func:`figure`. The decorators close the figures they rendered if pyplot
+manages them, not all figures of pyplot.
 """
 import os
+import re
 import sys
+import pickle
+import threading
+import multiprocessing
+from hashlib import sha1
 
 from io import BytesIO
 from functools import wraps
 from cycler import cycler
 
+from reportlab.platypus import Flowable
+
+import numpy as np
 import matplotlib
 
 # try:
@@ -28,7 +67,8 @@ import matplotlib
 
 from matplotlib.lines import Line2D
 from matplotlib.patches import Rectangle
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.transforms import Bbox
 from matplotlib.ticker import LinearLocator, MultipleLocator, AutoMinorLocator, FormatStrFormatter
 import matplotlib.font_manager as fm
@@ -36,7 +76,9 @@ from matplotlib.font_manager import findfont
 from matplotlib import ft2font
 from matplotlib.font_manager import ttfFontProperty
 
+from autobasedoc import current_context
 from autobasedoc.pdfimage import PdfImage, PdfAsset, getScaledSvg
+from autobasedoc.figureform import FigureForm
 
 # add color names, missing in matplotlib
 missing_names = {
@@ -47,10 +89,477 @@ missing_names = {
 
 matplotlib.colors.cnames.update(missing_names)
 
-plt.ioff()
-
 fontprop = None
 
+_plt = None
+
+_figure_pool = None
+_figure_cache = None
+
+# draw figures as FigureForm, with their text as paths
+figureForms = False
+
+
+def fontProperties():
+    """
+    returns the FontProperties for the figures, those of the active
+    :class:`~autobasedoc.DocumentContext` if it has some, else ``fontprop``
+    """
+    context = current_context()
+    if context is not None and context.fontprop is not None:
+        return context.fontprop
+    return fontprop
+
+
+def _pyplot():
+    """
+    returns pyplot, imported on first use with interactive mode off
+    """
+    global _plt
+    if _plt is None:
+        import matplotlib.pyplot as pyplot
+        pyplot.ioff()
+        _plt = pyplot
+    return _plt
+
+
+def __getattr__(name):
+    """
+    imports pyplot on the first use of ``autoplot.plt``
+    """
+    if name == "plt":
+        return _pyplot()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def figure(**kwargs):
+    """
+    returns a new Figure drawn by an Agg canvas, like ``plt.figure``,
+    but not managed by pyplot
+
+    Figures of :func:`figure` and :func:`subplots` do not touch the global
+    state of pyplot, they can be created and rendered concurrently in
+    threads. They are not closed, but freed as any other object::
+
+        @autoPdfImg
+        def my_plot(data):
+            fig, ax = ap.subplots(figsize=(5, 3))
+            ax.plot(data)
+            return fig
+
+        with ThreadPoolExecutor(8) as pool:
+            story.extend(pool.map(my_plot, datasets))
+    """
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def subplots(nrows=1, ncols=1, sharex=False, sharey=False, squeeze=True,
+             subplot_kw=None, gridspec_kw=None, **fig_kw):
+    """
+    returns a new Figure of :func:`figure` and its axes, like ``plt.subplots``
+    """
+    fig = figure(**fig_kw)
+    axs = fig.subplots(nrows, ncols, sharex=sharex, sharey=sharey, squeeze=squeeze,
+                       subplot_kw=subplot_kw, gridspec_kw=gridspec_kw)
+    return fig, axs
+
+
+def _closeFigures(*figs):
+    """
+    closes the figures managed by pyplot, figures of :func:`figure`
+    are left to the garbage collector
+    """
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    if pyplot is None:
+        return
+    for fig in figs:
+        if fig is not None and getattr(fig.canvas, "manager", None) is not None:
+            pyplot.close(fig)
+
+
+def _figure_form(fig):
+    """
+    returns fig as a :class:`FigureForm`, or None if it has to be saved to PDF
+    """
+    if not figureForms:
+        return
+    try:
+        return FigureForm(fig)
+    except NotImplementedError:
+        return
+
+
+def _legend_to_pdf(leg_fig, leg):
+    """
+    saves the legend figure to a PDF buffer
+    """
+    imgleg = BytesIO()
+    leg_fig.savefig(
+        imgleg,
+        #additional_artists=(leg.get_window_extent(), ),
+        bbox_extra_artists=(leg.legendPatch, ),
+        bbox_inches='tight',
+        format='PDF',
+        transparent=True)
+    # rewind the data
+    imgleg.seek(0)
+    return imgleg
+
+
+def _render_pdf_bytes(func, args, kwargs, legend=False):
+    """
+    worker side of :class:`FigurePool`
+
+    calls the undecorated plot function and returns the PDF bytes of the
+    figure, or a tuple (figure, legend) of PDF bytes if legend is True
+    """
+    fig = leg_fig = None
+    try:
+        plot = func.__wrapped__(*args, **kwargs)
+        if legend:
+            fig, leg_fig, leg = plot
+        else:
+            fig = plot
+
+        if not fig:
+            return
+
+        imgax = BytesIO()
+        if legend:
+            imgleg = _legend_to_pdf(leg_fig, leg)
+            fig.savefig(imgax, format='PDF')
+            return imgax.getvalue(), imgleg.getvalue()
+
+        fig.savefig(imgax, format='PDF')
+        return imgax.getvalue()
+    finally:
+        _closeFigures(fig, leg_fig)
+
+
+class FigurePool(object):
+    """
+    a pool of worker processes rendering the figures of decorated functions
+
+    While the pool is active (inside the ``with`` block or after
+    :meth:`activate`), :func:`autoPdfImg` and :func:`autoPdfImage` hand the
+    plot function to a worker and return :class:`FuturePdfImage`
+    placeholders instead of rendering in the calling process.
+
+    The decorated plot functions and their arguments must be picklable,
+    i.e. defined at module level.
+
+    :param processes: number of worker processes, default is the cpu count
+    :param maxtasksperchild: figures rendered by one worker before it is
+        replaced, this bounds the memory held by matplotlib in a worker
+    :param context: multiprocessing context or start method name
+    """
+
+    def __init__(self, processes=None, maxtasksperchild=20, context=None):
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+        self._pool = context.Pool(processes=processes,
+                                  maxtasksperchild=maxtasksperchild)
+        self._previous = None
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, *exc):
+        self.deactivate()
+        self.close()
+
+    def activate(self):
+        """
+        route decorated functions to this pool
+        """
+        global _figure_pool
+        self._previous, _figure_pool = _figure_pool, self
+
+    def deactivate(self):
+        """
+        render decorated functions in the calling process again
+        """
+        global _figure_pool
+        _figure_pool, self._previous = self._previous, None
+
+    def submit(self, func, args, kwargs, legend=False):
+        """
+        schedule the decorated func, returns an AsyncResult of the PDF bytes
+        """
+        return self._pool.apply_async(_render_pdf_bytes,
+                                      (func, args, kwargs, legend))
+
+    def close(self):
+        """
+        wait for all pending figures and stop the workers
+        """
+        self._pool.close()
+        self._pool.join()
+
+
+class FuturePdfImage(Flowable):
+    """
+    placeholder for a :class:`PdfImage` that is rendered by a
+    :class:`FigurePool`
+
+    :meth:`resolve` waits for the worker and returns the PdfImage (or None,
+    if the plot function returned no figure). The placeholder can also be
+    drawn directly, it resolves on first use.
+    """
+
+    def __init__(self, result, index=None, store=None):
+        super(FuturePdfImage, self).__init__()
+        self._result = result
+        self._index = index
+        self._store = store
+        self._image = None
+        self._resolved = False
+
+    def resolve(self):
+        if not self._resolved:
+            data = self._result.get()
+            if data and self._store is not None:
+                self._store(data)
+            if data and self._index is not None:
+                data = data[self._index]
+            if data:
+                self._image = PdfImage(BytesIO(data))
+            self._resolved = True
+            self._result = self._store = None
+        return self._image
+
+    def wrap(self, availableWidth, availableHeight):
+        image = self.resolve()
+        if image is None:
+            return 0, 0
+        return image.wrap(availableWidth, availableHeight)
+
+    def drawOn(self, canv, x, y, _sW=0):
+        image = self.resolve()
+        if image is not None:
+            image.drawOn(canv, x, y, _sW)
+
+
+def resolveFigures(flowables):
+    """
+    replace all FuturePdfImage placeholders in the list flowables
+    with their rendered PdfImage, in story order
+    """
+    for i, f in enumerate(flowables):
+        if isinstance(f, FuturePdfImage):
+            flowables[i] = f.resolve()
+    return flowables
+
+
+def _stable_hash(obj, h):
+    """
+    feeds obj into the hash h, independent of the process and of the
+    id or hash seed of obj
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex, str)):
+        h.update(("%s:%r;" % (type(obj).__name__, obj)).encode("utf-8"))
+    elif isinstance(obj, (bytes, bytearray)):
+        h.update(b"bytes:%d;" % len(obj))
+        h.update(obj)
+    elif isinstance(obj, np.ndarray) and obj.dtype != object:
+        h.update(("ndarray:%s:%r;" % (obj.dtype.str, obj.shape)).encode("utf-8"))
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, np.generic):
+        _stable_hash(obj.item(), h)
+    elif isinstance(obj, (list, tuple)):
+        h.update(("%s:%d;" % (type(obj).__name__, len(obj))).encode("utf-8"))
+        for item in obj:
+            _stable_hash(item, h)
+    elif isinstance(obj, dict):
+        h.update(("dict:%d;" % len(obj)).encode("utf-8"))
+        for key in sorted(obj, key=repr):
+            _stable_hash(key, h)
+            _stable_hash(obj[key], h)
+    elif isinstance(obj, (set, frozenset)):
+        _stable_hash(sorted(obj, key=repr), h)
+    else:
+        # anything else must at least pickle the same way every time
+        h.update(("%s.%s;" % (type(obj).__module__, type(obj).__qualname__)).encode("utf-8"))
+        h.update(pickle.dumps(obj, protocol=4))
+
+
+class FigureCache(object):
+    """
+    a persistent on-disk cache for the PDF bytes of decorated plot functions
+
+    While the cache is active (inside the ``with`` block or after
+    :meth:`activate`), :func:`autoPdfImg` and :func:`autoPdfImage` look up
+    the function's qualified name, a stable hash of its arguments and the
+    matplotlib version, and return the stored figure without calling the
+    plot function. Arguments that can not be hashed bypass the cache.
+
+    Least recently used entries are removed once the cache holds more than
+    maxbytes.
+
+    :param directory: cache directory, created if missing
+    :param maxbytes: size limit of all stored figures in bytes
+    """
+
+    def __init__(self, directory, maxbytes=512 * 2**20):
+        self.directory = os.path.realpath(os.path.expanduser(directory))
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._previous = None
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(size for path, size, mtime in self._files())
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, *exc):
+        self.deactivate()
+
+    def activate(self):
+        """
+        route decorated functions through this cache
+        """
+        global _figure_cache
+        self._previous, _figure_cache = _figure_cache, self
+
+    def deactivate(self):
+        """
+        stop using this cache
+        """
+        global _figure_cache
+        _figure_cache, self._previous = self._previous, None
+
+    def _funcdir(self, func):
+        name = "%s.%s" % (func.__module__, func.__qualname__)
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", name))
+
+    def _paths(self, key):
+        funcdir, digest, legend = key
+        if legend:
+            return [os.path.join(funcdir, digest + ".pdf"),
+                    os.path.join(funcdir, digest + ".legend.pdf")]
+        return [os.path.join(funcdir, digest + ".pdf")]
+
+    def _files(self):
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith(".pdf"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def key(self, func, args, kwargs, legend=False):
+        """
+        returns the key of a call to func, or None if the arguments
+        can not be hashed
+        """
+        h = sha1()
+        try:
+            _stable_hash((func.__module__, func.__qualname__,
+                          matplotlib.__version__, legend, args, kwargs), h)
+        except (TypeError, AttributeError, pickle.PicklingError):
+            return None
+        return self._funcdir(func), h.hexdigest(), legend
+
+    def get(self, key):
+        """
+        returns the stored PDF bytes (a tuple for legend figures) or None
+        """
+        paths = self._paths(key)
+        with self._lock:
+            try:
+                data = []
+                for path in paths:
+                    with open(path, "rb") as f:
+                        data.append(f.read())
+                    # mark as recently used
+                    os.utime(path)
+            except OSError:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return tuple(data) if key[2] else data[0]
+
+    def put(self, key, data):
+        """
+        stores the PDF bytes (a tuple for legend figures) under key
+        """
+        if not key[2]:
+            data = (data, )
+        with self._lock:
+            os.makedirs(key[0], exist_ok=True)
+            for path, value in zip(self._paths(key), data):
+                if os.path.exists(path):
+                    continue
+                tmp = "%s.%d.tmp" % (path, os.getpid())
+                with open(tmp, "wb") as f:
+                    f.write(value)
+                os.replace(tmp, path)
+                self._size += len(value)
+            if self._size > self.maxbytes:
+                self._evict()
+
+    def storer(self, key):
+        """
+        returns a function storing data under key
+        """
+        return lambda data: self.put(key, data)
+
+    def _evict(self):
+        files = sorted(self._files(), key=lambda item: item[2])
+        self._size = sum(size for path, size, mtime in files)
+        for path, size, mtime in files:
+            if self._size <= self.maxbytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def invalidate(self, func=None):
+        """
+        removes the stored figures of the decorated func, or all figures
+        """
+        with self._lock:
+            for path, size, mtime in list(self._files()):
+                if func is None or os.path.dirname(path) == self._funcdir(func):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    self._size -= size
+
+    def clear(self):
+        """
+        removes all stored figures and resets the counters
+        """
+        self.invalidate()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        returns a dict with hits, misses, evictions, entries, size and maxbytes
+        """
+        with self._lock:
+            return dict(hits=self.hits,
+                        misses=self.misses,
+                        evictions=self.evictions,
+                        entries=len(list(self._files())),
+                        size=self._size,
+                        maxbytes=self.maxbytes)
+
 
 def autoPdfImage(func):
     """Decorator returning :class:`PdfImage` instances for plots.
@@ -62,7 +571,7 @@ def autoPdfImage(func):
         @autoPdfImage
         def my_plot(canvaswidth=5): #[inch]
             fig, ax = ap.plt.subplots(figsize=(canvaswidth,canvaswidth))
-            fig.suptitle("My Plot",fontproperties=fontprop)
+            fig.suptitle("My Plot", fontproperties=ap.fontProperties())
             x=[1,2,3,4,5,6,7,8]
             y=[1,6,8,3,9,3,4,2]
             ax.plot(x,y,label="legendlabel")
@@ -79,7 +588,7 @@ def autoPdfImage(func):
                    #fontsize=9,         # prop beats fontsize
                    markerscale=None,
                    frameon=False,
-                   prop=fontprop
+                   prop=ap.fontProperties()
                    #fancybox=True,
                    )
 
@@ -100,28 +609,39 @@ def autoPdfImage(func):
                     return f(*args, **kwds)
                 return wrapper
         """
+        key = store = None
+        if _figure_cache is not None:
+            key = _figure_cache.key(funcwrapper, args, kwargs, legend=True)
+        if key is not None:
+            data = _figure_cache.get(key)
+            if data is not None:
+                return PdfImage(BytesIO(data[0])), PdfImage(BytesIO(data[1]))
+            store = _figure_cache.storer(key)
+
+        if _figure_pool is not None:
+            result = _figure_pool.submit(funcwrapper, args, kwargs, legend=True)
+            return (FuturePdfImage(result, 0, store=store),
+                    FuturePdfImage(result, 1, store=store))
+
         imgax = BytesIO()
-        imgleg = BytesIO()
 
         fig, leg_fig, leg = func(*args, **kwargs)
 
         if not fig:
             return
 
-        leg_fig.savefig(
-            imgleg,
-            #additional_artists=(leg.get_window_extent(), ),
-            bbox_extra_artists=(leg.legendPatch, ),
-            bbox_inches='tight',
-            format='PDF',
-            transparent=True)
-        # rewind the data
-        imgleg.seek(0)
-
-        plt.clf()
-        plt.close('all')
-        fig.savefig(imgax, format='PDF')
-        return PdfImage(imgax), PdfImage(imgleg)
+        imgleg = _legend_to_pdf(leg_fig, leg)
+
+        # the legend is cropped by savefig, it is always saved to PDF
+        img = _figure_form(fig) if store is None else None
+        if img is None:
+            fig.savefig(imgax, format='PDF')
+            if store is not None:
+                store((imgax.getvalue(), imgleg.getvalue()))
+            img = PdfImage(imgax)
+
+        _closeFigures(fig, leg_fig)
+        return img, PdfImage(imgleg)
 
     return funcwrapper
 
@@ -130,12 +650,13 @@ def autoPdfImg(func):
     """Decorator returning a single :class:`PdfImage` for a plot.
 
     The wrapped function should return a matplotlib ``Figure``.  The figure is
-    saved to a PDF byte buffer and returned as a :class:`PdfImage`.  Example::
+    drawn into a :class:`FigureForm`, or saved to a PDF byte buffer and
+    returned as a :class:`PdfImage` if that is not possible.  Example::
 
         @autoPdfImg
         def my_plot(canvaswidth=5): #[inch]
             fig, ax = ap.plt.subplots(figsize=(canvaswidth,canvaswidth))
-            fig.suptitle("My Plot",fontproperties=fontprop)
+            fig.suptitle("My Plot", fontproperties=ap.fontProperties())
             x=[1,2,3,4,5,6,7,8]
             y=[1,6,8,3,9,3,4,2]
             ax.plot(x,y,label="legendlabel")
@@ -152,7 +673,7 @@ def autoPdfImg(func):
                    #fontsize=9,         # prop beats fontsize
                    markerscale=None,
                    frameon=False,
-                   prop=fontprop
+                   prop=ap.fontProperties()
                    #fancybox=True,
                    )
 
@@ -172,6 +693,19 @@ def autoPdfImg(func):
                     return f(*args, **kwds)
                 return wrapper
         """
+        key = store = None
+        if _figure_cache is not None:
+            key = _figure_cache.key(funcwrapper, args, kwargs)
+        if key is not None:
+            data = _figure_cache.get(key)
+            if data is not None:
+                return PdfImage(BytesIO(data))
+            store = _figure_cache.storer(key)
+
+        if _figure_pool is not None:
+            return FuturePdfImage(_figure_pool.submit(funcwrapper, args, kwargs),
+                                  store=store)
+
         imgax = BytesIO()
 
         fig = func(*args, **kwargs)
@@ -179,14 +713,20 @@ def autoPdfImg(func):
         if not fig:
             return
 
-        plt.clf()
+        # the cache stores PDF bytes, cached figures are not drawn as forms
+        img = _figure_form(fig) if store is None else None
+        if img is None:
+            fig.savefig(imgax, format='PDF')
+            if store is not None:
+                store(imgax.getvalue())
+            img = PdfImage(imgax)
 
-        if 'close' in kwargs:
-            if kwargs['close']:
-                plt.close('all')
-        fig.savefig(imgax, format='PDF')
+        _closeFigures(fig)
+
+        if kwargs.get('close') and "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close('all')
 
-        return PdfImage(imgax)
+        return img
 
     return funcwrapper
 
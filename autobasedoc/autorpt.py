@@ -62,12 +62,14 @@ from __future__ import print_function
 
 import os
 import sys
-import random
-import string
+import pickle
+import shutil
+import tempfile
+from io import BytesIO
 from hashlib import sha1
 from operator import attrgetter
-from itertools import count
-from collections import OrderedDict
+from itertools import count, islice
+from collections import OrderedDict, deque
 
 from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER, TA_RIGHT
 from reportlab.lib.pagesizes import A4, landscape
@@ -86,22 +88,64 @@ from reportlab.platypus.flowables import SlowPageBreak, DDIndenter, PageBreakIfN
 from reportlab.pdfgen import canvas
 from reportlab.lib.styles import ParagraphStyle
 
-# configure pdf producer
-from reportlab.pdfbase.pdfdoc import PDFInfo
-
 # module imports
-from autobasedoc import base_fonts, color_dict, colors
-import autobasedoc.autoplot as ap
+from autobasedoc import (base_fonts, color_dict, colors, DocumentContext,
+                         current_context, next_id)
+from autobasedoc.pdfimage import PdfImage
 from autobasedoc.styledtable import StyledTable
 from autobasedoc.styles import StyleSheet, Styles
-from autobasedoc.pageinfo import addPlugin, PageInfo
+from autobasedoc.pageinfo import addPlugin, PageInfo, frameKey
 from autobasedoc.fonts import registerFont, setFonts, setTtfFonts, getFont
 from autobasedoc.tableofcontents import AutoTableOfContents
+from autobasedoc.sectioncache import (SectionCache, LayoutRecorder, sectionStarts,
+                                      content_digest, _layoutApart)
+from autobasedoc.profiler import LayoutProfiler
+from autobasedoc.incremental import IncrementalOutput
 
-_baseFontNames = base_fonts()
-_color_dict = color_dict()
 _basePath = os.path.realpath(os.path.dirname(__file__))
 
+
+def _autoplot():
+    """
+    returns autobasedoc.autoplot if it is imported, else None
+
+    autoplot imports matplotlib, so it is only imported by the plotting code.
+    Before, there can not be any of its figures in a story.
+    """
+    return sys.modules.get("autobasedoc.autoplot")
+
+
+def _futureFigures():
+    """
+    the class of the figures rendered by a FigurePool, for isinstance
+    """
+    return getattr(_autoplot(), "FuturePdfImage", ())
+
+
+def _resolveFigures(flowables):
+    """
+    replaces the figures rendered by a FigurePool in flowables
+    """
+    ap = _autoplot()
+    if ap is not None:
+        ap.resolveFigures(flowables)
+
+
+def __getattr__(name):
+    """
+    imports autoplot on the first use of ``autorpt.ap``, and returns the
+    fonts and colors of the active DocumentContext for ``_baseFontNames``
+    and ``_color_dict``
+    """
+    if name == "ap":
+        import autobasedoc.autoplot as ap
+        return ap
+    if name == "_baseFontNames":
+        return base_fonts()
+    if name == "_color_dict":
+        return color_dict()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 sys.path.append(_basePath)
 
 # #TODO: cx Freeze, this needs adoption to your version of cx_freeze
@@ -135,7 +179,7 @@ def drawFirstPortrait(canv, doc):
     Notes
     -----
     - Automatically sets page size and font
-    - Activates addPlugin for "First" frame
+    - Activates addPlugin for the frame of the template
     - Canvas state is saved and restored
     
     Examples
@@ -154,7 +198,7 @@ def drawFirstPortrait(canv, doc):
     canv.setPageSize(pagesize)
     canv.setFont(base_fonts()["normal"], doc.fontSize)
 
-    addPlugin(canv, doc, frame="First")
+    addPlugin(canv, doc, frame=frame)
 
     canv.restoreState()
 
@@ -195,7 +239,7 @@ def drawFirstLandscape(canv, doc):
     canv.setPageSize(pagesize)
     canv.setFont(base_fonts().get("normal"), doc.fontSize)
 
-    addPlugin(canv, doc, frame="First")
+    addPlugin(canv, doc, frame=frame)
 
     canv.restoreState()
 
@@ -213,7 +257,7 @@ def drawLaterPortrait(canv, doc):
     canv.setPageSize(pagesize)
     canv.setFont(base_fonts().get("normal"), doc.fontSize)
 
-    addPlugin(canv, doc, frame="Later")
+    addPlugin(canv, doc, frame=frame)
 
     canv.restoreState()
 
@@ -229,7 +273,7 @@ def drawLaterLandscape(canv, doc):
     canv.setPageSize(pagesize)
     canv.setFont(base_fonts().get("normal"), doc.fontSize)
 
-    addPlugin(canv, doc, frame="Later")
+    addPlugin(canv, doc, frame=frame)
 
     canv.restoreState()
 
@@ -245,7 +289,7 @@ def drawLaterSpecialPortrait(canv, doc):
     canv.setPageSize(pagesize)
     canv.setFont(base_fonts().get("normal"), doc.fontSize)
 
-    addPlugin(canv, doc, frame="Later")
+    addPlugin(canv, doc, frame=frame)
 
     canv.restoreState()
 
@@ -261,12 +305,139 @@ def drawLaterSpecialLandscape(canv, doc):
     canv.setPageSize(pagesize)
     canv.setFont(base_fonts().get("normal"), doc.fontSize)
 
-    addPlugin(canv, doc, frame="Later")
+    addPlugin(canv, doc, frame=frame)
 
     canv.restoreState()
 
 onLaterSPages = drawLaterSpecialLandscape, 0
 
+class FlowableStream(object):
+    """
+    a story pulled lazily from an iterable of flowables
+
+    :meth:`AutoDocTemplate.build` wraps the story in a FlowableStream.
+    Flowables are taken from the iterable only when the layout reaches them,
+    flowables put back after a split or a frame end are kept in a deque,
+    so handling a flowable does not move the rest of the story::
+
+        def story():
+            for record in records:
+                yield ar.Paragraph(record, styles.normal)
+
+        doc.build(story())
+
+    It supports the list operations reportlab's document templates use on
+    the story. The length is the number of flowables pulled but not yet
+    handled, it is 0 only when the iterable is exhausted.
+    """
+
+    def __init__(self, flowables, onPull=None):
+        """
+        :param flowables: the story, a list is emptied as in reportlab's build
+        :type flowables: iterable
+        :param onPull: called with every flowable taken from the story
+        :type onPull: callable
+        """
+        if isinstance(flowables, list):
+            story = deque(flowables)
+            del flowables[:]
+            flowables = (story.popleft() for i in range(len(story)))
+        self._buffer = deque()
+        self._source = iter(flowables)
+        self.onPull = onPull
+
+    def _pull(self, n):
+        """
+        pulls flowables until n are buffered, returns False if there are less
+        """
+        buffer = self._buffer
+        futures = _futureFigures()
+        while len(buffer) < n:
+            try:
+                f = next(self._source)
+            except StopIteration:
+                return False
+            if isinstance(f, futures):
+                f = f.resolve()
+            if self.onPull is not None:
+                self.onPull(f)
+            buffer.append(f)
+        return True
+
+    def _stop(self, index):
+        """
+        returns the stop of the slice index, pulling the flowables up to it
+        """
+        if index.step not in (None, 1) or (index.start or 0) < 0:
+            raise IndexError("only forward slices of a FlowableStream are supported")
+        if index.stop is None or index.stop < 0:
+            self._pull(float("inf"))
+            return len(self._buffer) if index.stop is None else len(self._buffer) + index.stop
+        self._pull(index.stop)
+        return min(index.stop, len(self._buffer))
+
+    def lookahead(self):
+        """
+        pulls the flowables kept with the next one, and the next one
+        """
+        i = 0
+        while self._pull(i + 1) and self._buffer[i].getKeepWithNext():
+            i += 1
+
+    def __len__(self):
+        self._pull(1)
+        return len(self._buffer)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(islice(self._buffer, index.start or 0, self._stop(index)))
+        if index < 0 or not self._pull(index + 1):
+            raise IndexError("FlowableStream index out of range")
+        return self._buffer[index]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            if (index.start or 0) != 0 or self._stop(index) != 0:
+                raise IndexError("flowables can only be put back at the front")
+            self._buffer.extendleft(reversed(list(value)))
+        else:
+            self[index]
+            self._buffer[index] = value
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            if (index.start or 0) != 0:
+                raise IndexError("flowables can only be removed from the front")
+            for i in range(self._stop(index)):
+                self._buffer.popleft()
+        else:
+            self[index]
+            del self._buffer[index]
+
+    def insert(self, index, f):
+        """
+        inserts f before index
+        """
+        self._pull(index)
+        self._buffer.insert(index, f)
+
+
+def _prefixIndex(items):
+    """
+    returns two dicts with the first and the last of items for every
+    prefix of their ids
+    """
+    first, last = {}, {}
+    for item in items:
+        if not isinstance(item.id, str):
+            continue
+        for end in range(len(item.id) + 1):
+            prefix = item.id[:end]
+            first.setdefault(prefix, item)
+            last[prefix] = item
+    return first, last
+
+
 class AutoDocTemplate(BaseDocTemplate):
     """
     Extended document template for automatic PDF generation.
@@ -300,6 +471,16 @@ class AutoDocTemplate(BaseDocTemplate):
         PDF metadata
     keywords : list, optional
         PDF keywords
+    invariant : bool, optional
+        Write the same bytes in every run, with a fixed document ID and
+        creation date, default: reportlab's ``rl_config.invariant``
+    context : DocumentContext, optional
+        Fonts, colors and counters of the document, active during its
+        builds, default: the active context when the document is created
+    incremental : bool, optional
+        Write every page to the file as soon as it is finished, instead of
+        keeping all pages in memory until the document is saved,
+        default: False
         
     Attributes
     ----------
@@ -334,12 +515,38 @@ class AutoDocTemplate(BaseDocTemplate):
             pagesize=landscape(A4)
         )
         
+    Rebuilds reusing the pages of unchanged chapters::
+
+        doc.sectionCache = SectionCache(".report-cache")
+        doc.multiBuild(story)
+
+    Timings of the layout, per flowable type and page::
+
+        doc.profiler = LayoutProfiler()
+        doc.multiBuild(story)
+        print(doc.profiler.report())
+
+    Pages written while they are laid out, for documents of many pages::
+
+        doc = AutoDocTemplate("report.pdf", incremental=True, ...)
+
     See Also
     --------
     drawFirstPortrait, drawLaterPortrait : Predefined page templates
     addPageInfo : Adding header/footer elements
+    autobasedoc.sectioncache : Reusing the pages of unchanged sections
+    autobasedoc.profiler : Timings of the layout
+    autobasedoc.incremental : Writing the pages while they are laid out
     """
 
+    sectionCache = None
+    profiler = None
+    _output = None
+    _recorder = None
+    _story = None
+    _startState = None
+    _frameNumber = 0
+
     def __init__(self,
                  filename,
                  onFirstPage=(_doNothing, 0),
@@ -357,11 +564,12 @@ class AutoDocTemplate(BaseDocTemplate):
                  creator=None,
                  keywords=[],
                  pagesize=A4,
-                 debug=False):
-
-        if producer is not None:
-            PDFInfo.producer = producer
+                 debug=False,
+                 invariant=None,
+                 context=None,
+                 incremental=False):
 
+        # the producer is set on the canvas of this document only
         super(AutoDocTemplate, self).__init__(filename,
             pagesize=pagesize,
             leftMargin=leftMargin,
@@ -373,7 +581,11 @@ class AutoDocTemplate(BaseDocTemplate):
             subject=subject,
             producer=producer,
             creator=creator,
-            keywords=keywords)
+            keywords=keywords,
+            invariant=invariant)
+
+        self.context = current_context() if context is None else context
+        self.incremental = incremental
 
         self.debug = debug
         if self.debug:
@@ -413,6 +625,18 @@ class AutoDocTemplate(BaseDocTemplate):
 
     @property
     def template_id(self):
+        """
+        the id of the page template, for its onPage callback
+
+        While a page of one of the templates of :meth:`templates_maker`
+        is drawn, this is the id of its template, which is named after the
+        callback. Otherwise it is the name of the calling function without
+        'draw', which has to be looked up on the call stack.
+        """
+        pageTemplate = getattr(self, 'pageTemplate', None)
+        if (self._story is not None and pageTemplate is not None and
+                self.templates.get(pageTemplate.id) is pageTemplate):
+            return pageTemplate.id
         return sys._getframe(1).f_code.co_name.strip("draw")
 
     def templates_maker(self):
@@ -541,18 +765,17 @@ class AutoDocTemplate(BaseDocTemplate):
                 (x1,y1) <-- lower left corner
 
         """
-        def makeRandomId(length=3, chars=string.ascii_lowercase):
-            """
-            create a file id of lower case ascii characters with length
-            """
-            return ''.join(random.choice(chars) for _ in range(length))
+        # number the frames of the document, so that frame ids are unique
+        # and the same in every run
+        frameNumber = self._frameNumber
+        self._frameNumber += 1
 
         return Frame(x1, y1, width, height,
                      leftPadding=left_padding,
                      bottomPadding=bottom_padding,
                      rightPadding=right_padding,
                      topPadding=top_padding,
-                     id=f"{frame_id}_{makeRandomId()}",
+                     id=f"{frame_id}_{frameNumber}",
                      showBoundary=self.showBoundary,
                      overlapAttachedSpace=overlap,
                      _debug=None)
@@ -573,7 +796,6 @@ class AutoDocTemplate(BaseDocTemplate):
         (x,y)
         """
 
-        f = attrgetter("id")
         frame = None
 
         if temp_name is not None:
@@ -596,41 +818,47 @@ class AutoDocTemplate(BaseDocTemplate):
         if orientation is None:
             orientation = temp_name
 
-        for frame in pageTemplate.frames:
-            #print(f(frame))
-            if f(frame).startswith(orientation):
-                return frame, pageTemplate.pagesize
+        frames = self._frameIndex(pageTemplate)
+        frame = frames.get(orientation)
+        if frame is not None:
+            return frame, pageTemplate.pagesize
 
-        if frame is None:
+        if not pageTemplate.frames:
             print("Error occured accessing self.pageTemplates", temp_name)
             raise Exception
-            #            #print ( thisTemplate.frames[0].id )
-            #            return thisTemplate.frames[0],thisTemplate.pagesize
-            #
-            #        else:
 
+    def _frameIndex(self, pageTemplate):
+        """
+        returns the prefix index of the frames of pageTemplate
+        """
+        index = self.__dict__.setdefault('_frameIndexes', {})
+        key = id(pageTemplate)
+        entry = index.get(key)
+        if entry is None or entry[0] is not pageTemplate or entry[1] != len(pageTemplate.frames):
+            entry = index[key] = (pageTemplate, len(pageTemplate.frames),
+                                  _prefixIndex(pageTemplate.frames)[0])
+        return entry[2]
+
+    def _templateIndex(self):
+        """
+        returns the prefix indexes of the page templates, the first and the
+        last template for every prefix of their ids
+        """
+        key = id(self.pageTemplates), len(self.pageTemplates)
+        if self.__dict__.get('_templateIndexKey') != key:
+            self._templateIndexes = _prefixIndex(self.pageTemplates)
+            self._templateIndexKey = key
+        return self._templateIndexes
 
     def getTemplate(self, temp_id=None, last=False, as_name=False):
         """
         Return first page template with an id that starts with frame_name
         """
-        f = attrgetter("id")
-        template = None
-
-        if not last:
-            for temp in self.pageTemplates:
-                if f(temp).startswith(temp_id):
-                    template = temp
-                    break
-
-        else:
-            for temp in self.pageTemplates[::-1]:
-                if f(temp).startswith(temp_id):
-                    template = temp
-                    break
+        first, final = self._templateIndex()
+        template = (final if last else first).get(temp_id)
 
         if as_name and template:
-            template = f(template)
+            template = template.id
 
         if template is None:
             print(f"Error from {self.template_id}: temp_id:{temp_id}, last:{last}, as_name:{as_name}")
@@ -764,6 +992,8 @@ class AutoDocTemplate(BaseDocTemplate):
             typ += "____"
         pI.typ = typ
         self.pageInfos.update({pI.frame + pI.typ + pI.pos: pI})
+        # the draw plans of addPlugin are compiled again
+        self.__dict__.pop('_pageInfoPlans', None)
 
     def addPageInfo(self,
                     typ="header",
@@ -868,6 +1098,8 @@ class AutoDocTemplate(BaseDocTemplate):
         #the object(s) about to be processed
         self.filterFlowables(flowables)
         self.handle_breakBefore(flowables)
+        if isinstance(flowables, FlowableStream):
+            flowables.lookahead()
         self.handle_keepWithNext(flowables)
         f = flowables[0]
         del flowables[0]
@@ -899,7 +1131,7 @@ class AutoDocTemplate(BaseDocTemplate):
                 #f.setStyle([("GRID", (0, 0), (-1, -1), 0.5, colors.black)])
             elif isinstance(f, Spacer):
                 pass
-            if isinstance(f, ap.PdfImage):
+            if isinstance(f, PdfImage):
                 #print("height of image:",f.drawHeight)
                 #print("height of frame:",frame._aH)
                 xfactor = getattr(f, "_userScaleFactor", None)
@@ -1044,6 +1276,376 @@ class AutoDocTemplate(BaseDocTemplate):
             self.canv.showOutline()
 
 
+    def build(self, flowables, **buildKwds):
+        """
+        resolves figures rendered by an autoplot.FigurePool,
+        then builds the document from flowables
+
+        flowables can be any iterable, e.g. a generator. It is consumed as a
+        :class:`FlowableStream`, so that only the flowables of the page being
+        laid out are kept in memory. Progress callbacks only see the flowables
+        pulled so far.
+        """
+        if isinstance(flowables, list):
+            _resolveFigures(flowables)
+        if self.sectionCache is not None:
+            self._recorder = self.sectionCache.recorder(Bookmark, getattr(self, '_digests', None),
+                                                        self.decorationDigest())
+        onPull = self._recorder.pulled if self._recorder is not None else None
+        self._story = FlowableStream(flowables, onPull)
+        if self.incremental and 'canvasmaker' not in buildKwds:
+            output = self._output
+            if output is None or output.finished or output.filename is not self.filename:
+                output = self._output = IncrementalOutput(self.filename)
+            buildKwds['canvasmaker'] = output.canvasmaker
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start(self)
+        try:
+            if self.context is not None:
+                with self.context:
+                    super(AutoDocTemplate, self).build(self._story, **buildKwds)
+            else:
+                super(AutoDocTemplate, self).build(self._story, **buildKwds)
+        except BaseException:
+            if self._output is not None:
+                self._output.close()
+                self._output = None
+            raise
+        finally:
+            self._story = None
+            if profiler is not None:
+                profiler.stop(self)
+        if self.sectionCache is not None and getattr(self, '_doSave', 1):
+            self._storeSections()
+
+    def _storeSections(self):
+        """
+        stores the sections of the saved document in the section cache
+        """
+        if isinstance(self.filename, str):
+            with open(self.filename, "rb") as f:
+                pdf = f.read()
+        elif hasattr(self.filename, "getvalue"):
+            pdf = self.filename.getvalue()
+        else:
+            return
+        self.sectionCache.store(self._recorder, pdf)
+        self._recorder = None
+
+    def _startBuild(self, filename=None, canvasmaker=canvas.Canvas):
+        super(AutoDocTemplate, self)._startBuild(filename, canvasmaker)
+        if self._startState is not None:
+            self._restoreLayoutState(self._startState)
+        if self._recorder is not None:
+            self._recorder.recordCanvas(self, self.canv)
+
+    def _endBuild(self):
+        if self._recorder is not None:
+            # a story ending with a page break ends in a state to continue from
+            ended = bool(self._hanging) and self._hanging[-1] is PageBegin
+            self._recorder.close(self, end=self._layoutState() if ended else None)
+        super(AutoDocTemplate, self)._endBuild()
+
+    def clean_hanging(self):
+        """
+        a page is about to begin, which may be a checkpoint of the section cache
+        """
+        if (self._recorder is not None and self._story is not None and
+                len(self._hanging) == 1 and self._hanging[0] is PageBegin):
+            self._recorder.checkpoint(self, self._story)
+        super(AutoDocTemplate, self).clean_hanging()
+
+    def notify(self, kind, stuff):
+        if self._recorder is not None:
+            self._recorder.record(self, "notify", kind, stuff)
+        super(AutoDocTemplate, self).notify(kind, stuff)
+
+    def decorationDigest(self):
+        """
+        returns the content digest of what the pages are decorated with
+        besides the flowables, or None if it can not be hashed
+
+        These are the page infos, the page templates with their frames and
+        onPage callbacks, the page size, margins and line settings, the
+        metadata and the fonts and colors of the document context. The
+        section cache only reuses pages laid out with the same digest.
+        Callbacks are compared by name, what they draw besides the page
+        infos is not part of the digest.
+        """
+        templates = [(t.id, t.onPage, t.onPageEnd, t.pagesize,
+                      t.autoNextPageTemplate,
+                      [frameKey(frame) for frame in t.frames])
+                     for t in self.pageTemplates]
+        return content_digest((list(self.pageInfos.values()), templates, self.pagesize,
+                               self.leftMargin, self.rightMargin, self.topMargin,
+                               self.bottomMargin, self.fontSize, self.lineWidth,
+                               self.topM, self.bottomM, self.title, self.author,
+                               self.subject, base_fonts(), color_dict()))
+
+    def _layoutState(self):
+        """
+        returns what the layout of the next page depends on besides the
+        flowables, or None if it can not be restored
+        """
+        if (hasattr(self, '_nextPageTemplateCycle') or self._frameBGs or
+                self._pageTopFlowables):
+            return None
+        return (self.page, self.pageTemplate.id,
+                getattr(self, '_nextPageTemplateIndex', None),
+                self._leftExtraIndent, self._rightExtraIndent)
+
+    def _restoreLayoutState(self, state):
+        """
+        continues after the pages of a cached section, which ended in state
+        """
+        self.page, templateId, nextIndex, self._leftExtraIndent, self._rightExtraIndent = state
+        for template in self.pageTemplates:
+            if template.id == templateId:
+                self.pageTemplate = template
+        if nextIndex is None:
+            if hasattr(self, '_nextPageTemplateIndex'):
+                del self._nextPageTemplateIndex
+        else:
+            self._nextPageTemplateIndex = nextIndex
+        self._emptyPages = 0
+
+    def multiBuild(self, story, maxPasses=10, predictToc=True, **buildKwds):
+        """
+        resolves figures rendered by an autoplot.FigurePool once for all passes,
+        then builds the document until all indexing flowables are satisfied
+
+        With predictToc, a story whose only indexing flowables are
+        AutoTableOfContents is laid out once: their entries are predicted
+        from the Bookmarks of the story, so the tables of contents get their
+        final size, and their page numbers are drawn after the build. Only if
+        the entries differ from the prediction, the passes of reportlab's
+        multiBuild follow.
+        """
+        _resolveFigures(story)
+        # the flowables are hashed before their first layout
+        shared = hasattr(self, '_digests')
+        if not shared:
+            self._digests = {}
+        try:
+            tocs = self._predictTocs(story) if predictToc else None
+            if tocs is None:
+                passes = super(AutoDocTemplate, self).multiBuild(story, maxPasses=maxPasses, **buildKwds)
+            elif self._singlePassBuild(story, tocs, **buildKwds):
+                passes = 1
+            else:
+                passes = 1 + super(AutoDocTemplate, self).multiBuild(story, maxPasses=maxPasses - 1, **buildKwds)
+        finally:
+            if not shared:
+                del self._digests
+        if self.sectionCache is not None and self._recorder is not None:
+            self._storeSections()
+        return passes
+
+    def parallelBuild(self, story, processes=None, maxPasses=10, **buildKwds):
+        """
+        builds the document like :meth:`multiBuild`, laying out its chapters
+        in parallel
+
+        The story is split where a top level heading follows a PageBreak.
+        The chapters are laid out on their own in a pool of processes, each
+        starting with the page number and page template it has in the
+        document, and put into the :attr:`sectionCache`, a temporary one
+        if there is none. The document is then built with the pages of the
+        chapters taken from the cache, see :mod:`autobasedoc.sectioncache`,
+        which replays their outline entries, link destinations and table of
+        contents entries. The first part of the story, e.g. the title page and
+        the table of contents, and the last chapter are laid out in the build.
+
+        The page a chapter starts on is known only after the chapters before
+        it are laid out. It is first estimated, from the page counts of the
+        last build if there is a section cache, and chapters that started on
+        another page are laid out again once their page is known. Chapters
+        of the cache laid out with other page infos or page templates are
+        neither used nor counted, see :meth:`decorationDigest`.
+
+        The document template and the flowables of the chapters must be
+        picklable, chapters that are not are laid out in the build.
+
+        :param processes: the number of worker processes, defaults to the
+                          number of CPUs, 1 lays out the chapters in this process
+        :returns: the number of passes of the build
+        """
+        _resolveFigures(story)
+        starts = sectionStarts(story, Bookmark)
+        if len(starts) < 2:
+            return self.multiBuild(story, maxPasses=maxPasses, **buildKwds)
+
+        temporary = self.sectionCache is None
+        if temporary:
+            self.sectionCache = SectionCache(tempfile.mkdtemp(prefix="autobasedoc"))
+        self._digests = {}
+        try:
+            self._layoutChapters(story, starts, processes)
+            return self.multiBuild(story, maxPasses=maxPasses, **buildKwds)
+        finally:
+            del self._digests
+            if temporary:
+                shutil.rmtree(self.sectionCache.directory, ignore_errors=True)
+                self.sectionCache = None
+
+    def _layoutChapters(self, story, starts, processes):
+        """
+        lays out the chapters of story beginning at starts, but the last one,
+        into the section cache
+        """
+        cache = self.sectionCache
+        decoration = self.decorationDigest()
+        if decoration is None:
+            return
+        bounds = list(zip(starts[:-1], starts[1:]))
+        recorder = LayoutRecorder(None, Bookmark, self._digests)
+        for f in story[:starts[-1]]:
+            recorder.pulled(f)
+        digests = [recorder._digest(first, stop) for first, stop in bounds]
+
+        try:
+            docData = pickle.dumps(self)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        chapters = []
+        for (first, stop), digest in zip(bounds, digests):
+            try:
+                chapters.append(pickle.dumps(story[first:stop]) if digest else None)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                chapters.append(None)
+
+        # the title pages with the tables of contents at their predicted size
+        self._predictTocs(story)
+        units = self._layoutSection(story[:starts[0]], None, save=False,
+                                    decoration=decoration)[0]
+        if not units or units[-1].end is None:
+            return
+
+        # (chapter, start state) -> end state of the chapters laid out
+        ends = {}
+        # chapter -> pages and end state, laid out from any state
+        measured = {}
+        for unit in cache._load().values():
+            if unit.decoration == decoration:
+                measured.setdefault(unit.digest, (unit.pages, unit.end))
+        # multiprocessing is only imported for parallel builds
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(processes) if processes != 1 else None
+        try:
+            for _ in bounds:
+                jobs = []
+                state = units[-1].end
+                for i, digest in enumerate(digests):
+                    if state is None:
+                        break
+                    cached = cache._unitFrom(state, decoration)
+                    if (i, repr(state)) in ends:
+                        state = ends[i, repr(state)]
+                        continue
+                    if cached is not None and cached.digest == digest and cached.end is not None:
+                        state = cached.end
+                        continue
+                    if chapters[i] is not None:
+                        jobs.append((i, state))
+                    pages, end = measured.get(digest, (1, state))
+                    state = (state[0] + pages,) + (end or state)[1:]
+                if not jobs:
+                    break
+                args = [(docData, chapters[i], start, decoration) for i, start in jobs]
+                if executor is None:
+                    results = [_layoutApart(*a) for a in args]
+                else:
+                    results = executor.map(_layoutApart, *zip(*args))
+                for (i, start), (chapterUnits, pdf, base) in zip(jobs, results):
+                    cache.add(chapterUnits, pdf, base)
+                    if chapterUnits:
+                        ends[i, repr(start)] = chapterUnits[-1].end
+                        measured[digests[i]] = (sum(unit.pages for unit in chapterUnits),
+                                                chapterUnits[-1].end)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def __getstate__(self):
+        """
+        the document template without the state of a build,
+        as it is sent to the processes of :meth:`parallelBuild`
+        """
+        state = dict(self.__dict__)
+        for name in ('canv', 'frame', '_story', '_recorder', '_digests', 'profiler', '_output',
+                     '_indexingFlowables', '_multiBuildEdits', '_pageInfoPlans',
+                     '_frameIndexes', '_templateIndexes', '_templateIndexKey'):
+            state.pop(name, None)
+        if not isinstance(self.filename, str):
+            state['filename'] = None
+        return state
+
+    def _layoutSection(self, flowables, start, save=True, decoration=None):
+        """
+        lays out flowables on their own, beginning with a page in the layout
+        state start, and returns the units recorded with the decoration
+        digest decoration, the PDF bytes, if saved, and the number of the
+        first page
+        """
+        filename, cache = self.filename, self.sectionCache
+        self.filename = BytesIO()
+        self.sectionCache = None
+        self._startState = start
+        self._recorder = recorder = LayoutRecorder(None, Bookmark, getattr(self, '_digests', None),
+                                                   decoration)
+        self._doSave = int(save)
+        self._indexingFlowables = [f for f in flowables if f.isIndexing()]
+        try:
+            self.build(flowables)
+            pdf = self.filename.getvalue() if save else None
+        finally:
+            self.filename, self.sectionCache = filename, cache
+            self._startState = self._recorder = None
+            del self._doSave
+        return recorder.units, pdf, recorder.firstPage
+
+    def _predictTocs(self, story):
+        """
+        returns the tables of contents of story with entries predicted from
+        its Bookmarks, or None if story has other indexing flowables or no
+        Bookmarks, then the tables are laid out with a placeholder entry
+        """
+        tocs = [f for f in story if f.isIndexing()]
+        if not tocs or not all(isinstance(f, AutoTableOfContents) for f in tocs):
+            return None
+        entries = [(f.level, f.title, f.key) for f in story if isinstance(f, Bookmark)]
+        if not entries:
+            return None
+        for toc in tocs:
+            toc.deferPages(entries)
+        return tocs
+
+    def _singlePassBuild(self, story, tocs, **buildKwds):
+        """
+        builds the document with the predicted tables of contents tocs,
+        saves it and returns True if the prediction was right
+        """
+        self._indexingFlowables = tocs
+        self._doSave = 0
+        mbe = []
+        self._multiBuildEdits = mbe.append
+        try:
+            self.build(story[:], **buildKwds)
+        finally:
+            del self._multiBuildEdits
+
+        if not all(toc.predicted() for toc in tocs):
+            # undo the edits of the pass, as multiBuild does between passes
+            for e in mbe:
+                e[0](*e[1:])
+            return False
+        for toc in tocs:
+            toc.drawDeferredPages(self.canv)
+        self.canv.save()
+        return True
+
     # def build(self, flowables):
     #     """
     #     build the document using the flowables.  Annotate the first page using the onFirstPage
@@ -1116,10 +1718,11 @@ def doTableOfContents():
 
 class Header(NullActionFlowable):
     _ids = count(0)
+    _digestExclude = ("_id",)
 
     def __init__(self):
         super(Header, self).__init__()
-        self._id = self._ids.__next__()
+        self._id = next_id(Header)
 
     @classmethod
     def cln(cls):
@@ -1132,10 +1735,11 @@ class Header(NullActionFlowable):
 
 class Footer(NullActionFlowable):
     _ids = count(0)
+    _digestExclude = ("_id",)
 
     def __init__(self):
         super(Footer, self).__init__()
-        self._id = self._ids.__next__()
+        self._id = next_id(Footer)
 
     @classmethod
     def cln(cls):
@@ -1155,12 +1759,13 @@ class Bookmark(NullActionFlowable):
 
     """
     _ids = count(0)
+    _digestExclude = ("_id", "key")
 
     def __init__(self, title, level=0):
         super(Bookmark, self).__init__()
         self.title = title
         self._level = level
-        self._id = self._ids.__next__()
+        self._id = next_id(Bookmark)
         self.key = self.createBookmarkKey()
 
     @classmethod
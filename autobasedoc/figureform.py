@@ -0,0 +1,383 @@
+"""
+figureform
+==========
+
+.. module:: figureform
+   :platform: Unix, Windows
+   :synopsis: matplotlib figures drawn as reportlab forms without a PDF round-trip
+
+.. moduleauthor:: Johannes Eckstein
+
+:class:`FigureForm` renders a matplotlib figure with :class:`RendererForm`,
+a matplotlib renderer that writes PDF drawing operators directly.
+They are replayed into a Form XObject the first time the figure is drawn
+on a canvas, so the figure is neither saved to PDF bytes nor parsed again
+by pdfrw::
+
+    fig, ax = plt.subplots()
+    ax.plot(x, y)
+
+    story.append(FigureForm(fig))
+
+Text is drawn as paths, it can not be searched or selected in the PDF.
+Figures using features the renderer does not support (hatches, gouraud
+shading) raise NotImplementedError, the caller should fall back to
+:class:`~autobasedoc.pdfimage.PdfImage` then.
+"""
+from io import BytesIO
+
+from PIL import Image as PILImage
+
+from reportlab.platypus import Flowable
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.lib.utils import ImageReader
+from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
+from reportlab.pdfbase.pdfdoc import PDFResourceDictionary, PDFStream, PDFZCompress
+
+from matplotlib.backend_bases import RendererBase
+from matplotlib.path import Path
+
+from autobasedoc.pdfimage import PdfImage, load_page_xobj
+
+try:
+    from matplotlib._path import convert_to_string
+except ImportError:
+    convert_to_string = None
+
+_path_codes = [b'm', b'l', b'', b'c', b'h']
+
+_capstyles = {'butt': 0, 'round': 1, 'projecting': 2}
+_joinstyles = {'miter': 0, 'round': 1, 'bevel': 2}
+
+
+def _fmt(value):
+    """
+    formats a number for the content stream
+    """
+    return ("%.4f" % value).rstrip("0").rstrip(".") or "0"
+
+
+def path_operators(path, transform, clip=None, simplify=False, sketch=None):
+    """
+    returns the PDF path construction operators of path as a str
+    """
+    if convert_to_string is not None:
+        # matplotlib's private function, as used by its PDF backend
+        try:
+            return convert_to_string(path, transform, clip, simplify, sketch,
+                                     6, _path_codes, True).decode("ascii")
+        except TypeError:
+            # its signature changed, the segments are converted here
+            pass
+
+    ops = []
+    for vertices, code in path.iter_segments(transform, clip=clip,
+                                             simplify=simplify, curves=True,
+                                             sketch=sketch):
+        if code == Path.MOVETO:
+            ops.append("%s %s m" % tuple(map(_fmt, vertices)))
+        elif code == Path.LINETO:
+            ops.append("%s %s l" % tuple(map(_fmt, vertices)))
+        elif code == Path.CURVE3:
+            # there are no quadratic curves in PDF
+            x0, y0 = last
+            cx, cy, x, y = vertices
+            ops.append("%s %s %s %s %s %s c" % tuple(map(_fmt, (
+                x0 + 2. / 3 * (cx - x0), y0 + 2. / 3 * (cy - y0),
+                x + 2. / 3 * (cx - x), y + 2. / 3 * (cy - y), x, y))))
+        elif code == Path.CURVE4:
+            ops.append("%s %s %s %s %s %s c" % tuple(map(_fmt, vertices)))
+        elif code == Path.CLOSEPOLY:
+            ops.append("h")
+        if len(vertices):
+            last = vertices[-2:]
+    return "\n".join(ops) + "\n"
+
+
+class RendererForm(RendererBase):
+    """
+    matplotlib renderer collecting PDF drawing operators
+
+    Units are PDF points, the figure has to be drawn at 72 dpi.
+    After drawing, ``ops`` holds tuples of::
+
+        ("path", operators, stroke_alpha, fill_alpha)
+        ("image", image_reader, (x, y, w, h), affine or None, alpha)
+
+    which :meth:`replay` draws onto a reportlab canvas.
+    """
+
+    def __init__(self, width, height):
+        super(RendererForm, self).__init__()
+        self.width = width
+        self.height = height
+        self.ops = []
+
+    def flipy(self):
+        return False
+
+    def option_scale_image(self):
+        return True
+
+    def get_canvas_width_height(self):
+        return self.width, self.height
+
+    def points_to_pixels(self, points):
+        return points
+
+    def _state(self, gc, rgbFace):
+        """
+        returns (operators, stroke, fill, stroke_alpha, fill_alpha) for gc
+        """
+        if gc.get_hatch() is not None:
+            raise NotImplementedError("hatches are not supported by RendererForm")
+
+        ops = []
+        cliprect = gc.get_clip_rectangle()
+        if cliprect is not None:
+            x, y, w, h = cliprect.bounds
+            ops.append("%s %s %s %s re W n" % tuple(map(_fmt, (x, y, w, h))))
+        clippath, affine = gc.get_clip_path()
+        if clippath is not None:
+            ops.append(path_operators(clippath, affine) + "W n")
+
+        rgb = gc.get_rgb() or (0., 0., 0., 0.)
+        linewidth = gc.get_linewidth()
+        stroke_alpha = gc.get_alpha() if gc.get_forced_alpha() else rgb[3]
+        stroke = linewidth > 0 and stroke_alpha > 0
+        if stroke:
+            ops.append("%s %s %s RG" % tuple(map(_fmt, rgb[:3])))
+            ops.append("%s w %d J %d j" % (_fmt(linewidth),
+                                           _capstyles[gc.get_capstyle()],
+                                           _joinstyles[gc.get_joinstyle()]))
+            offset, dashes = gc.get_dashes()
+            if dashes is not None and len(dashes):
+                ops.append("[%s] %s d" % (" ".join(map(_fmt, dashes)), _fmt(offset)))
+
+        fill_alpha = 1.0
+        fill = rgbFace is not None
+        if fill:
+            if gc.get_forced_alpha():
+                fill_alpha = gc.get_alpha()
+            elif len(rgbFace) > 3:
+                fill_alpha = rgbFace[3]
+            fill = fill_alpha > 0
+        if fill:
+            ops.append("%s %s %s rg" % tuple(map(_fmt, rgbFace[:3])))
+
+        return ops, stroke, fill, stroke_alpha, fill_alpha
+
+    @staticmethod
+    def _paint(stroke, fill):
+        if stroke and fill:
+            return "B"
+        if fill:
+            return "f"
+        if stroke:
+            return "S"
+        return "n"
+
+    def draw_path(self, gc, path, transform, rgbFace=None):
+        ops, stroke, fill, stroke_alpha, fill_alpha = self._state(gc, rgbFace)
+        if not (stroke or fill):
+            return
+        if fill:
+            clip, simplify = None, False
+        else:
+            clip, simplify = (0., 0., self.width, self.height), path.should_simplify
+        ops.append(path_operators(path, transform, clip, simplify,
+                                  gc.get_sketch_params()))
+        ops.append(self._paint(stroke, fill))
+        self.ops.append(("path", "\n".join(ops), stroke_alpha, fill_alpha))
+
+    def draw_markers(self, gc, marker_path, marker_trans, path, trans, rgbFace=None):
+        ops, stroke, fill, stroke_alpha, fill_alpha = self._state(gc, rgbFace)
+        if not (stroke or fill):
+            return
+        marker = path_operators(marker_path, marker_trans).replace("\n", " ")
+        marker += self._paint(stroke, fill)
+
+        vertices = trans.transform(path.vertices)
+        if path.codes is not None:
+            vertices = vertices[path.codes != Path.CLOSEPOLY]
+        # skip markers outside of the figure, as the pdf backend does
+        pad = 2 * gc.get_linewidth() + 20
+        x, y = vertices[:, 0], vertices[:, 1]
+        inside = ((x > -pad) & (x < self.width + pad) &
+                  (y > -pad) & (y < self.height + pad))
+        template = "q 1 0 0 1 %.3f %.3f cm " + marker + " Q\n"
+        ops.append("".join([template % (px, py)
+                            for px, py in vertices[inside].tolist()]))
+        self.ops.append(("path", "\n".join(ops), stroke_alpha, fill_alpha))
+
+    def draw_image(self, gc, x, y, im, transform=None):
+        h, w = im.shape[:2]
+        if w == 0 or h == 0:
+            return
+        # matplotlib hands over the rows bottom up
+        image = ImageReader(PILImage.fromarray(im[::-1], "RGBA"))
+        alpha = gc.get_alpha() if transform is not None else 1.0
+        affine = None if transform is None else transform.frozen().to_values()
+        self.ops.append(("image", image, (x, y, w, h), affine, alpha))
+
+    def draw_gouraud_triangles(self, gc, triangles_array, colors_array, transform):
+        raise NotImplementedError("gouraud shading is not supported by RendererForm")
+
+    def replay(self, canv):
+        """
+        draws the collected operators onto canv
+        """
+        for op in self.ops:
+            canv.saveState()
+            if op[0] == "path":
+                kind, operators, stroke_alpha, fill_alpha = op
+                if stroke_alpha < 1:
+                    canv.setStrokeAlpha(stroke_alpha)
+                if fill_alpha < 1:
+                    canv.setFillAlpha(fill_alpha)
+                canv.addLiteral(operators)
+            else:
+                kind, image, (x, y, w, h), affine, alpha = op
+                if alpha < 1:
+                    canv.setFillAlpha(alpha)
+                if affine is None:
+                    canv.drawImage(image, x, y, w, h, mask='auto')
+                else:
+                    canv.transform(1, 0, 0, 1, x, y)
+                    canv.transform(*affine)
+                    canv.drawImage(image, 0, 0, 1, 1, mask='auto')
+            canv.restoreState()
+
+
+def render_figure(fig):
+    """
+    draws fig with a :class:`RendererForm` and returns the renderer
+    """
+    dpi = fig.dpi
+    width, height = fig.get_figwidth() * 72., fig.get_figheight() * 72.
+    renderer = RendererForm(width, height)
+    # there are 72 points to an inch
+    fig.dpi = 72
+    try:
+        fig.draw(renderer)
+    finally:
+        fig.dpi = dpi
+    return renderer
+
+
+def _endForm(canv, name):
+    """
+    ends the form name on canv
+
+    reportlab encodes form streams with a codec working character by
+    character and, with ``rl_config.useA85``, in ASCII85. Both are slow for
+    large figures, the operators are plain ASCII and only deflated here.
+    """
+    code = "\n".join([canv._preamble] + canv._code).encode("latin-1")
+    del canv._code[:]
+    filters = [PDFZCompress] if canv._pageCompression else None
+    canv.endForm(Contents=PDFStream(content=code, filters=filters), compression=0)
+    _formExtGState(canv._doc, name)
+
+
+def _formExtGState(rldoc, name):
+    """
+    adds the alpha states used by the form name to its resources
+
+    reportlab only writes ExtGState resources for pages, forms drawing
+    with alpha would refer to undefined states otherwise
+    """
+    form = rldoc.idToObject[rldoc.getXObjectName(name)]
+    if form.ExtGState and not form.Resources:
+        resources = PDFResourceDictionary()
+        resources.basicFonts()
+        resources.allProcs()
+        if form.XObjects:
+            resources.XObject = form.XObjects
+        resources.ExtGState = form.ExtGState
+        form.Resources = resources
+
+
+class FigureForm(PdfImage):
+    """
+    a matplotlib figure as a Flowable, drawn as a Form XObject
+    without saving the figure to PDF and parsing it again
+
+    it behaves like a :class:`~autobasedoc.pdfimage.PdfImage` of the same
+    figure, its ``page`` and ``xobj`` are read from the figure saved to PDF
+    when they are first asked for
+    """
+    _page = _xobj = None
+    # the pdfrw objects read on demand are not part of the content
+    _digestExclude = ("_page", "_xobj")
+
+    def __init__(self, fig, width=None, height=None, kind='direct'):
+        Flowable.__init__(self)
+        self._renderer = render_figure(fig)
+        self._setSize(self._renderer.width, self._renderer.height, width, height, kind)
+
+    def _load(self):
+        """
+        saves the figure to a PDF of one page and reads its page and XObject
+        """
+        pdf = BytesIO()
+        canv = Canvas(pdf, pagesize=(self._w, self._h))
+        self._renderer.replay(canv)
+        canv.showPage()
+        canv.save()
+        self._page, self._xobj = load_page_xobj(pdf)
+
+    @property
+    def page(self):
+        """
+        the pdfrw page of the figure, as of :class:`~autobasedoc.pdfimage.PdfImage`
+        """
+        if self._page is None:
+            self._load()
+        return self._page
+
+    @property
+    def xobj(self):
+        """
+        the pdfrw Form XObject of the figure, as of :class:`~autobasedoc.pdfimage.PdfImage`
+        """
+        if self._xobj is None:
+            self._load()
+        return self._xobj
+
+    def _formName(self, canv):
+        """
+        defines the form on the canvas' document on first use, returns its name
+        """
+        rldoc = getattr(canv, '_doc', canv)
+        registry = rldoc.__dict__.setdefault('_autobasedoc_forms', {})
+        key = ("figure", id(self))
+        if key not in registry:
+            name = "abdFigure%d" % len(registry)
+            canv.beginForm(name, 0, 0, self._w, self._h)
+            self._renderer.replay(canv)
+            _endForm(canv, name)
+            # keep self alive, so an id key can not be reused
+            registry[key] = name, self
+        return registry[key][0]
+
+    def drawOn(self, canv, x, y, _sW=0):
+        """
+        scales the canvas and draws the figure's form
+        """
+        if _sW > 0 and hasattr(self, 'hAlign'):
+            a = self.hAlign
+            if a in ('CENTER', 'CENTRE', TA_CENTER):
+                x += 0.5*_sW
+            elif a in ('RIGHT', TA_RIGHT):
+                x += _sW
+            elif a not in ('LEFT', TA_LEFT):
+                raise ValueError("Bad hAlign value " + str(a))
+
+        name = self._formName(canv)
+
+        canv.saveState()
+        canv.translate(x, y)
+        canv.scale(self.drawWidth/self._w, self.drawHeight/self._h)
+        canv.doForm(name)
+        canv.restoreState()
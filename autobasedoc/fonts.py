@@ -6,6 +6,7 @@ functions are thin wrappers around the ReportLab API and are used by
 """
 
 import os
+import threading
 
 from autobasedoc import base_fonts
 from reportlab.pdfbase import pdfmetrics
@@ -16,6 +17,24 @@ from reportlab.lib.fonts import addMapping
 # directory containing the bundled font files
 __font_dir__ = os.path.realpath(os.path.join(os.path.dirname(__file__), "fonts"))
 
+# ReportLab's font registry is global to the process. Every font is registered
+# only once, so that concurrent builds keep drawing with the same font objects.
+_lock = threading.Lock()
+# font name: the files it was registered from
+_registered = {}
+
+
+def _registerOnce(name, files, makeFont):
+    """
+    registers the font makeFont() returns under name, unless it was
+    registered from files already
+    """
+    with _lock:
+        if _registered.get(name) == files:
+            return
+        pdfmetrics.registerFont(makeFont())
+        _registered[name] = files
+
 
 def registerFont(faceName, afm, pfb):
     """Register a Type1 font pair.
@@ -39,10 +58,12 @@ def registerFont(faceName, afm, pfb):
     afm = os.path.join(__font_dir__, f"{afm}.afm")
     pfb = os.path.join(__font_dir__, f"{pfb}.pfb")
 
-    face = pdfmetrics.EmbeddedType1Face(afm, pfb)
-    pdfmetrics.registerTypeFace(face)
-    font = pdfmetrics.Font(faceName, faceName, 'WinAnsiEncoding')
-    pdfmetrics.registerFont(font)
+    def makeFont():
+        face = pdfmetrics.EmbeddedType1Face(afm, pfb)
+        pdfmetrics.registerTypeFace(face)
+        return pdfmetrics.Font(faceName, faceName, 'WinAnsiEncoding')
+
+    _registerOnce(faceName, (afm, pfb), makeFont)
 
 
 def setTtfFonts(familyName,
@@ -51,24 +72,25 @@ def setTtfFonts(familyName,
                 bold=(None, None),
                 italic=(None, None),
                 bold_italic=(None, None)):
-    """Register a TrueType font family with ReportLab."""
+    """Register a TrueType font family with ReportLab.
+
+    The fonts are registered once per process, calling it again with the
+    same files only sets the base fonts of the active DocumentContext.
+    """
     normalName, normalFile = normal
     boldName, boldFile = bold
     italicName, italicFile = italic
     bold_italicName, bold_italicFile = bold_italic
 
-    pdfmetrics.registerFont(
-        TTFont(normalName, os.path.join(font_dir, normalFile)))
-    pdfmetrics.registerFont(TTFont(boldName, os.path.join(font_dir, boldFile)))
-    pdfmetrics.registerFont(
-        TTFont(italicName, os.path.join(font_dir, italicFile)))
-    pdfmetrics.registerFont(
-        TTFont(bold_italicName, os.path.join(font_dir, bold_italicFile)))
-
-    addMapping(familyName, 0, 0, normalName)
-    addMapping(familyName, 1, 0, boldName)
-    addMapping(familyName, 0, 1, italicName)
-    addMapping(familyName, 1, 1, bold_italicName)
+    for name, fileName in (normal, bold, italic, bold_italic):
+        path = os.path.join(font_dir, fileName)
+        _registerOnce(name, path, lambda: TTFont(name, path))
+
+    with _lock:
+        addMapping(familyName, 0, 0, normalName)
+        addMapping(familyName, 1, 0, boldName)
+        addMapping(familyName, 0, 1, italicName)
+        addMapping(familyName, 1, 1, bold_italicName)
 
     base_fonts().update({"normal": getFont(normalName).fontName})
     base_fonts().update({"bold": getFont(boldName).fontName})
@@ -0,0 +1,225 @@
+"""
+incremental
+===========
+
+.. module:: incremental
+   :platform: Unix, Windows
+   :synopsis: writing the pages of a PDF while the document is built
+
+.. moduleauthor:: Johannes Eckstein
+
+reportlab's canvas keeps every page of a document in memory until it is
+saved. :class:`IncrementalCanvas` writes each page to the file as soon as
+it is finished, with its content stream and the form and image XObjects
+drawn so far, and drops their content. Until the document is saved, only
+the page dictionaries without content, the offsets of the cross reference
+table, the fonts, the outline, annotations and link destinations are kept,
+so that the memory of a build no longer grows with the content of its
+pages.
+
+AutoDocTemplate builds with it if it is created with ``incremental=True``::
+
+    doc = AutoDocTemplate("report.pdf", incremental=True, ...)
+    doc.multiBuild(story)
+
+Pages drawing forms which are defined later, like the page numbers of a
+table of contents drawn after the build, are written once the forms
+exist, at the latest when the document is saved.
+
+Every pass of a build writes the file from its beginning, so a file object
+that can not seek, e.g. a socket, can only be written by a build of one
+pass. Tables of contents are usually built in one pass, see
+:meth:`~autobasedoc.autorpt.AutoDocTemplate.multiBuild`. Encrypted and
+signed documents are not supported.
+"""
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase.pdfdoc import (PDFFile, PDFIndirectObject, PDFPage,
+                                      PDFFormXObject, PDFImageXObject, PDFStream,
+                                      PDFCrossReferenceTable, PDFTrailer, pdfdocEnc)
+from reportlab.platypus.doctemplate import LayoutError
+
+# the objects written as soon as they are registered
+_flushable = (PDFPage, PDFFormXObject, PDFImageXObject, PDFStream)
+
+
+def _release(obj):
+    """
+    drops the content of an object that was written, keeping what is
+    asked of it later, e.g. the size of an image or the box of a form
+    """
+    if isinstance(obj, (PDFPage, PDFFormXObject)):
+        obj.stream = obj.Contents = obj.Resources = None
+    elif isinstance(obj, PDFImageXObject):
+        obj.streamContent = None
+    elif isinstance(obj, PDFStream):
+        obj.content = None
+
+
+class IncrementalOutput(object):
+    """
+    the file written by the canvases of the passes of a build
+
+    :param filename: the file name or file object
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.start = None
+        self.offset = 0
+        self.finished = False
+
+    def begin(self):
+        """
+        starts a pass at the beginning of the file
+        """
+        if self.file is None:
+            if isinstance(self.filename, str):
+                self.file = open(self.filename, "wb")
+            else:
+                self.file = self.filename
+            try:
+                if self.file.seekable():
+                    self.start = self.file.tell()
+            except (AttributeError, OSError):
+                pass
+        elif self.offset:
+            if self.start is None:
+                raise LayoutError("%r can not seek, it can only be written "
+                                  "incrementally by a build of one pass" % (self.filename,))
+            self.file.seek(self.start)
+            self.file.truncate()
+        self.offset = 0
+
+    def write(self, data):
+        """
+        writes data, returns its offset in the PDF
+        """
+        offset = self.offset
+        self.file.write(data)
+        self.offset += len(data)
+        return offset
+
+    def close(self):
+        """
+        closes the file if it was opened here
+        """
+        self.finished = True
+        if self.file is None:
+            return
+        if self.file is not self.filename:
+            self.file.close()
+        elif hasattr(self.file, "flush"):
+            self.file.flush()
+
+    def canvasmaker(self, filename, **kwargs):
+        """
+        the canvasmaker of a build, see BaseDocTemplate.build
+        """
+        return IncrementalCanvas(filename, output=self, **kwargs)
+
+
+class IncrementalCanvas(canvas.Canvas):
+    """
+    a canvas writing its pages to the file as they are finished
+
+    :param output: the IncrementalOutput written to, one of filename if
+                   it is None
+    """
+
+    def __init__(self, filename, output=None, **kwargs):
+        canvas.Canvas.__init__(self, filename, **kwargs)
+        self._output = IncrementalOutput(filename) if output is None else output
+        self._output.begin()
+        self._output.write(PDFFile(self._doc._pdfVersion).format(self._doc))
+        # the objects numbered up to _scanned were looked at
+        self._scanned = 0
+        # the names of objects waiting for a forward reference
+        self._pending = []
+        self._written = set()
+
+    def showPage(self):
+        canvas.Canvas.showPage(self)
+        self._flush()
+
+    def _flush(self):
+        """
+        writes the pages and XObjects registered since the last flush,
+        and the ones whose forward references are resolved now
+        """
+        doc = self._doc
+        if doc.encrypt.info() is not None:
+            raise ValueError("encrypted documents can not be written incrementally")
+        while True:
+            while self._scanned < doc.objectcounter:
+                self._scanned += 1
+                name = doc.numberToId[self._scanned]
+                if isinstance(doc.idToObject[name], _flushable):
+                    self._pending.append(name)
+            pending, self._pending = self._pending, []
+            written = False
+            for name in pending:
+                if self._write(name):
+                    written = True
+                else:
+                    self._pending.append(name)
+            # writing may register new objects, e.g. the content of a page
+            if not written and self._scanned == doc.objectcounter:
+                break
+
+    def _write(self, name):
+        """
+        writes the object name, returns False if it has forward references
+        """
+        doc = self._doc
+        obj = doc.idToObject[name]
+        try:
+            data = PDFIndirectObject(name, obj).format(doc)
+        except KeyError:
+            # e.g. a page drawing a form that is defined later
+            return False
+        doc.idToOffset[name] = self._output.write(data)
+        self._written.add(name)
+        _release(obj)
+        return True
+
+    def save(self):
+        """
+        writes the rest of the document, the cross reference table and the
+        trailer, like PDFDocument.SaveToFile
+        """
+        if len(self._code):
+            self.showPage()
+        doc = self._doc
+        for font in doc.delayedFonts:
+            font.addObjects(doc)
+        doc.info.invariant = doc.invariant
+        doc.info.digest(doc.signature)
+        doc.Reference(doc.Catalog)
+        doc.Reference(doc.info)
+        doc.Outlines.prepare(doc, self)
+        if doc.Outlines.ready < 0:
+            doc.Catalog.Outlines = None
+        self._flush()
+
+        # as PDFDocument.format, the objects are numbered from 1
+        names = []
+        number = 1
+        while number in doc.numberToId:
+            name = doc.numberToId[number]
+            if name not in self._written:
+                data = PDFIndirectObject(name, doc.idToObject[name]).format(doc)
+                doc.idToOffset[name] = self._output.write(data)
+            names.append(name)
+            number += 1
+        xref = PDFCrossReferenceTable()
+        xref.addsection(0, names)
+        startxref = self._output.write(pdfdocEnc(xref.format(doc)))
+        trailer = PDFTrailer(startxref=startxref,
+                             Size=len(names) + 1,
+                             Root=doc.Reference(doc.Catalog),
+                             Info=doc.Reference(doc.info),
+                             Encrypt=None,
+                             ID=doc.ID())
+        self._output.write(pdfdocEnc(trailer.format(doc)))
+        self._output.close()
@@ -0,0 +1,329 @@
+"""
+mappedpdf
+=========
+
+.. module:: mappedpdf
+   :platform: Unix, Windows
+   :synopsis: reading the first page of a PDF file through a memory map
+
+.. moduleauthor:: Johannes Eckstein
+
+pdfrw's PdfReader reads a whole file into memory and decodes it into a
+string before parsing it, and the objects it parses keep that string
+alive. For PDF figures of hundreds of MB, e.g. drawings exported from CAD
+programs, :func:`first_page` maps the file instead, reads its cross
+reference tables and parses only the objects reachable from the first
+page, which are all that :func:`~autobasedoc.pdfimage.load_page_xobj`
+needs::
+
+    page = first_page("drawing.pdf")
+    xobj = pagexobj(page)
+
+Streams are copied from the map as they are, compressed, and written to
+the document without being decoded and encoded again. The map is closed
+before :func:`first_page` returns, so that only the objects of the page
+stay in memory.
+
+The objects returned are pdfrw objects, like the ones of PdfReader. The
+/Parent of the page holds only the attributes the page inherits, the
+other pages of the file are not read.
+
+Encrypted files are not supported, :func:`first_page` raises
+PdfParseError for them, as for files it can not parse.
+"""
+import re
+import mmap
+
+from pdfrw import PdfDict, PdfArray, PdfName
+from pdfrw.tokens import PdfTokens
+from pdfrw.errors import PdfParseError
+from pdfrw.uncompress import uncompress
+
+# the attributes a page inherits from the nodes of the page tree
+_inheritable = ("Resources", "MediaBox", "CropBox", "Rotate")
+
+_missing = object()
+
+_header = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+
+# the end of the dictionary of a stream or of an object without one
+_bodyEnd = re.compile(rb"endobj|stream(?:\r\n|\n|\r)?")
+
+
+class _Ref(object):
+    """
+    an indirect reference, resolved by MappedPdf.resolve
+    """
+    __slots__ = ("number",)
+
+    def __init__(self, number):
+        self.number = number
+
+
+class _Parser(object):
+    """
+    parses values from the tokens of text, beginning at start
+    """
+
+    def __init__(self, text, start=0):
+        self.tokens = iter(PdfTokens(text, start, verbose=False))
+        self.pushed = []
+
+    def next(self, default=_missing):
+        if self.pushed:
+            return self.pushed.pop()
+        try:
+            return next(self.tokens)
+        except StopIteration:
+            if default is not _missing:
+                return default
+            raise PdfParseError("unexpected end of object")
+
+    def value(self, token=None):
+        """
+        returns the value beginning with token, or the next token
+        """
+        if token is None:
+            token = self.next()
+        if token == "<<":
+            result = PdfDict()
+            while True:
+                key = self.next()
+                if key == ">>":
+                    return result
+                value = self.value()
+                if value != "null":
+                    result[key] = value
+        if token == "[":
+            result = PdfArray()
+            while True:
+                token = self.next()
+                if token == "]":
+                    return result
+                result.append(self.value(token))
+        if token.isdigit():
+            # a number, or the object number of a reference
+            generation = self.next("")
+            if generation.isdigit():
+                r = self.next("")
+                if r == "R":
+                    return _Ref(int(token))
+                self.pushed.append(r)
+            self.pushed.append(generation)
+        return token
+
+
+class MappedPdf(object):
+    """
+    the objects of a PDF file, parsed from a memory map when they are
+    asked for
+
+    :param fname: the path of the PDF file
+    """
+
+    def __init__(self, fname):
+        with open(fname, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PdfParseError("empty file %s" % fname)
+        # object number: offset, or (object stream, index)
+        self.offsets = {}
+        # object number: object with its references resolved
+        self.objects = {}
+        # object stream number: (decoded stream, First, offsets)
+        self._objectStreams = {}
+        try:
+            self.trailer = self._readXrefs()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _readXrefs(self):
+        """
+        reads the cross reference sections, the newest first,
+        returns the trailer
+        """
+        tail = self.map[-1024:]
+        pos = tail.rfind(b"startxref")
+        if pos < 0:
+            raise PdfParseError("startxref not found")
+        offset = int(tail[pos + 9:].split()[0])
+        trailer = None
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            if self.map[offset:offset + 4] == b"xref":
+                section = self._readTable(offset)
+                if section.XRefStm is not None:
+                    self._readStream(int(section.XRefStm))
+            else:
+                section = self._readStream(offset)
+            if trailer is None:
+                trailer = section
+            offset = None if section.Prev is None else int(section.Prev)
+        if trailer.Encrypt is not None:
+            raise PdfParseError("encrypted PDF files are not supported")
+        return trailer
+
+    def _readTable(self, offset):
+        """
+        reads the cross reference table at offset, returns its trailer
+        """
+        end = self.map.find(b"trailer", offset)
+        if end < 0:
+            raise PdfParseError("trailer not found")
+        tokens = self.map[offset + 4:end].split()
+        i = 0
+        while i + 1 < len(tokens):
+            start, count = int(tokens[i]), int(tokens[i + 1])
+            i += 2
+            for number in range(start, start + count):
+                if tokens[i + 2] == b"n":
+                    self.offsets.setdefault(number, int(tokens[i]))
+                i += 3
+        stop = self.map.find(b"startxref", end)
+        return _Parser(self.map[end + 7:stop].decode("latin-1")).value()
+
+    def _readStream(self, offset):
+        """
+        reads the cross reference stream at offset, returns its dictionary
+        """
+        xref = self._parse(offset)
+        if not uncompress([xref]):
+            raise PdfParseError("can not decode the cross reference stream")
+        data = xref.stream.encode("latin-1")
+        widths = [int(w) for w in xref.W]
+        index = [int(i) for i in xref.Index or [0, xref.Size]]
+        pos = 0
+        for start, count in zip(index[::2], index[1::2]):
+            for number in range(start, start + count):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[pos:pos + width], "big"))
+                    pos += width
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self.offsets.setdefault(number, fields[1])
+                elif kind == 2:
+                    self.offsets.setdefault(number, (fields[1], fields[2]))
+        xref.stream = None
+        return xref
+
+    def _parse(self, offset):
+        """
+        parses the object at offset, with the references unresolved
+        """
+        match = _header.match(self.map, offset)
+        if match is None:
+            raise PdfParseError("no object at offset %d" % offset)
+        end = _bodyEnd.search(self.map, match.end())
+        if end is None:
+            raise PdfParseError("object at offset %d has no end" % offset)
+        obj = _Parser(self.map[match.end():end.start()].decode("latin-1")).value()
+        if end.group().startswith(b"stream"):
+            length = self.resolve(obj.Length)
+            start = end.end()
+            obj.stream = self.map[start:start + int(length)].decode("latin-1")
+        return obj
+
+    def _parseCompressed(self, stream, index):
+        """
+        parses the object of index in the object stream of number stream
+        """
+        if stream not in self._objectStreams:
+            container = self._parse(self.offsets[stream])
+            if not uncompress([container]):
+                raise PdfParseError("can not decode object stream %d" % stream)
+            text = container.stream
+            # pairs of object number and offset, relative to First
+            tokens = _Parser(text)
+            offsets = [int(tokens.next()) for _ in range(2 * int(container.N))][1::2]
+            self._objectStreams[stream] = text, int(container.First), offsets
+        text, first, offsets = self._objectStreams[stream]
+        return _Parser(text, first + offsets[index]).value()
+
+    def raw(self, number):
+        """
+        returns the object number, with the references unresolved
+        """
+        offset = self.offsets.get(number)
+        if offset is None:
+            return None
+        if isinstance(offset, tuple):
+            return self._parseCompressed(*offset)
+        return self._parse(offset)
+
+    def resolve(self, value):
+        """
+        returns value with all references resolved, recursively
+        """
+        if isinstance(value, _Ref):
+            number = value.number
+            if number in self.objects:
+                return self.objects[number]
+            value = self.raw(number)
+            if isinstance(value, (PdfDict, PdfArray)):
+                value.indirect = True
+            # before resolving the references of the object, for cycles
+            self.objects[number] = value
+        if isinstance(value, PdfDict):
+            for key, item in list(value.iteritems()):
+                value[key] = self.resolve(item)
+        elif isinstance(value, PdfArray):
+            for i, item in enumerate(list(value)):
+                value[i] = self.resolve(item)
+        return value
+
+    def _node(self, value):
+        """
+        returns the page tree node value, with the references unresolved
+        """
+        return self.raw(value.number) if isinstance(value, _Ref) else value
+
+    def first_page(self):
+        """
+        returns the first page, with the objects it uses, and a /Parent
+        holding the attributes it inherits
+        """
+        root = self._node(self.trailer.Root)
+        path = []
+        node = self._node(root.Pages)
+        while node is not None and node.Type != PdfName.Page:
+            path.append(node)
+            kids = self._node(node.Kids)
+            node = self._node(kids[0]) if kids else None
+        if node is None:
+            raise PdfParseError("the file has no pages")
+
+        page = PdfDict(Type=PdfName.Page)
+        for name in ("Contents",) + _inheritable:
+            page[PdfName(name)] = self.resolve(node[PdfName(name)])
+        child = page
+        for ancestor in reversed(path):
+            parent = PdfDict(Type=PdfName.Pages)
+            for name in _inheritable:
+                parent[PdfName(name)] = self.resolve(ancestor[PdfName(name)])
+            child.Parent = parent
+            child = parent
+        return page
+
+
+def first_page(fname):
+    """
+    returns the first page of the PDF file fname as a pdfrw PdfDict,
+    read through a memory map
+
+    :raises PdfParseError: if the file can not be read this way
+    """
+    with MappedPdf(fname) as pdf:
+        return pdf.first_page()
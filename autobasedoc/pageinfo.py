@@ -16,7 +16,9 @@ def addPlugin(canv, doc, frame=None, talkative=False):
 
     :param canv: canvas object
     :param doc: AutoDocTemplate instance
-    :param frame: template name of the Frame
+    :param frame: the Frame of the page template, as returned by ``doc.getFrame``,
+                  or a frame name like 'First', to draw the page infos of
+                  that frame in the frame of the current page template
 
     This function suggests that you have stored page info Items
     in doc.pageInfos.
@@ -26,7 +28,144 @@ def addPlugin(canv, doc, frame=None, talkative=False):
     If you don't want to decorate your Later pages,
     please define an empty pageTemplate with frame='Later'
 
+    The page infos are compiled into a draw plan once per frame, see
+    :func:`compilePlugin`. Everything but the texts with a page number is
+    drawn once into a form, on every page only the form and the page
+    numbers are drawn.
     """
+    if not doc.pageInfos or frame is None:
+        return
+    profiler = getattr(doc, 'profiler', None)
+    if profiler is not None:
+        with profiler.span("addPlugin"):
+            return _addPlugin(canv, doc, frame, talkative)
+    return _addPlugin(canv, doc, frame, talkative)
+
+
+def _addPlugin(canv, doc, frame, talkative):
+    """
+    draws the page infos of frame, see :func:`addPlugin`
+    """
+    if isinstance(frame, str):
+        name = frame
+        frame = doc.getFrame(doc.pageTemplate.id)[0]
+    else:
+        name = frame.id
+
+    plans = doc.__dict__.setdefault('_pageInfoPlans', {})
+    key = (name,) + _planKey(doc, frame)
+    parts = plans.get(key)
+    if parts is None:
+        plan = compilePlugin(doc, frame, name, talkative=talkative)
+        parts = plans[key] = ([op for op in plan if not _isDynamic(op)],
+                              [op for op in plan if _isDynamic(op)])
+    static, dynamic = parts
+
+    if static:
+        canv.doForm(_staticForm(canv, doc, key, static))
+    _drawPlan(canv, doc, dynamic, talkative)
+
+
+def _isDynamic(op):
+    """
+    returns True for the commands of a plan drawing the page number
+    """
+    return op[0] == "string" and op[-1]
+
+
+def _drawPlan(canv, doc, plan, talkative=False):
+    """
+    draws the commands of plan on canv
+    """
+    for op in plan:
+        if op[0] == "string":
+            kind, draw, x, y, text, addPageNumber = op
+            if addPageNumber and doc.page:
+                text += "%d" % doc.page
+            if talkative:
+                print(text)
+            getattr(canv, draw)(x, y, text)
+        elif op[0] == "line":
+            kind, lineWidth, x1, y1, x2, y2 = op
+            canv.setLineWidth(lineWidth)
+            canv.line(x1, y1, x2, y2)
+        else:
+            kind, image, x, y = op
+            image.drawOn(canv, x, y)
+
+
+def _staticForm(canv, doc, key, plan):
+    """
+    defines the form drawing plan on the canvas' document on first use,
+    with the font and colors of canv, and returns its name
+    """
+    rldoc = getattr(canv, '_doc', canv)
+    registry = rldoc.__dict__.setdefault('_autobasedoc_forms', {})
+    font = canv._fontname, canv._fontsize
+    colors = canv._fillColorObj, canv._strokeColorObj
+    formKey = ("pageinfo",) + key + font + tuple(map(repr, colors))
+    if formKey not in registry:
+        name = "abdPageInfo%d" % len(registry)
+        canv.beginForm(name)
+        # a form starts with the initial graphics state of the canvas
+        canv.setFont(*font)
+        canv.setFillColor(colors[0])
+        canv.setStrokeColor(colors[1])
+        _drawPlan(canv, doc, plan)
+        canv.endForm()
+        registry[formKey] = name, plan
+    return registry[formKey][0]
+
+
+def frameKey(frame):
+    """
+    returns the id and the geometry of frame
+    """
+    return (frame.id, frame._x1, frame._y1, frame._width, frame._height,
+            frame._leftPadding, frame._bottomPadding, frame._rightPadding,
+            frame._topPadding)
+
+
+def _infoKey(pI):
+    """
+    returns the content of the page info pI
+
+    its image is compared by identity, the key keeps a reference to it,
+    so that the id of the image is not reused while a plan is kept
+    """
+    return tuple((name, tuple(value) if isinstance(value, list) else value)
+                 for name, value in sorted(vars(pI).items()))
+
+
+def _planKey(doc, frame):
+    """
+    returns what the draw plan of frame depends on
+    """
+    return (frameKey(frame), tuple(map(_infoKey, doc.pageInfos.values())), doc.pagesize,
+            doc.leftMargin, doc.rightMargin, doc.topMargin, doc.bottomMargin,
+            doc.topM, doc.bottomM, doc.fontSize, doc.lineWidth)
+
+
+def compilePlugin(doc, frame, name=None, talkative=False):
+    """
+    returns the draw plan of the page infos of doc on pages with frame,
+    for the page infos whose frame name name starts with, by default
+    the id of frame
+
+    the plan is a list of commands with the coordinates computed::
+
+        ("string", canvas method, x, y, text, addPageNumber)
+        ("line", line width, x1, y1, x2, y2)
+        ("image", image, x, y)
+
+    The plans are kept by :func:`addPlugin` until the page infos, the
+    margins or the frame change. An image of a PageInfo changed in place
+    after it was drawn has to be added again with ``doc.updatePageInfo``.
+    """
+    plan = []
+    if name is None:
+        name = frame.id
+
     _left_margin = False
     _right_margin = False
     _top_margin = False
@@ -72,7 +211,7 @@ def addPlugin(canv, doc, frame=None, talkative=False):
             return frame._bottomPadding + doc.bottomM
         return 0.
 
-    def drawString(pitem, text, posy):
+    def drawString(pitem, posy):
         """
         draws a String in posy:
 
@@ -81,14 +220,15 @@ def addPlugin(canv, doc, frame=None, talkative=False):
         - r draws in align 'Right'
 
         """
+        op = ("%s" % pitem.text, bool(pitem.addPageNumber))
         if pitem.pos == "l":
-            canv.drawString(left_margin(), posy, text)
+            plan.append(("string", "drawString", left_margin(), posy) + op)
 
         elif pitem.pos == "c":
-            canv.drawCentredString(center_margin(), posy, text)
+            plan.append(("string", "drawCentredString", center_margin(), posy) + op)
 
         elif pitem.pos == "r":
-            canv.drawRightString(right_margin(), posy, text)
+            plan.append(("string", "drawRightString", right_margin(), posy) + op)
 
     def drawLine(pitem, posy):
         """
@@ -101,7 +241,7 @@ def addPlugin(canv, doc, frame=None, talkative=False):
         if getattr(pitem, "rightMargin", None):
             right -= pitem.rightMargin
 
-        canv.line(left, posy, right, posy)
+        plan.append(("line", doc.lineWidth, left, posy, right, posy))
 
     def drawImage(pitem, pos):
         """
@@ -172,75 +312,48 @@ def addPlugin(canv, doc, frame=None, talkative=False):
             #finally
             x, y = shift(pitem, x, y)
 
-        pitem.image.drawOn(canv, x, y)
-        #print("added image")
-
-    lkeys = []
-
-    if doc.pageInfos:
-        if frame is None:
-            return
-
-        for pkey, pitem in doc.pageInfos.items():
-            if talkative:
-                print(pkey)
-            #pitem=doc.pageInfos[pkey]
-
-            if getattr(pitem, "rightMargin", None) is not None:
-                _right_margin = getattr(pitem, "rightMargin")
-            if getattr(pitem, "leftMargin", None) is not None:
-                _left_margin = getattr(pitem, "leftMargin")
-            if getattr(pitem, "topMargin", None) is not None:
-                _top_margin = getattr(pitem, "topMargin")
-            if getattr(pitem, "bottomMargin", None) is not None:
-                _bottom_margin = getattr(pitem, "bottomMargin")
-
-            if frame.id.startswith(pitem.frame):
-                lkeys.append(pkey)
-
-                text = "%s" % pitem.text
-                #add Page Number if requested
-                if pitem.addPageNumber:
-                    if doc.page:
-                        text += "%d" % doc.page
-                    if talkative:
-                        print(text)
-
-                if pitem.typ.startswith("header"):
-                    #print(text)
-                    #Header
-                    posy = head_margin()
-                    if pitem.text is not None:
-                        #print("drawString",text)
-                        drawString(pitem, text, posy)
-                    elif pitem.image is not None:
-                        pos = (doc.leftMargin, posy)
-                        drawImage(pitem, pos)
-                        #print("drawImage",pitem.image)
-                    if pitem.line:
-                        canv.setLineWidth(doc.lineWidth)
-                        drawLine(pitem, posy - doc.topM + doc.fontSize)
-
-                elif pitem.typ.startswith("footer"):
-                    #Footer
-                    posy = bottom_margin()
-                    if pitem.text is not None:
-                        drawString(pitem, text, posy)
-                    elif pitem.image is not None:
-                        pos = (doc.leftMargin, posy)
-                        drawImage(pitem, pos)
-                        #print("drawImage",pitem.image)
-                    if pitem.line:
-                        canv.setLineWidth(doc.lineWidth)
-                        drawLine(pitem, posy + doc.topM)
-                else:
-                    break
-
-        if len(lkeys) == 0:
-            addPlugin(canv, doc, frame=None)
-    else:
-        pass
-        #print("going through the pageInfo items:",lkeys)
+        plan.append(("image", pitem.image, x, y))
+
+    for pkey, pitem in doc.pageInfos.items():
+        if talkative:
+            print(pkey)
+
+        if getattr(pitem, "rightMargin", None) is not None:
+            _right_margin = getattr(pitem, "rightMargin")
+        if getattr(pitem, "leftMargin", None) is not None:
+            _left_margin = getattr(pitem, "leftMargin")
+        if getattr(pitem, "topMargin", None) is not None:
+            _top_margin = getattr(pitem, "topMargin")
+        if getattr(pitem, "bottomMargin", None) is not None:
+            _bottom_margin = getattr(pitem, "bottomMargin")
+
+        if name.startswith(pitem.frame):
+
+            if pitem.typ.startswith("header"):
+                #Header
+                posy = head_margin()
+                if pitem.text is not None:
+                    drawString(pitem, posy)
+                elif pitem.image is not None:
+                    pos = (doc.leftMargin, posy)
+                    drawImage(pitem, pos)
+                if pitem.line:
+                    drawLine(pitem, posy - doc.topM + doc.fontSize)
+
+            elif pitem.typ.startswith("footer"):
+                #Footer
+                posy = bottom_margin()
+                if pitem.text is not None:
+                    drawString(pitem, posy)
+                elif pitem.image is not None:
+                    pos = (doc.leftMargin, posy)
+                    drawImage(pitem, pos)
+                if pitem.line:
+                    drawLine(pitem, posy + doc.topM)
+            else:
+                break
+
+    return plan
 
 class PageInfo(object):
     """
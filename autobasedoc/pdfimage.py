@@ -18,22 +18,40 @@ SVG images can currently only be returned as a Drawing::
 
     reportlab.lib.utils.ImageReader
 
+Parsed PDF pages are kept in a process-wide LRU cache, so the same logo or
+figure buffer is only parsed once by pdfrw::
+
+    from autobasedoc.pdfimage import xobj_cache
+
+    xobj_cache().resize(256)
+    print(xobj_cache().stats())
+
+Files on disk are read through a memory map, only the objects used by their
+first page are parsed and copied, see :mod:`autobasedoc.mappedpdf`.
+
 """
+import os
+import threading
 from io import BytesIO, open
+from hashlib import sha1
+from collections import OrderedDict
+from weakref import WeakKeyDictionary
 
 from reportlab.platypus import Image, Flowable
 from reportlab.lib.units import inch,cm,mm
 
-from pdfrw import PdfReader,PdfDict #,PdfFileWriter
+from pdfrw import PdfReader,PdfDict,PdfArray #,PdfFileWriter
 from pdfrw.buildxobj import pagexobj
 from pdfrw.toreportlab import makerl
+from pdfrw.errors import PdfParseError
+
+from autobasedoc.mappedpdf import first_page
 
 from reportlab.pdfgen import canvas
 from reportlab.lib.enums import TA_JUSTIFY,TA_LEFT,TA_CENTER,TA_RIGHT
 
-from svglib.svglib import svg2rlg
-
-import img2pdf
+# svglib and img2pdf are imported on first use, they take longer to import
+# than the rest of the package and are not needed for most documents
 
 def convert_px_to_pdf_image_obj(img_path: str) -> BytesIO:
     """Convert a PNG image to a PDF byte stream.
@@ -49,15 +67,193 @@ def convert_px_to_pdf_image_obj(img_path: str) -> BytesIO:
         Buffer containing the PDF representation.  The buffer can be passed to
         :class:`PdfImage`.
     """
+    import img2pdf
+
     return BytesIO(img2pdf.convert(img_path))
 
 def form_xo_reader(imgdata: BytesIO):
     """Create a ``pdfrw`` XObject from a PDF byte buffer."""
-    page, = PdfReader(imgdata).pages
-    return pagexobj(page)
+    return load_page_xobj(imgdata)[1]
+
+class XObjectCache(object):
+    """
+    size-bounded LRU cache of parsed PDF pages and their form XObjects
+
+    entries are keyed by the sha1 of the PDF bytes for file-like objects
+    and by (path, mtime, size) for files on disk. A ``maxsize`` of 0
+    disables caching.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, loader):
+        """
+        return the cached entry for key, calling loader() on a miss
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        entry = loader()
+
+        with self._lock:
+            if self.maxsize > 0:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._evict()
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        """
+        change the maximum number of entries, evicting the oldest ones
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """
+        drop all entries and reset the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        returns a dict with hits, misses, evictions, size and maxsize
+        """
+        with self._lock:
+            return dict(hits=self.hits,
+                        misses=self.misses,
+                        evictions=self.evictions,
+                        size=len(self._entries),
+                        maxsize=self.maxsize)
+
+_xobj_cache = XObjectCache()
+
+def xobj_cache():
+    """
+    the process-wide cache of parsed PDF pages
+    """
+    return _xobj_cache
+
+def _weak_derived(xobj):
+    """
+    pdfrw remembers the reportlab object made for every PDF object in a
+    ``derived_rl_obj`` dict keyed by the reportlab document. For a cached
+    XObject these dicts would keep every document ever built alive, so
+    they are replaced with weak dicts.
+    """
+    stack, seen = [xobj], set()
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, PdfDict):
+            obj.private.derived_rl_obj = WeakKeyDictionary()
+            stack.extend(obj.values())
+        elif isinstance(obj, PdfArray):
+            obj.derived_rl_obj = WeakKeyDictionary()
+            stack.extend(obj)
+    return xobj
+
+def _read_first_page(fname):
+    """
+    the first page of the file fname, read through a memory map, or by
+    PdfReader if that is not possible
+    """
+    try:
+        return first_page(fname)
+    except (PdfParseError, ValueError, KeyError, IndexError):
+        return PdfReader(fname=fname, decompress=False).pages[0]
+
+def load_page_xobj(filename_or_object):
+    """Return ``(page, xobj)`` for the first page of a PDF.
+
+    Parameters
+    ----------
+    filename_or_object : str or file-like
+        Path to a PDF file or a buffer holding the PDF bytes.  Files
+        are read through a memory map, see :func:`~autobasedoc.mappedpdf.first_page`.
+
+    Returns
+    -------
+    tuple
+        The pdfrw page and its form XObject, shared through
+        :func:`xobj_cache` by everyone loading the same PDF.
+    """
+    if hasattr(filename_or_object, 'read'):
+        if hasattr(filename_or_object, 'getvalue'):
+            fdata = filename_or_object.getvalue()
+        else:
+            filename_or_object.seek(0)
+            fdata = filename_or_object.read()
+        key = sha1(fdata).hexdigest()
+        reader = lambda: PdfReader(fdata=fdata, decompress=False).pages[0]
+    else:
+        fname = os.path.realpath(filename_or_object)
+        stat = os.stat(fname)
+        key = (fname, stat.st_mtime_ns, stat.st_size)
+        reader = lambda: _read_first_page(fname)
+
+    def loader():
+        page = reader()
+        xobj = pagexobj(page)
+        xobj.private.content_key = key
+        return page, _weak_derived(xobj)
+
+    return _xobj_cache.get(key, loader)
+
+def form_name(canv, xobj):
+    """Return the name of ``xobj`` as a Form XObject of ``canv``.
+
+    Parameters
+    ----------
+    canv : reportlab.pdfgen.canvas.Canvas
+        Canvas the form is drawn on.
+    xobj : pdfrw.PdfDict
+        Form XObject as returned by :func:`load_page_xobj`.
+
+    Returns
+    -------
+    str
+        Name to pass to ``canv.doForm``.  The form is written to the
+        document only once per distinct PDF content, however often and from
+        however many flowables it is drawn.
+    """
+    rldoc = getattr(canv, '_doc', canv)
+    registry = rldoc.__dict__.setdefault('_autobasedoc_forms', {})
+    key = xobj.content_key
+    if key is None:
+        key = id(xobj)
+    if key not in registry:
+        # keep xobj alive, so an id key can not be reused
+        registry[key] = makerl(canv, xobj), xobj
+    return registry[key][0]
 
 def getSvg(path: str):
     """Load an SVG file into a ReportLab :class:`~reportlab.graphics.shapes.Drawing`."""
+    from svglib.svglib import svg2rlg
+
     return svg2rlg(path)
 
 def scaleDrawing(drawing, factor: float, showBoundary: bool = False):
@@ -98,18 +294,20 @@ class PdfImage(Flowable):
     """
 
     def __init__(self, filename_or_object, width=None, height=None, kind='direct'):
-        # If using StringIO buffer, set pointer to begining
-        if hasattr(filename_or_object, 'read'):
-            filename_or_object.seek(0)
-            #print("read")
-        self.page = PdfReader(filename_or_object, decompress=False).pages[0]
-        self.xobj = pagexobj(self.page)
+        self.page, self.xobj = load_page_xobj(filename_or_object)
 
+        x1, y1, x2, y2 = self.xobj.BBox
+        self._setSize(x2 - x1, y2 - y1, width, height, kind)
+
+    def _setSize(self, w, h, width=None, height=None, kind='direct'):
+        """
+        sets the natural size w, h and the draw size requested by
+        width, height and kind
+        """
         self.imageWidth = width
         self.imageHeight = height
-        x1, y1, x2, y2 = self.xobj.BBox
 
-        self._w, self._h = x2 - x1, y2 - y1
+        self._w, self._h = w, h
         if not self.imageWidth:
             self.imageWidth = self._w
         if not self.imageHeight:
@@ -145,8 +343,7 @@ class PdfImage(Flowable):
             elif a not in ('LEFT', TA_LEFT):
                 raise ValueError("Bad hAlign value " + str(a))
 
-        #xobj_name = makerl(canv._doc, self.xobj)
-        xobj_name = makerl(canv, self.xobj)
+        xobj_name = form_name(canv, self.xobj)
 
         xscale = self.drawWidth/self._w
         yscale = self.drawHeight/self._h
@@ -168,8 +365,7 @@ class PdfAsset(Flowable):
     """
     def __init__(self, fname, width=None, height=None, kind='direct'):
 
-        self.page = PdfReader(fname=fname, decompress=False).pages[0]
-        self.xobj = pagexobj(self.page)
+        self.page, self.xobj = load_page_xobj(fname)
 
         self.imageWidth = width
         self.imageHeight = height
@@ -210,7 +406,7 @@ class PdfAsset(Flowable):
             yscale = self.imageHeight / img.BBox[3]
             canv.translate(x, y)
             canv.scale(xscale, yscale)
-            canv.doForm(makerl(canv, img))
+            canv.doForm(form_name(canv, img))
         else:
             #canv.drawInlineImage(img, x, y-self.imageHeight, self.imageWidth, self.imageHeight)
             canv.drawImage(img, x, y, self.imageWidth, self.imageHeight)
@@ -0,0 +1,300 @@
+"""
+profiler
+========
+
+.. module:: profiler
+   :platform: Unix, Windows
+   :synopsis: timings of the layout of an AutoDocTemplate build
+
+.. moduleauthor:: Johannes Eckstein
+
+:class:`LayoutProfiler` shows where the time of a build goes. Set one on
+the document before building it::
+
+    doc.profiler = LayoutProfiler()
+    doc.multiBuild(story)
+
+    print(doc.profiler.report())
+    doc.profiler.dump("layout.json")
+    doc.profiler.dumpTrace("layout-trace.json")
+
+Per flowable type it records the time of ``handle_flowable``, of wrapping,
+drawing and splitting the flowables in their frames, the number of splits
+and of postponements to the next frame. It also records the time of every
+page, of ``afterFlowable``, of the onPage callbacks of the page templates
+and of :func:`~autobasedoc.pageinfo.addPlugin`.
+
+The trace written by :meth:`LayoutProfiler.dumpTrace` is in the Chrome
+trace event format, it can be opened in chrome://tracing or Perfetto.
+
+The document, its page templates and frames are only instrumented while
+they are built, by setting instance attributes which are removed again
+after the build. Without a profiler nothing is changed.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+_missing = object()
+
+
+def _counters():
+    """
+    the timings of one flowable type, [count, seconds] per step
+    """
+    return {"handle": [0, 0.], "wrap": [0, 0.], "draw": [0, 0.],
+            "split": [0, 0.], "splits": 0, "postponed": 0}
+
+
+class LayoutProfiler(object):
+    """
+    collects the timings of the builds of a document
+
+    :param trace: keep every span for :meth:`dumpTrace`, else only the totals
+    :param clock: function returning the time in seconds
+    """
+
+    def __init__(self, trace=True, clock=time.perf_counter):
+        self.trace = trace
+        self.clock = clock
+        self._patched = []
+        self.clear()
+
+    def clear(self):
+        """
+        forgets all timings
+        """
+        self.passes = 0
+        self.flowables = {}
+        self.calls = {}
+        self.pages = []
+        self.events = []
+        self._origin = self.clock()
+        self._page = None
+
+    def _span(self, name, cat, start, end, args=None):
+        """
+        adds the span from start to end to the trace
+        """
+        if not self.trace:
+            return
+        event = {"name": name, "cat": cat, "ph": "X",
+                 "ts": 1e6 * (start - self._origin), "dur": 1e6 * (end - start),
+                 "pid": os.getpid(), "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def _call(self, name, start, end, args=None):
+        counter = self.calls.setdefault(name, [0, 0.])
+        counter[0] += 1
+        counter[1] += end - start
+        self._span(name, "call", start, end, args)
+
+    def _counters(self, flowable):
+        name = type(flowable).__name__
+        counters = self.flowables.get(name)
+        if counters is None:
+            counters = self.flowables[name] = _counters()
+        return name, counters
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        times the block as a call of name
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self._call(name, start, self.clock(), args)
+
+    def start(self, doc):
+        """
+        instruments doc, its page templates and frames for one build
+        """
+        self.passes += 1
+        self._patch(doc, "handle_flowable", self._handleFlowable)
+        self._patch(doc, "afterFlowable", self._afterFlowable)
+        self._patch(doc, "handle_pageBegin", self._pageBegin(doc))
+        frames = set()
+        for template in doc.pageTemplates:
+            self._patch(template, "onPage", self._onPage("onPage", template.id))
+            self._patch(template, "onPageEnd", self._onPage("onPageEnd", template.id))
+            for frame in template.frames:
+                if id(frame) not in frames:
+                    frames.add(id(frame))
+                    self._patch(frame, "add", self._frameAdd)
+                    self._patch(frame, "split", self._frameSplit)
+
+    def stop(self, doc):
+        """
+        removes the instrumentation of :meth:`start`
+        """
+        self._endPage()
+        while self._patched:
+            self._unpatch(*self._patched.pop())
+
+    def _patch(self, obj, name, wrapper, patched=None):
+        """
+        replaces the method name of obj by wrapper(method)
+        """
+        (self._patched if patched is None else patched).append(
+            (obj, name, obj.__dict__.get(name, _missing)))
+        setattr(obj, name, wrapper(getattr(obj, name)))
+
+    @staticmethod
+    def _unpatch(obj, name, saved):
+        if saved is _missing:
+            delattr(obj, name)
+        else:
+            setattr(obj, name, saved)
+
+    def _handleFlowable(self, handle):
+        def handle_flowable(flowables):
+            f = flowables[0]
+            start = self.clock()
+            handle(flowables)
+            end = self.clock()
+            name, counters = self._counters(f)
+            counters["handle"][0] += 1
+            counters["handle"][1] += end - start
+            postponed = (getattr(f, "_postponed", 0) and
+                         len(flowables) and flowables[0] is f)
+            if postponed:
+                counters["postponed"] += 1
+            self._span(name, "flowable", start, end,
+                       {"postponed": 1} if postponed else None)
+        return handle_flowable
+
+    def _afterFlowable(self, afterFlowable):
+        def timedAfterFlowable(flowable):
+            start = self.clock()
+            afterFlowable(flowable)
+            self._call("afterFlowable", start, self.clock())
+        return timedAfterFlowable
+
+    def _onPage(self, name, templateId):
+        def wrapper(onPage):
+            def timedOnPage(canv, doc):
+                start = self.clock()
+                onPage(canv, doc)
+                self._call(name, start, self.clock(), {"template": templateId})
+            return timedOnPage
+        return wrapper
+
+    def _pageBegin(self, doc):
+        def wrapper(handle_pageBegin):
+            def timedPageBegin():
+                self._endPage()
+                start = self.clock()
+                handle_pageBegin()
+                self._page = doc.page, start
+            return timedPageBegin
+        return wrapper
+
+    def _endPage(self):
+        if self._page is None:
+            return
+        page, start = self._page
+        end = self.clock()
+        self.pages.append((self.passes, page, end - start))
+        self._span("page %d" % page, "page", start, end, {"pass": self.passes})
+        self._page = None
+
+    def _timed(self, counter):
+        def wrapper(method):
+            def timed(*args, **kwargs):
+                start = self.clock()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    counter[0] += 1
+                    counter[1] += self.clock() - start
+            return timed
+        return wrapper
+
+    def _frameAdd(self, add):
+        def timedAdd(flowable, canv, trySplit=0):
+            name, counters = self._counters(flowable)
+            patched = []
+            try:
+                self._patch(flowable, "wrap", self._timed(counters["wrap"]), patched)
+                self._patch(flowable, "drawOn", self._timed(counters["draw"]), patched)
+            except AttributeError:
+                # e.g. flowables with __slots__ are only timed as a whole
+                pass
+            try:
+                return add(flowable, canv, trySplit)
+            finally:
+                while patched:
+                    self._unpatch(*patched.pop())
+        return timedAdd
+
+    def _frameSplit(self, split):
+        def timedSplit(flowable, canv):
+            name, counters = self._counters(flowable)
+            start = self.clock()
+            parts = split(flowable, canv)
+            end = self.clock()
+            counters["split"][0] += 1
+            counters["split"][1] += end - start
+            if parts:
+                counters["splits"] += 1
+            self._span("split " + name, "split", start, end, {"parts": len(parts)})
+            return parts
+        return timedSplit
+
+    def asDict(self):
+        """
+        returns the timings as a dict of builtin types
+        """
+        return {"passes": self.passes,
+                "flowables": self.flowables,
+                "calls": self.calls,
+                "pages": [{"pass": p, "page": page, "seconds": seconds}
+                          for p, page, seconds in self.pages]}
+
+    def dump(self, fp):
+        """
+        writes the timings as JSON to the file name or file object fp
+        """
+        self._write(fp, self.asDict())
+
+    def dumpTrace(self, fp):
+        """
+        writes the spans in the Chrome trace event format to the file name
+        or file object fp
+        """
+        self._write(fp, {"traceEvents": self.events, "displayTimeUnit": "ms"})
+
+    @staticmethod
+    def _write(fp, data):
+        if isinstance(fp, str):
+            with open(fp, "w") as f:
+                json.dump(data, f)
+        else:
+            json.dump(data, fp)
+
+    def report(self, limit=20):
+        """
+        returns a table of the flowable types taking the most time
+        and the slowest pages
+        """
+        lines = ["%-24s %8s %10s %10s %10s %10s %7s %9s" % (
+            "flowable", "count", "handle[s]", "wrap[s]", "draw[s]", "split[s]",
+            "splits", "postponed")]
+        ranked = sorted(self.flowables.items(), key=lambda item: -item[1]["handle"][1])
+        for name, c in ranked[:limit]:
+            lines.append("%-24s %8d %10.4f %10.4f %10.4f %10.4f %7d %9d" % (
+                name[:24], c["handle"][0], c["handle"][1], c["wrap"][1],
+                c["draw"][1], c["split"][1], c["splits"], c["postponed"]))
+        for name, (count, seconds) in sorted(self.calls.items()):
+            lines.append("%-24s %8d %10.4f" % (name[:24], count, seconds))
+        slowest = sorted(self.pages, key=lambda page: -page[2])[:5]
+        if slowest:
+            lines.append("slowest pages: " + ", ".join(
+                "%d (%.4fs)" % (page, seconds) for p, page, seconds in slowest))
+        return "\n".join(lines)
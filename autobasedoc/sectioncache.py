@@ -0,0 +1,552 @@
+"""
+sectioncache
+============
+
+.. module:: sectioncache
+   :platform: Unix, Windows
+   :synopsis: layout checkpoints to reuse the pages of unchanged report sections
+
+.. moduleauthor:: Johannes Eckstein
+
+A :class:`SectionCache` keeps the pages of a document between builds. When a
+document is rebuilt, sections whose flowables did not change and which start
+in the same layout state are not laid out again, their pages are copied from
+the cache::
+
+    doc = ar.AutoDocTemplate("report.pdf", ...)
+    doc.sectionCache = ar.SectionCache(".report-cache")
+
+    doc.multiBuild(story)
+    print(doc.sectionCache.stats())
+
+Checkpoints are taken at the start of the story and wherever a top level
+:class:`~autobasedoc.autorpt.Bookmark` (a chapter heading made with
+``doHeading``) starts a new page, so chapters should begin with a
+``PageBreak``. The flowables between two checkpoints form a unit, keyed on
+the page number, the page template and a content hash of the flowables, taken
+before they are laid out, and on a digest of what the document decorates its
+pages with, see :meth:`~autobasedoc.autorpt.AutoDocTemplate.decorationDigest`.
+A changed chapter is laid out again, and so are the chapters after it if
+their page numbers shifted. If the headers, footers or page templates
+changed, all chapters are laid out again.
+
+The cached pages are drawn as forms. Links, bookmarks, outline entries and
+table of contents entries made on them are recorded and replayed, anything
+else page templates or flowables do while laying out a reused section is not.
+Units containing a table of contents and the last unit of the story are
+always laid out.
+
+:meth:`~autobasedoc.autorpt.AutoDocTemplate.parallelBuild` fills the cache
+with the chapters of a story laid out in a pool of processes before the
+document is built from it.
+"""
+import os
+import re
+import types
+import pickle
+from hashlib import sha1
+
+from pdfrw import PdfReader, PdfWriter, PdfDict, PdfArray
+from pdfrw.buildxobj import pagexobj
+from pdfrw.toreportlab import makerl
+
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import PageBreak
+from reportlab.platypus.doctemplate import BaseDocTemplate
+
+_keyPattern = re.compile(r"[0-9a-f]{40}")
+
+# canvas methods whose calls are replayed on cached pages,
+# none of them calls another one
+_recorded = ("bookmarkPage", "linkRect", "linkURL", "addOutlineEntry", "showOutline")
+
+
+def _content_hash(obj, h, memo, tokens):
+    """
+    feeds the content of obj into the hash h
+
+    objects are hashed by their class and attributes, bookmark keys in
+    strings are replaced by tokens, attributes named in a class'
+    ``_digestExclude`` are left out
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex)):
+        h.update(("%s:%r;" % (type(obj).__name__, obj)).encode("utf-8"))
+        return
+    if isinstance(obj, str):
+        if tokens:
+            obj = _keyPattern.sub(lambda m: tokens.get(m.group(0), m.group(0)), obj)
+        h.update(("str:%d:" % len(obj)).encode("utf-8"))
+        h.update(obj.encode("utf-8", "surrogatepass"))
+        return
+    if isinstance(obj, (bytes, bytearray)):
+        h.update(b"bytes:%d;" % len(obj))
+        h.update(obj)
+        return
+
+    if id(obj) in memo:
+        h.update(b"ref:%d;" % memo[id(obj)])
+        return
+    memo[id(obj)] = len(memo)
+    # keep obj alive, so its id is not reused while hashing
+    memo[-len(memo)] = obj
+
+    name = ("%s.%s;" % (type(obj).__module__, type(obj).__qualname__)).encode("utf-8")
+    h.update(name)
+    if isinstance(obj, (types.FunctionType, types.BuiltinFunctionType, type)):
+        h.update(("%s.%s;" % (obj.__module__, obj.__qualname__)).encode("utf-8"))
+    elif isinstance(obj, types.MethodType):
+        _content_hash(obj.__self__, h, memo, tokens)
+        _content_hash(obj.__func__, h, memo, tokens)
+    elif isinstance(obj, (BaseDocTemplate, Canvas)):
+        # flowables may refer to the document they are laid out in
+        pass
+    elif isinstance(obj, PdfDict) and obj.content_key is not None:
+        # pages loaded by pdfimage know the digest of their file
+        _content_hash(obj.content_key, h, memo, tokens)
+    elif isinstance(obj, (list, tuple, PdfArray)):
+        h.update(b"%d;" % len(obj))
+        for item in obj:
+            _content_hash(item, h, memo, tokens)
+    elif isinstance(obj, dict):
+        h.update(b"%d;" % len(obj))
+        for key in sorted(obj, key=repr):
+            _content_hash(key, h, memo, tokens)
+            _content_hash(obj[key], h, memo, tokens)
+        if isinstance(obj, PdfDict):
+            _content_hash(obj.stream, h, memo, tokens)
+    elif isinstance(obj, (set, frozenset)):
+        _content_hash(sorted(obj, key=repr), h, memo, tokens)
+    elif callable(getattr(obj, "tobytes", None)):
+        # numpy arrays and PIL images
+        _content_hash(obj.tobytes(), h, memo, tokens)
+        _content_hash(getattr(obj, "shape", getattr(obj, "size", None)), h, memo, tokens)
+    elif hasattr(obj, "__dict__"):
+        exclude = getattr(obj, "_digestExclude", ())
+        _content_hash({k: v for k, v in vars(obj).items() if k not in exclude},
+                      h, memo, tokens)
+    elif hasattr(obj, "__slots__"):
+        _content_hash({k: getattr(obj, k) for k in obj.__slots__ if hasattr(obj, k)},
+                      h, memo, tokens)
+    else:
+        raise TypeError("can not hash the content of %r" % type(obj))
+
+
+def content_digest(flowable, tokens=None):
+    """
+    returns the hex digest of the content of flowable, or None if it
+    holds something that can not be hashed
+
+    :param tokens: replacements for bookmark keys appearing in strings
+    :type tokens: dict
+    """
+    h = sha1()
+    try:
+        _content_hash(flowable, h, {}, tokens)
+    except (TypeError, ValueError, RecursionError):
+        return None
+    return h.hexdigest()
+
+
+def _unitKey(state, decoration):
+    """
+    returns the key of the cached unit starting in the layout state state
+    of a document decorated as decoration
+    """
+    return repr((decoration, state))
+
+
+def _mapKeys(obj, keys):
+    """
+    returns obj with the strings in keys replaced
+    """
+    if isinstance(obj, str):
+        return keys.get(obj, obj)
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_mapKeys(item, keys) for item in obj)
+    if isinstance(obj, dict):
+        return {k: _mapKeys(v, keys) for k, v in obj.items()}
+    return obj
+
+
+class _Unit(object):
+    """
+    the flowables between two checkpoints and the pages they were laid out on
+    """
+    decoration = None
+
+    def __init__(self, start, first, page, decoration=None):
+        self.start = start
+        self.decoration = decoration
+        self.end = None
+        # story positions of the first and after the last flowable
+        self.first = first
+        self.stop = None
+        self.firstPage = page
+        self.pages = 0
+        self.digest = None
+        self.keys = []
+        self.events = []
+        self.fileName = None
+
+    @property
+    def name(self):
+        if self.digest is None:
+            return None
+        h = sha1()
+        _content_hash((self.decoration, self.start, self.digest), h, {}, None)
+        return h.hexdigest()
+
+
+class LayoutRecorder(object):
+    """
+    records the units of one build of a document and replays cached ones
+
+    it is created by :meth:`SectionCache.recorder` and driven by the
+    document template. Units are only reused if they were laid out with the
+    same decoration digest, none if it is None.
+    """
+
+    def __init__(self, cache, bookmarkClass, memo=None, decoration=None):
+        self.cache = cache
+        self.bookmarkClass = bookmarkClass
+        self.decoration = decoration
+        # digests of the flowables of a story laid out in several passes
+        self.memo = {} if memo is None else memo
+        self.units = []
+        self.reused = 0
+        self.reusedPages = 0
+        # per story flowable: content digest and bookmark key, if any
+        self._digests = []
+        self._keys = []
+        self._tokens = {}
+        self._pulled = 0
+        # the number of the first page of the build
+        self.firstPage = 1
+
+    def pulled(self, f):
+        """
+        called for every flowable pulled from the story, before its layout
+        """
+        key = None
+        if isinstance(f, self.bookmarkClass):
+            key = f.key
+            self._tokens[key] = "\x00bookmark:%d:%s\x00" % (f.level, f.title)
+        entry = self.memo.get(id(f))
+        if entry is None or entry[0] is not f:
+            # the flowable has not been laid out yet
+            digest = None if f.isIndexing() else content_digest(f, self._tokens)
+            entry = self.memo[id(f)] = f, digest
+        self._digests.append(entry[1])
+        self._keys.append(key)
+        self._pulled += 1
+
+    def _digest(self, first, stop):
+        digests = self._digests[first:stop]
+        if None in digests:
+            return None
+        return sha1("".join(digests).encode("ascii")).hexdigest()
+
+    def _isSectionStart(self, f):
+        return isinstance(f, self.bookmarkClass) and f.level == 0
+
+    def checkpoint(self, doc, stream):
+        """
+        called when a page is about to begin, starts a new unit if the next
+        flowable of stream is the first of the story or starts a chapter
+
+        cached units are replayed, one after the other, until a unit has
+        to be laid out
+        """
+        while len(stream):
+            first = self._pulled - len(stream._buffer)
+            if first > 0 and not self._isSectionStart(stream[0]):
+                return
+            state = doc._layoutState()
+            if state is None:
+                return
+            self.close(doc, first, state)
+            unit = _Unit(state, first, doc.page + 1, self.decoration)
+            self.units.append(unit)
+            cached = None
+            if self.cache is not None:
+                cached = self.cache._unitFrom(state, self.decoration)
+            if cached is None or not self._matches(cached, stream, first):
+                return
+            self._replay(doc, stream, unit, cached)
+
+    def _matches(self, cached, stream, first):
+        """
+        returns True if the next flowables of stream are the ones of cached
+        and there are more flowables after them
+        """
+        n = cached.stop - cached.first
+        stream._pull(n)
+        if len(stream._buffer) < n:
+            return False
+        if self._digest(first, first + n) != cached.digest:
+            return False
+        # the last unit is laid out, the build loop expects a flowable
+        # after a page begins
+        return cached.end is not None and stream._pull(n + 1)
+
+    def _replay(self, doc, stream, unit, cached):
+        """
+        draws the pages of cached instead of laying out its flowables
+        """
+        n = cached.stop - cached.first
+        keys = [key for key in self._keys[unit.first:unit.first + n] if key is not None]
+        keymap = dict(zip(cached.keys, keys))
+        canv = doc.canv
+        pages = self.cache._pages(cached)
+        events = {}
+        for index, kind, name, args, kwargs in cached.events:
+            events.setdefault(index, []).append((kind, name, args, kwargs))
+
+        for i, page in enumerate(pages):
+            # the replayed calls are recorded again, for the next build
+            doc.page = unit.firstPage + i
+            x0, y0, x1, y1 = [float(v) for v in page.inheritable.MediaBox]
+            canv.setPageSize((x1 - x0, y1 - y0))
+            canv.saveState()
+            canv.translate(-x0, -y0)
+            canv.doForm(makerl(canv, pagexobj(page)))
+            canv.restoreState()
+            for kind, name, args, kwargs in events.get(i, ()):
+                args, kwargs = _mapKeys(args, keymap), _mapKeys(kwargs, keymap)
+                if kind == "notify":
+                    doc.notify(name, args)
+                else:
+                    getattr(canv, name)(*args, **kwargs)
+            canv.showPage()
+        del stream[:n]
+        doc._restoreLayoutState(cached.end)
+        unit.fileName = cached.fileName
+        self.reused += 1
+        self.reusedPages += len(pages)
+
+    def close(self, doc, stop=None, end=None):
+        """
+        closes the unit being laid out, at the story position stop
+        """
+        if not self.units:
+            return
+        unit = self.units[-1]
+        unit.stop = self._pulled if stop is None else stop
+        unit.end = end
+        unit.pages = doc.page - unit.firstPage + 1
+        unit.digest = self._digest(unit.first, unit.stop)
+        unit.keys = [key for key in self._keys[unit.first:unit.stop] if key is not None]
+
+    def record(self, doc, kind, name, args, kwargs=None):
+        """
+        records a call made while laying out the current unit
+        """
+        if not self.units:
+            return
+        unit = self.units[-1]
+        index = doc.page - unit.firstPage
+        unit.events.append((index, kind, name, args, kwargs or {}))
+
+    def recordCanvas(self, doc, canv):
+        """
+        records the calls of canv that are replayed on cached pages
+        """
+        self.firstPage = doc.page + 1
+
+        def recorder(name, method):
+            def call(*args, **kwargs):
+                if name in ("linkRect", "linkURL"):
+                    args, kwargs = _absoluteLink(canv, name, args, kwargs)
+                self.record(doc, "canvas", name, args, kwargs)
+                return method(*args, **kwargs)
+            return call
+
+        for name in _recorded:
+            setattr(canv, name, recorder(name, getattr(canv, name)))
+
+
+def _absoluteLink(canv, name, args, kwargs):
+    """
+    returns the arguments of a link call with the rectangle in page space
+    """
+    if name == "linkRect":
+        names = ("contents", "destinationname", "Rect", "addtopage", "name", "relative")
+        rect, default = "Rect", 1
+    else:
+        names = ("url", "rect", "relative")
+        rect, default = "rect", 0
+    kwargs = dict(kwargs)
+    kwargs.update(zip(names, args))
+    r = canv._absRect(kwargs.get(rect), kwargs.get("relative", default))
+    shift = canv._getCmShift() or 0
+    kwargs[rect] = tuple(v - shift for v in r)
+    kwargs["relative"] = 0
+    return (), kwargs
+
+
+def sectionStarts(story, bookmarkClass):
+    """
+    returns the positions in story of the top level bookmarks following a
+    page break, where the units of a :class:`SectionCache` begin
+    """
+    return [i for i in range(1, len(story))
+            if isinstance(story[i], bookmarkClass) and story[i].level == 0 and
+            isinstance(story[i - 1], PageBreak)]
+
+
+def _layoutApart(doc, flowables, start, decoration):
+    """
+    lays out the pickled flowables with the pickled document template doc,
+    beginning with a page in the layout state start, and records the units
+    with the decoration digest of the document
+
+    it runs in the worker processes of
+    :meth:`~autobasedoc.autorpt.AutoDocTemplate.parallelBuild`
+    """
+    doc = pickle.loads(doc)
+    return doc._layoutSection(pickle.loads(flowables), start, decoration=decoration)
+
+
+class SectionCache(object):
+    """
+    the pages of a document's sections, kept on disk between builds
+
+    :param directory: cache directory of one document, created if missing
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.realpath(os.path.expanduser(directory))
+        self.reused = 0
+        self.laidOut = 0
+        self.reusedPages = 0
+        self._units = None
+        self._readers = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def _manifest(self):
+        return os.path.join(self.directory, "sections.pickle")
+
+    def _load(self):
+        if self._units is None:
+            try:
+                with open(self._manifest, "rb") as f:
+                    self._units = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self._units = {}
+        return self._units
+
+    def _unitFrom(self, state, decoration):
+        """
+        returns the cached unit starting in state, laid out with the
+        decoration digest decoration, or None
+        """
+        if decoration is None:
+            return None
+        return self._load().get(_unitKey(state, decoration))
+
+    def _pages(self, unit):
+        """
+        returns the pdfrw pages of unit
+        """
+        path = os.path.join(self.directory, unit.fileName)
+        if path not in self._readers:
+            self._readers[path] = PdfReader(path, decompress=False)
+        return self._readers[path].pages
+
+    def recorder(self, bookmarkClass, memo=None, decoration=None):
+        """
+        returns a :class:`LayoutRecorder` for a build of a document with
+        the decoration digest decoration
+        """
+        return LayoutRecorder(self, bookmarkClass, memo, decoration)
+
+    def _storeUnits(self, units, pdf, base=1):
+        """
+        writes the pages of units without a file from the PDF bytes pdf,
+        whose first page has the number base, and returns the units stored
+        """
+        reader = None
+        stored = []
+        for unit in units:
+            if unit.digest is None or unit.decoration is None or unit.pages <= 0:
+                continue
+            if unit.fileName is None:
+                unit.fileName = unit.name + ".pdf"
+                path = os.path.join(self.directory, unit.fileName)
+                if not os.path.exists(path):
+                    if reader is None:
+                        reader = PdfReader(fdata=pdf, decompress=False)
+                    writer = PdfWriter()
+                    first = unit.firstPage - base
+                    for page in reader.pages[first:first + unit.pages]:
+                        # links are replayed, they would point into this file
+                        page.Annots = None
+                        writer.addpage(page)
+                    tmp = "%s.%d.tmp" % (path, os.getpid())
+                    writer.write(tmp)
+                    os.replace(tmp, path)
+            stored.append(unit)
+        return stored
+
+    def _writeManifest(self, units):
+        tmp = "%s.%d.tmp" % (self._manifest, os.getpid())
+        with open(tmp, "wb") as f:
+            pickle.dump(units, f, protocol=4)
+        os.replace(tmp, self._manifest)
+        self._units = units
+        self._readers = {}
+
+    def add(self, units, pdf, base):
+        """
+        adds units laid out apart from their document to the cached ones
+
+        :param units: the units recorded while laying out a part of a story
+        :param pdf: the PDF bytes of that part
+        :param base: the page number of the first page of pdf
+        """
+        cached = dict(self._load())
+        for unit in self._storeUnits(units, pdf, base):
+            cached[_unitKey(unit.start, unit.decoration)] = unit
+        self._writeManifest(cached)
+
+    def store(self, recorder, pdf):
+        """
+        stores the units recorded by recorder with their pages from the
+        PDF bytes pdf, and removes the pages of units no longer used
+        """
+        units = {_unitKey(unit.start, unit.decoration): unit
+                 for unit in self._storeUnits(recorder.units, pdf, recorder.firstPage)}
+
+        self.reused += recorder.reused
+        self.laidOut += len(recorder.units) - recorder.reused
+        self.reusedPages += recorder.reusedPages
+
+        self._writeManifest(units)
+
+        used = set(unit.fileName for unit in units.values())
+        for fileName in os.listdir(self.directory):
+            if fileName.endswith(".pdf") and fileName not in used:
+                try:
+                    os.remove(os.path.join(self.directory, fileName))
+                except OSError:
+                    pass
+
+    def clear(self):
+        """
+        removes all cached pages and resets the counters
+        """
+        for fileName in os.listdir(self.directory):
+            if fileName.endswith(".pdf") or fileName == "sections.pickle":
+                os.remove(os.path.join(self.directory, fileName))
+        self._units = None
+        self._readers = {}
+        self.reused = self.laidOut = self.reusedPages = 0
+
+    def stats(self):
+        """
+        returns a dict with the units reused and laid out and the pages reused
+        """
+        return dict(reused=self.reused,
+                    laidOut=self.laidOut,
+                    reusedPages=self.reusedPages)
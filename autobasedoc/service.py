@@ -0,0 +1,484 @@
+"""
+service
+=======
+
+.. module:: service
+   :platform: Unix, Windows
+   :synopsis: rendering reports from story descriptions with asyncio
+
+.. moduleauthor:: Johannes Eckstein
+
+:class:`ReportService` renders documents described by JSON compatible
+dicts, for asyncio applications. The builds run on an executor, at most
+``concurrency`` at once, and at most ``queueSize`` requests wait for
+their turn, further ones are rejected with :class:`ServiceBusy` right away
+instead of waiting behind a growing queue::
+
+    service = ReportService(concurrency=4, queueSize=16)
+
+    pdf = await service.render(description)
+
+    async for chunk in service.stream(description):
+        await send(chunk)
+
+A description names the page layout, the page infos and the story, its
+elements are built by the factories in :data:`elements`, like the ones of
+``tests/layout.json``::
+
+    {"title": "Report", "orientation": "portrait", "columns": 1,
+     "pageInfos": [{"typ": "footer", "pos": "r", "text": "Page ",
+                    "frame": "Later", "addPageNumber": true}],
+     "story": [{"code": "toc"},
+               {"code": "heading", "arguments": {"text": "Results"}},
+               {"code": "paragraph", "arguments": {"text": "..."}},
+               {"code": "table", "arguments": {"rows": [[1, 2]],
+                                               "header": ["a", "b"]}}]}
+
+Every document is built in a :class:`~autobasedoc.DocumentContext` of its
+own, so that builds running at once do not share fonts or id counters.
+
+:meth:`ReportService.stream` yields the PDF as it is written by the build,
+in chunks of ``chunkSize`` bytes. The writes of the build wait while
+``buffers`` chunks are not consumed, so a slow client holds back its own
+build and not the memory of the service. The pages of stories without a
+table of contents are written as they are finished, see
+:mod:`autobasedoc.incremental`, the others when the document is saved, as
+their builds may take more than one pass.
+
+:func:`serve` is a minimal HTTP server for a service, answering
+``POST /render`` with the streamed PDF.
+"""
+import os
+import json
+import asyncio
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import cm
+
+from autobasedoc import DocumentContext
+import autobasedoc.autorpt as ar
+
+# the factories of the story elements by name, see element
+elements = {}
+
+
+def element(name):
+    """
+    decorator registering a factory of story elements::
+
+        @element("note")
+        def note(styles, text):
+            return [ar.Paragraph(text, styles.italic)]
+
+    a factory is called with the styles of the document and the arguments
+    of the element, and returns a list of flowables
+    """
+    def register(factory):
+        elements[name] = factory
+        return factory
+    return register
+
+
+@element("toc")
+def toc(styles):
+    return [ar.doTableOfContents()]
+
+
+@element("heading")
+def heading(styles, text, level=1, outlineText=None):
+    return list(ar.doHeading(text, getattr(styles, "h%d" % level), outlineText))
+
+
+@element("paragraph")
+def paragraph(styles, text, style="normal"):
+    return [ar.Paragraph(text, getattr(styles, style))]
+
+
+@element("spacer")
+def spacer(styles, height=0.5):
+    """
+    height in cm
+    """
+    return [ar.Spacer(1, height * cm)]
+
+
+@element("pagebreak")
+def pagebreak(styles):
+    return [ar.PageBreak()]
+
+
+@element("table")
+def table(styles, rows, header=None, gridded=True, colWidths=None):
+    """
+    colWidths in cm
+    """
+    if colWidths is not None:
+        colWidths = [width * cm for width in colWidths]
+    styledTable = ar.StyledTable(gridded=gridded, colWidths=colWidths)
+    for row in rows:
+        styledTable.addTableLine(row)
+    if header is not None:
+        styledTable.addTableHeader(header)
+    return [styledTable.as_flowable]
+
+
+@element("figure")
+def figure(styles, x, y, title=None, width=6, height=3):
+    """
+    a line plot of y over x, width and height in inch
+    """
+    import autobasedoc.autoplot as ap
+
+    @ap.autoPdfImg
+    def linePlot():
+        fig, ax = ap.subplots(figsize=(width, height))
+        ax.plot(x, y, lw=1)
+        if title is not None:
+            ax.set_title(title)
+        return fig
+
+    return [linePlot()]
+
+
+@element("image")
+def image(styles, path, width=None):
+    """
+    a PDF or bitmap image, width in cm
+    """
+    if path.lower().endswith(".pdf"):
+        img = ar.PdfImage(path)
+    else:
+        img = ar.Image(path)
+    if width is not None:
+        factor = width * cm / img.drawWidth
+        img.drawWidth *= factor
+        img.drawHeight *= factor
+    return [img]
+
+
+def checkDescription(description):
+    """
+    raises ValueError if description is no dict or names story elements
+    that are not in :data:`elements`
+    """
+    if not isinstance(description, dict):
+        raise ValueError("a description is a dict, not %s" % type(description).__name__)
+    for item in description.get("story", []):
+        if not isinstance(item, dict) or item.get("code") not in elements:
+            raise ValueError("unknown story element %r" % (item,))
+
+
+def makeStory(description, styles):
+    """
+    returns the flowables of the story of description
+    """
+    checkDescription(description)
+    story = []
+    for item in description.get("story", []):
+        factory = elements[item["code"]]
+        story.extend(factory(styles, **item.get("arguments", {})))
+    return story
+
+
+def makeDoc(description, filename, incremental=False):
+    """
+    returns the AutoDocTemplate of description writing to filename
+    """
+    columns = description.get("columns", 1)
+    if columns == 1:
+        columns = 0
+    if description.get("orientation", "portrait") == "landscape":
+        first, later, pagesize = ar.drawFirstLandscape, ar.drawLaterLandscape, landscape(A4)
+    else:
+        first, later, pagesize = ar.drawFirstPortrait, ar.drawLaterPortrait, A4
+    doc = ar.AutoDocTemplate(filename,
+                             onFirstPage=(first, 0),
+                             onLaterPages=(later, columns),
+                             pagesize=pagesize,
+                             title=description.get("title"),
+                             author=description.get("author"),
+                             invariant=description.get("invariant"),
+                             incremental=incremental)
+    for pageInfo in description.get("pageInfos", []):
+        doc.addPageInfo(**pageInfo)
+    return doc
+
+
+def renderDescription(description, filename=None, incremental=False):
+    """
+    builds the document of description in a DocumentContext of its own
+
+    :param filename: the file name or object written to, the PDF is
+                     returned as bytes if it is None
+    :param incremental: write the pages as they are finished, if the story
+                        has no table of contents
+    """
+    incremental = incremental and not any(
+        item.get("code") == "toc" for item in description.get("story", []))
+    with DocumentContext():
+        output = BytesIO() if filename is None else filename
+        styles = ar.Styles()
+        styles.registerStyles()
+        doc = makeDoc(description, output, incremental)
+        doc.multiBuild(makeStory(description, styles))
+    if filename is None:
+        return output.getvalue()
+
+
+class ServiceBusy(Exception):
+    """
+    raised when a request arrives while queueSize requests are waiting
+    """
+
+
+class _Cancelled(Exception):
+    """
+    aborts a build whose output is no longer read
+    """
+
+
+class _StreamWriter(object):
+    """
+    a file object handing what is written to an asyncio.Queue in chunks,
+    waiting while the queue is full, used from the thread of a build
+    """
+
+    def __init__(self, loop, queue, chunkSize):
+        self.loop = loop
+        self.queue = queue
+        self.chunkSize = chunkSize
+        self.closed = False
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("latin-1")
+        for start in range(0, len(data), self.chunkSize):
+            if self.closed:
+                raise _Cancelled()
+            asyncio.run_coroutine_threadsafe(
+                self.queue.put(data[start:start + self.chunkSize]), self.loop).result()
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class ReportService(object):
+    """
+    renders story descriptions on an executor, for asyncio
+
+    :param concurrency: the number of documents built at once
+    :param queueSize: the number of requests waiting for a build, further
+                      requests raise :class:`ServiceBusy`
+    :param queueTimeout: seconds a request waits at most for its build to
+                         start, before it raises :class:`ServiceBusy`,
+                         None waits as long as it takes
+    :param executor: the executor of the builds, a ThreadPoolExecutor of
+                     concurrency threads by default. The builds of a
+                     ProcessPoolExecutor run in parallel, their PDFs are
+                     streamed once they are complete
+    :param chunkSize: the size of the chunks of :meth:`stream`
+    :param buffers: the chunks of a stream written ahead of the client
+    """
+
+    def __init__(self, concurrency=None, queueSize=16, queueTimeout=None,
+                 executor=None, chunkSize=64 * 1024, buffers=4):
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self.queueSize = queueSize
+        self.queueTimeout = queueTimeout
+        self._ownExecutor = executor is None
+        self.executor = executor or ThreadPoolExecutor(self.concurrency)
+        self.chunkSize = chunkSize
+        self.buffers = buffers
+        self.waiting = 0
+        self.running = 0
+        self._slots = None
+
+    async def _acquire(self):
+        """
+        waits for a build slot, or raises ServiceBusy
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        if self._slots.locked() and self.waiting >= self.queueSize:
+            raise ServiceBusy("%d requests are waiting" % self.waiting)
+        self.waiting += 1
+        try:
+            if self.queueTimeout is None:
+                await self._slots.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), self.queueTimeout)
+                except asyncio.TimeoutError:
+                    raise ServiceBusy("no build started within %ss" % self.queueTimeout)
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def _release(self):
+        self.running -= 1
+        self._slots.release()
+
+    async def render(self, description):
+        """
+        returns the PDF of description as bytes
+        """
+        await self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, renderDescription, description)
+        finally:
+            self._release()
+
+    async def stream(self, description):
+        """
+        yields the PDF of description in chunks of chunkSize bytes
+
+        the description is checked and a build slot is waited for before
+        the first chunk, so that errors and :class:`ServiceBusy` are raised
+        before anything is sent. A stream that is closed early aborts its
+        build.
+        """
+        checkDescription(description)
+        await self._acquire()
+        try:
+            if isinstance(self.executor, ProcessPoolExecutor):
+                pdf = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, renderDescription, description)
+                for start in range(0, len(pdf), self.chunkSize):
+                    yield pdf[start:start + self.chunkSize]
+                return
+            async for chunk in self._streamBuild(description):
+                yield chunk
+        finally:
+            self._release()
+
+    async def _streamBuild(self, description):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.buffers)
+        writer = _StreamWriter(loop, queue, self.chunkSize)
+        done = object()
+
+        def build():
+            try:
+                renderDescription(description, writer, incremental=True)
+            finally:
+                if not writer.closed:
+                    asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+        future = loop.run_in_executor(self.executor, build)
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is done:
+                    break
+                yield chunk
+            await future
+        finally:
+            if not future.done():
+                writer.closed = True
+                while not queue.empty():
+                    queue.get_nowait()
+                try:
+                    await future
+                except _Cancelled:
+                    pass
+
+    def close(self):
+        """
+        shuts the executor down, if it was created by the service
+        """
+        if self._ownExecutor:
+            self.executor.shutdown()
+
+
+async def _handle(service, reader, writer):
+    """
+    answers one HTTP request on the connection of reader and writer
+
+    errors before the PDF is sent are answered with 400 or 500, errors of
+    a build whose PDF is being sent close the connection before the end
+    of the chunked body, so that the client sees an incomplete response
+    """
+    status, body = None, b""
+    # True once the status line of the PDF was written
+    started = False
+    try:
+        request = await reader.readline()
+        method, path = request.decode("latin-1").split()[:2]
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if method != "POST" or path != "/render":
+            status, body = "404 Not Found", b"POST a description to /render\n"
+        else:
+            data = await reader.readexactly(int(headers.get("content-length", 0)))
+            description = json.loads(data.decode("utf-8"))
+            chunks = service.stream(description)
+            try:
+                first = await chunks.__anext__()
+            except ServiceBusy as busy:
+                status, body = "503 Service Unavailable", str(busy).encode() + b"\n"
+            else:
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/pdf\r\n"
+                             b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+                started = True
+                try:
+                    chunk = first
+                    while True:
+                        writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        await writer.drain()
+                        try:
+                            chunk = await chunks.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    writer.write(b"0\r\n\r\n")
+                finally:
+                    await chunks.aclose()
+        if status is not None:
+            writer.write(b"HTTP/1.1 %s\r\nContent-Type: text/plain\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (
+                             status.encode(), len(body), body))
+        await writer.drain()
+    except ConnectionError:
+        pass
+    except Exception as error:
+        if not started:
+            if isinstance(error, (ValueError, TypeError, KeyError)):
+                status = "400 Bad Request"
+            else:
+                status = "500 Internal Server Error"
+            body = str(error).encode() + b"\n"
+            writer.write(b"HTTP/1.1 %s\r\nContent-Type: text/plain\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (
+                             status.encode(), len(body), body))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host="127.0.0.1", port=8080):
+    """
+    starts a minimal HTTP server rendering the descriptions posted to
+    ``/render`` with service, returns the asyncio Server::
+
+        server = await serve(ReportService(), port=8080)
+        async with server:
+            await server.serve_forever()
+
+    it is meant for tests and local use, put a real web server in front of
+    it for anything else
+    """
+    async def handle(reader, writer):
+        await _handle(service, reader, writer)
+
+    return await asyncio.start_server(handle, host, port)
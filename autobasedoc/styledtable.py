@@ -11,13 +11,75 @@ styledtable
 import random
 import string
 import copy
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import accumulate, zip_longest
+import numpy as np
 from reportlab.platypus import TableStyle, Table, Flowable
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER, TA_RIGHT
 from reportlab.lib.units import inch, cm, mm
 from autobasedoc import base_fonts, color_dict, colors
 from collections import OrderedDict, defaultdict
 from autobasedoc.fonts import getFont
 
+@lru_cache(maxsize=2**16)
+def textWidth(text, fontName, fontSize):
+    """
+    Returns the width of the longest line of text as int, memoized per
+    text, font and size.
+    """
+    largestStr = sorted(text.split("\n"), key=lambda x: len(x))[-1]
+    return int(stringWidth(largestStr, fontName, fontSize))
+
+
+def _uniqueNumbers(numbers):
+    """
+    Returns the distinct values of a list of ints or of floats.
+
+    Floats are compared by their bits, so that 0.0 and -0.0 stay apart.
+    """
+    if isinstance(numbers[0], float):
+        values = np.asarray(numbers, dtype=np.float64)
+        return np.unique(values.view(np.int64)).view(np.float64).tolist()
+    try:
+        return np.unique(np.asarray(numbers, dtype=np.int64)).tolist()
+    except OverflowError:
+        return set(numbers)
+
+
+@lru_cache(maxsize=64)
+def _asciiWidths(fontName):
+    """
+    Returns the widths of the ascii characters in fontName at size 1000.
+    """
+    return np.array([stringWidth(chr(i), fontName, 1000) for i in range(128)])
+
+
+def maxTextWidth(texts, fontName, fontSize):
+    """
+    Returns the largest :func:`textWidth` of texts.
+
+    For many single line ascii texts the widths are summed up per character
+    with numpy first, only the widest texts are measured exactly, one for
+    each summed width.
+    """
+    texts = list(texts)
+    if len(texts) > 64:
+        joined = "".join(texts)
+        if joined.isascii() and "\n" not in joined:
+            widths = _asciiWidths(fontName)[np.frombuffer(joined.encode("ascii"), np.uint8)]
+            offsets = np.concatenate(([0.], np.cumsum(widths)))
+            lengths = np.fromiter(map(len, texts), np.intp, len(texts))
+            ends = np.cumsum(lengths)
+            estimates = offsets[ends] - offsets[ends - lengths]
+            limit = estimates.max() * (1 - 1e-9) - 1e-6
+            widest = np.flatnonzero(estimates >= limit)
+            _, first = np.unique(estimates[widest], return_index=True)
+            texts = [texts[i] for i in widest[first]]
+    return max([textWidth(text, fontName, fontSize) for text in texts] or [0])
+
+
 def getTableStyle(tSty=None, tSpaceAfter=0, tSpaceBefore=0):
     """
     :param tSty: TableStyle(tSty) default is None
@@ -87,6 +149,170 @@ def getTableStyle(tSty=None, tSpaceAfter=0, tSpaceBefore=0):
     return tableStyle
 
 
+class ColumnarRows(object):
+    """
+    table rows stored as columns, e.g. of a DataFrame
+
+    Accepts a pandas DataFrame, a pyarrow Table or RecordBatch, a 2d or
+    structured numpy array, or a list of columns. The cells of a row are
+    only created when the row is accessed, slices format every column of
+    the slice at once::
+
+        rows = ColumnarRows(df, formatters={"price": "%.2f"})
+        rows[1000:1040]     # a list of 40 rows
+
+    Formatters are given per column name or index, either as ``%`` format
+    string, applied with ``numpy.char.mod``, or as callable taking a numpy
+    array and returning a sequence of cells. Without formatter the values
+    are converted to Python objects with ``tolist()``.
+
+    Rows inserted at the top (a header) or appended at the bottom are kept
+    as lists, so that a StyledTable can use it like a list of rows.
+    """
+
+    def __init__(self, data, formatters=None, padding=False):
+        """
+        :param data: the table data, by columns
+        :type data: DataFrame, pyarrow.Table, numpy.ndarray or list of columns
+        :param formatters: formatters per column name or index
+        :type formatters: dict or list
+        :param padding: if True, an empty column is put in front of the columns
+        :type padding: bool
+        """
+        self.names, self.columns = self._columnsOf(data)
+        if isinstance(formatters, dict):
+            formatters = [formatters.get(name, formatters.get(i))
+                          for i, name in enumerate(self.names)]
+        formatters = list(formatters or [])
+        self.formatters = formatters + [None] * (len(self.columns) - len(formatters))
+        self.padding = padding
+        self.length = len(self.columns[0]) if self.columns else 0
+        self.head = []
+        self.tail = []
+
+    @staticmethod
+    def _columnsOf(data):
+        """
+        Returns the column names and the columns of data.
+        """
+        if hasattr(data, "column_names"):
+            # pyarrow, sliced column by column when rows are accessed
+            return list(data.column_names), list(data.columns)
+        if hasattr(data, "iloc"):
+            # pandas
+            return ([str(name) for name in data.columns],
+                    [data.iloc[:, i].to_numpy() for i in range(data.shape[1])])
+        if isinstance(data, np.ndarray):
+            if data.dtype.names:
+                return list(data.dtype.names), [data[name] for name in data.dtype.names]
+            return [str(i) for i in range(data.shape[1])], list(data.T)
+        columns = [np.asarray(column) for column in data]
+        return [str(i) for i in range(len(columns))], columns
+
+    def _format(self, i, start, stop):
+        """
+        Returns the cells of column i for the rows start to stop.
+        """
+        column = self.columns[i]
+        if hasattr(column, "to_numpy"):
+            values = column.slice(start, stop - start).to_numpy(zero_copy_only=False)
+        else:
+            values = column[start:stop]
+        formatter = self.formatters[i]
+        if formatter is None:
+            if values.dtype.kind == "M":
+                return np.datetime_as_string(values).tolist()
+            return values.tolist()
+        if isinstance(formatter, str):
+            return np.char.mod(formatter, values).tolist()
+        return list(formatter(values))
+
+    def _rows(self, start, stop):
+        """
+        Returns the columnar rows start to stop as lists.
+        """
+        if start >= stop:
+            return []
+        cells = [self._format(i, start, stop) for i in range(len(self.columns))]
+        if self.padding:
+            cells.insert(0, [""] * (stop - start))
+        return [list(row) for row in zip(*cells)]
+
+    def iterColumns(self):
+        """
+        Yields the cells of every column of all rows, one column at a time.
+        """
+        cells = [[] for row in self.head + self.tail]
+        count = len(self.columns) + (1 if self.padding else 0)
+        for i in range(count):
+            if self.padding and i == 0:
+                column = [""] * self.length
+            else:
+                column = self._format(i - (1 if self.padding else 0), 0, self.length)
+            head = [row[i] if i < len(row) else None for row in self.head]
+            tail = [row[i] if i < len(row) else None for row in self.tail]
+            yield head + column + tail
+        # cells of head or tail rows which are longer than the columns
+        width = max([len(row) for row in self.head + self.tail] or [0])
+        for i in range(count, width):
+            yield ([row[i] if i < len(row) else None for row in self.head] +
+                   [None] * self.length +
+                   [row[i] if i < len(row) else None for row in self.tail])
+
+    def __len__(self):
+        return len(self.head) + self.length + len(self.tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            head, length = len(self.head), self.length
+            return (self.head[start:stop] +
+                    self._rows(min(max(start - head, 0), length),
+                               min(max(stop - head, 0), length)) +
+                    self.tail[max(start - head - length, 0):max(stop - head - length, 0)])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        if index < len(self.head):
+            return self.head[index]
+        if index < len(self.head) + self.length:
+            start = index - len(self.head)
+            return self._rows(start, start + 1)[0]
+        return self.tail[index - len(self.head) - self.length]
+
+    def __iter__(self):
+        chunk = 1024
+        for start in range(0, len(self), chunk):
+            for row in self[start:start + chunk]:
+                yield row
+
+    def insert(self, index, row):
+        """
+        Inserts row above the columnar rows, only below the inserted rows.
+        """
+        if not 0 <= index <= len(self.head):
+            raise NotImplementedError("rows can only be inserted at the top")
+        self.head.insert(index, row)
+
+    def append(self, row):
+        """
+        Appends row below the columnar rows.
+        """
+        self.tail.append(row)
+
+    def copy(self):
+        """
+        Returns a copy sharing the columns.
+        """
+        rows = copy.copy(self)
+        rows.head = list(self.head)
+        rows.tail = list(self.tail)
+        return rows
+
+
 class StyledTable(object):
     """
     data object to store all data and styles of ONE table
@@ -99,8 +325,20 @@ class StyledTable(object):
         |                                  |
         +----------------------------------+
 
-
+    Parts of a table, as returned by :meth:`split_table` or
+    :meth:`slice_rows`, are views: they share the rows and style commands
+    of the table and only record row offsets. A part copies its rows or
+    style commands the first time they are accessed.
     """
+    # (header rows, start, stop) of a view into _tableData, None if it is owned
+    _view = None
+    _sharedRows = False
+    _sharedStyles = False
+    # (shift, low, high) applied to the rows of background commands, see getStyleCommands
+    _background = (0, None, None)
+    _styleIndex = None
+    # rows measured at once for ColumnarRows
+    measureRows = 1000
 
     def __init__(self, gridded=False, leftTablePadding=0, hTableAlignment=None, colWidths=None):
         """
@@ -120,6 +358,8 @@ class StyledTable(object):
         self.tableExtraStyleCommands = list()
         self.fontsize = 10
         self.font = getFont(base_fonts()["normal"])
+        # number of lines measured by columnWidthEstim, None for all lines
+        self.widthSample = None
         self.addTableStyleCommand(('FONT', (0, 0), (-1, -1),
                                    base_fonts()["normal"]))
         if gridded:
@@ -140,6 +380,64 @@ class StyledTable(object):
         self.addTableStyleCommand(
             ('FONTSIZE', (0, 0), (-1, -1), self.fontsize))
 
+    @property
+    def tableData(self):
+        """
+        the table rows, copied from the shared rows first if necessary
+        """
+        if self._view is not None:
+            header, start, stop = self._view
+            self._tableData = list(header) + self._tableData[start:stop]
+            self._view = None
+        elif self._sharedRows:
+            self._tableData = self._tableData.copy()
+        self._sharedRows = False
+        return self._tableData
+
+    @tableData.setter
+    def tableData(self, data):
+        self._tableData = data
+        self._view = None
+        self._sharedRows = False
+
+    @property
+    def tableStyleCommands(self):
+        """
+        the style commands, copied from the shared commands first if necessary
+        """
+        self._ownStyles()
+        return self._tableStyleCommands
+
+    @tableStyleCommands.setter
+    def tableStyleCommands(self, commands):
+        self._ownStyles()
+        self._tableStyleCommands = commands
+        self._background = (0, None, None)
+
+    @property
+    def tableExtraStyleCommands(self):
+        """
+        the extra style commands, copied from the shared commands first if necessary
+        """
+        self._ownStyles()
+        return self._tableExtraStyleCommands
+
+    @tableExtraStyleCommands.setter
+    def tableExtraStyleCommands(self, commands):
+        self._ownStyles()
+        self._tableExtraStyleCommands = commands
+
+    def _ownStyles(self):
+        """
+        replaces shared style commands by copies with the backgrounds applied
+        """
+        if self._sharedStyles or self._background != (0, None, None):
+            self._tableStyleCommands = list(self.getStyleCommands())
+            self._tableExtraStyleCommands = list(self._tableExtraStyleCommands)
+            self._background = (0, None, None)
+            self._styleIndex = None
+            self._sharedStyles = False
+
     def setFontSizeColor(self, size, color, row, col):
         """
         FONTSIZE (or SIZE)      - takes fontsize in points; leading may get out of sync.
@@ -221,6 +519,28 @@ class StyledTable(object):
             for t in self.tableData:
                 t.insert(0, "")
 
+    def setColumnarData(self, data, formatters=None, header=False, **kwargs):
+        """
+        Overwrites the table data with the columns of data.
+
+        The rows are kept as :class:`ColumnarRows`, so that cells are only
+        created for the rows which are laid out, e.g. for the parts of
+        :meth:`split_table_pages`.
+        If leftTablePadding is activated an empty column is put in front.
+
+        :param data: the new data
+        :type data: DataFrame, pyarrow.Table, numpy.ndarray or list of columns
+        :param formatters: ``%`` format strings or callables per column name or index
+        :type formatters: dict or list
+        :param header: if True, the column names are added with :meth:`addTableHeader`
+        :type header: bool
+        :param kwargs: passed to :meth:`addTableHeader`
+        """
+        rows = ColumnarRows(data, formatters, padding=self.leftTablePadding > 0)
+        self.tableData = rows
+        if header:
+            self.addTableHeader(list(rows.names), **kwargs)
+
     def addTableLine(self, line):
         """
         Adds a table line to data.
@@ -308,14 +628,17 @@ class StyledTable(object):
         Returns the number of rows/lines including header line.
 
         """
-        return len(self.tableData)
+        if self._view is not None:
+            header, start, stop = self._view
+            return len(header) + stop - start
+        return len(self._tableData)
 
     def colsCount(self):
         """
         Returns the number of columns.
 
         """
-        return len(self.tableData[0])
+        return len(self._row(0))
 
     def handleStyleCommands(self):
         """
@@ -323,10 +646,10 @@ class StyledTable(object):
 
         """
         tableStyle = getTableStyle()
-        for cmd in self.tableStyleCommands:
+        for cmd in self.getStyleCommands():
             if not len(cmd) == 0:
                 tableStyle.add(*cmd)
-        for cmd in self.tableExtraStyleCommands:
+        for cmd in self._tableExtraStyleCommands:
             if not len(cmd) == 0:
                 tableStyle.add(*cmd)
         return tableStyle
@@ -340,6 +663,15 @@ class StyledTable(object):
             self.tableData = [[""]]
         return self.layoutTable()
 
+    def tableRows(self):
+        """
+        Returns the table data as rows for reportlab's Table, the rows of
+        :class:`ColumnarRows` are created here.
+        """
+        if isinstance(self.tableData, ColumnarRows):
+            return [list(row) for row in self.tableData]
+        return self.tableData
+
     def layoutTable(self, hTableAlignment=None, colWidths=None):
         """
         Returns a table flowable with automatically estimated column width.
@@ -363,7 +695,7 @@ class StyledTable(object):
             ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'))
         if colWidths:
             colWidths = [x * cm for x in colWidths]
-        table = Table(self.tableData, colWidths=colWidths,
+        table = Table(self.tableRows(), colWidths=colWidths,
                          spaceBefore=0, spaceAfter=0)
         table.setStyle(self.handleStyleCommands())
         if hTableAlignment is not None:
@@ -410,7 +742,7 @@ class StyledTable(object):
         #            newColWidths.append(avail)
         if self.leftTablePadding > 0:
             expectedWidths.insert(0, self.leftTablePadding)
-        table = Table(self.tableData, colWidths=expectedWidths)
+        table = Table(self.tableRows(), colWidths=expectedWidths)
         table.setStyle(tableStyle)
         table.hAlign = hTableAlignment
         return table
@@ -480,32 +812,76 @@ class StyledTable(object):
             # NOTE returns the style table again
             return self
         else:
-            table = Table(self.tableData, colWidths=colWidthsResult,
+            table = Table(self.tableRows(), colWidths=colWidthsResult,
                             spaceBefore=self.spaceBefore * cm, spaceAfter=self.spaceAfter * cm)
             tableStyle = self.handleStyleCommands()
             table.setStyle(tableStyle)
             table.hAlign = self.hTableAlignment
             return table
 
-    def columnWidthEstim(self, data):
+    def columnWidthEstim(self, data, sample=None):
         """
         Returns minimum column width for all lines in the column.
 
+        The columns are estimated one by one, every distinct number or text
+        is measured once. With sample only that many evenly spaced lines and
+        the header line are measured, the widths may be underestimated then.
+
         :param data: the table data
         :type data: list of list
+        :param sample: maximum number of lines to measure, default is ``self.widthSample``
+        :type sample: int
 
         :returns: list of cell width estimations
         """
-        cell_widths = defaultdict(int)
+        if sample is None:
+            sample = self.widthSample
+        if sample and len(data) > sample:
+            step = len(data) / float(sample)
+            data = data[:self.headerRow] + [data[int(i * step)] for i in range(sample)]
+
+        if isinstance(data, ColumnarRows):
+            columns = data.iterColumns()
+        else:
+            columns = zip_longest(*data)
+        return [self.columnEstim(column) for column in columns]
 
-        for line in data:
-            for i, cell in enumerate(line):
-                cell_width_est = self.widthEstim(cell)
-                if cell_width_est > cell_widths[i]:
-                    cell_widths[i] = cell_width_est
+    def columnEstim(self, column):
+        """
+        Returns the largest width estimation of the cells in one column.
 
-        return [cell_widths[i] for i in range(len(list(cell_widths)))]
+        :param column: the cells of the column, None for missing cells
+        :type column: sequence
 
+        :returns: the estimated width
+        """
+        ints, floats, texts, others = [], [], set(), []
+        kinds = set(map(type, column))
+        if kinds == {str}:
+            texts = set(column)
+        elif kinds == {int}:
+            ints = list(column)
+        elif kinds == {float}:
+            floats = list(column)
+        else:
+            for cell in column:
+                kind = type(cell)
+                if kind is str:
+                    texts.add(cell)
+                elif kind is int:
+                    ints.append(cell)
+                elif isinstance(cell, float):
+                    floats.append(cell)
+                elif cell is not None:
+                    others.append(cell)
+
+        for numbers in (ints, floats):
+            if numbers:
+                texts.update(map(str, _uniqueNumbers(numbers)))
+        width = maxTextWidth(texts, self.font.fontName, self.fontsize)
+        for cell in others:
+            width = max(width, self.widthEstim(cell))
+        return width
 
     def widthEstim(self, obj, name="table"):
         """
@@ -521,14 +897,9 @@ class StyledTable(object):
         :returns: the estimated width
         """
         if isinstance(obj, (float, int)):
-            return int(
-                self.font.stringWidth("%s" % obj, self.fontsize))
+            return textWidth("%s" % obj, self.font.fontName, self.fontsize)
         elif isinstance(obj, str):
-            # print(obj,np.ceil(self.font.stringWidth(obj,self.fontsizes[name])))
-            largestStr = sorted(obj.split("\n"), key=lambda x: len(x))[-1]
-            # print(largestStr)
-            return int(
-                self.font.stringWidth(largestStr, self.fontsize))
+            return textWidth(obj, self.font.fontName, self.fontsize)
         elif isinstance(obj, Flowable):
             return obj.minWidth()
         elif obj is None:
@@ -559,19 +930,109 @@ class StyledTable(object):
         Returns
         -------
         tuple of StyledTable
-            Two new ``StyledTable`` instances containing the upper and
+            Two new ``StyledTable`` views containing the upper and
             lower part of the table.
         """
-        table_copy_up = copy.deepcopy(self)
-        table_copy_down = copy.deepcopy(self)
-        table_copy_down.tableData = self.tableData[n:]
-        table_copy_down.tableData.insert(0, self.tableData[0])
-        table_copy_up.tableData = self.tableData[0:n]
+        table_copy_up = self._part(*self._slice(0, n))
+        header, start, stop = self._slice(n, self.linesCount())
+        table_copy_down = self._part((self._row(0),) + header, start, stop)
         return table_copy_up, table_copy_down
 
+    def _row(self, i):
+        """
+        Returns row i without copying the rows of a view.
+        """
+        if self._view is None:
+            return self._tableData[i]
+        header, start, stop = self._view
+        if i < len(header):
+            return header[i]
+        return self._tableData[start + i - len(header)]
+
+    def _slice(self, i, j):
+        """
+        Returns (header rows, start, stop) of the rows i to j in _tableData.
+        """
+        if self._view is None:
+            header, start, stop = (), 0, len(self._tableData)
+        else:
+            header, start, stop = self._view
+        skip = len(header)
+        return (tuple(header[i:j]),
+                min(start + max(i - skip, 0), stop),
+                min(start + max(j - skip, 0), stop))
+
+    def _part(self, header, start, stop):
+        """
+        Returns a view of the rows header + _tableData[start:stop], sharing
+        rows and style commands with self.
+        """
+        if self._styleIndex is None:
+            # shared by all parts, the index is only built once
+            self._styleIndex = {}
+        part = copy.copy(self)
+        part._view = (header, start, stop)
+        part._sharedRows = part._sharedStyles = True
+        self._sharedRows = self._sharedStyles = True
+        return part
+
+
+    def getRowHeights(self, frameInfo):
+        """
+        Returns the heights of all rows, measured with one wrap of the table.
+
+        The rows are wrapped with the column widths of the whole table, a part
+        of the table gets the same row heights unless its columns are narrower.
+        Tables of :class:`ColumnarRows` are measured in parts of
+        ``measureRows`` rows, below the repeated first row.
+
+        :param frameInfo: frame used to calculate available width for wrapping
+        :type frameInfo: Frame
+
+        :returns: list of row heights
+        """
+        if self._view is None and isinstance(self._tableData, ColumnarRows):
+            # measure part by part, the cells are only created for one part
+            heights = []
+            for start in range(0, self.linesCount(), self.measureRows):
+                stop = min(start + self.measureRows, self.linesCount())
+                part = self.slice_rows(start, stop)
+                heights.extend(part.getRowHeights(frameInfo)[1 if start else 0:])
+            return heights
+
+        table = Table(self.tableRows() or [[""]], spaceBefore=0, spaceAfter=0)
+        # the style of as_flowable, without adding its commands to self
+        tableStyle = self.handleStyleCommands()
+        tableStyle.add('LEFTPADDING', (0, 0), (-1, -1), 0.1 * cm)
+        tableStyle.add('VALIGN', (0, 0), (-1, -1), 'BOTTOM')
+        table.setStyle(tableStyle)
+        table.wrap(frameInfo._aW, frameInfo._aH)
+        return list(table._rowHeights)
+
+    def fitRows(self, offsets, start, maxHeight, header=0):
+        """
+        Returns the end of the longest run of rows from start that fits maxHeight.
+
+        At least one row is taken, so that splitting always advances.
+
+        :param offsets: cumulative row heights, ``offsets[i]`` is the height of the first i rows
+        :type offsets: list
+        :param start: index of the first row of the run
+        :type start: int
+        :param maxHeight: the height that should not be exceeded
+        :type maxHeight: float
+        :param header: height of the repeated header row above the run
+        :type header: float
+
+        :returns: index after the last row of the run
+        """
+        end = bisect_right(offsets, offsets[start] + maxHeight - header) - 1
+        return min(max(end, start + 1), len(offsets) - 1)
 
     def split_table_iterative(self, frameInfo, availableHeight):
-        """Recursively split the table to fit ``availableHeight``.
+        """Split the table to fit ``availableHeight``.
+
+        The rows are measured once and the split row is found by bisection.
 
         Parameters
         ----------
@@ -586,42 +1047,150 @@ class StyledTable(object):
             Two ``StyledTable`` instances for the upper and lower parts.
         """
         maxHeight = availableHeight - self.spaceBefore * cm - self.spaceAfter * cm
-        n = len(self.tableData) - 1
+        offsets = [0] + list(accumulate(self.getRowHeights(frameInfo)))
+        n = min(self.fitRows(offsets, 0, maxHeight * 0.9), self.linesCount() - 1)
         table_copy_up, table_copy_down = self.split_table(n)
-        while table_copy_up.getTableHeight(frameInfo) > maxHeight * 0.9:
-            n -= 1
-            if n >= 1:
-                table_copy_up, table_copy_down = self.split_table(n)
-            else:
-                break
         table_copy_down.shift_background_styles(n-1)
         table_copy_up.snip_background_styles(n)
         return table_copy_up, table_copy_down
 
-    def shift_background_styles(self, n):
-        """Shift background style commands after splitting."""
-        out_styles = []
-        tableStyleCommands = []
-        for command in self.tableStyleCommands:
+    def split_table_pages(self, frameInfo, availableHeight, frameHeight=None):
+        """Split the table into parts that fit one frame each.
+
+        The first part fits ``availableHeight``, all following parts fit
+        ``frameHeight`` and start with the first row of the table as header.
+        The rows are measured once and all parts are cut in a single pass.
+
+        Parameters
+        ----------
+        frameInfo : Frame
+            Frame used to calculate available width for wrapping.
+        availableHeight : float
+            Vertical space left for the first part.
+        frameHeight : float, optional
+            Vertical space for the following parts, default is ``frameInfo._aH``.
+
+        Returns
+        -------
+        list of StyledTable
+            The parts of the table in order, ``[self]`` if it fits already.
+        """
+        if frameHeight is None:
+            frameHeight = frameInfo._aH
+        spacing = self.spaceBefore * cm + self.spaceAfter * cm
+        heights = self.getRowHeights(frameInfo)
+        offsets = [0] + list(accumulate(heights))
+        if offsets[-1] <= (availableHeight - spacing) * 0.9:
+            return [self]
+
+        end = self.fitRows(offsets, 0, (availableHeight - spacing) * 0.9)
+        parts = [self.slice_rows(0, end)]
+        while end < len(heights):
+            start = end
+            end = self.fitRows(offsets, start, (frameHeight - spacing) * 0.9,
+                               header=heights[0])
+            parts.append(self.slice_rows(start, end))
+        return parts
+
+    def slice_rows(self, start, stop):
+        """Returns a ``StyledTable`` view of the rows ``start`` to ``stop``.
+
+        Unless ``start`` is 0, the first row of the table is repeated as
+        header. Background styles are shifted and snipped like in
+        :meth:`split_table_iterative`.
+
+        Parameters
+        ----------
+        start : int
+            Index of the first row.
+        stop : int
+            Index after the last row.
+
+        Returns
+        -------
+        StyledTable
+        """
+        if start == 0:
+            part = self._part(*self._slice(0, stop))
+        else:
+            header, first, last = self._slice(start, stop)
+            part = self._part((self._row(0),) + header, first, last)
+            part.shift_background_styles(start - 1)
+        part.snip_background_styles(part.linesCount())
+        return part
+
+    def background_index(self):
+        """Returns the style commands indexed by their background rows.
+
+        That is the positions and the commands which are not backgrounds,
+        and the background commands as ``(row, position, command)`` sorted
+        by their first row, together with the list of those rows.
+        The index is shared with all parts of the table.
+        """
+        commands = self._tableStyleCommands
+        key = id(commands), len(commands)
+        if self._styleIndex is not None and key in self._styleIndex:
+            return self._styleIndex[key][1]
+
+        positions, others, backgrounds = [], [], []
+        for position, command in enumerate(commands):
             if command[0] == "BACKGROUND":
-                new_command = list(command)
-                new_command[1][1] -= n
-                new_command[2][1] -= n
-                if new_command[1][1] > 0 and new_command[2][1]> 0:
-                    tableStyleCommands.append(new_command)
+                backgrounds.append((command[1][1], position, command))
             else:
-                tableStyleCommands.append(command)
-        self.tableStyleCommands = tableStyleCommands
+                positions.append(position)
+                others.append(command)
+        backgrounds.sort(key=lambda background: background[:2])
+        index = positions, others, [row for row, _, _ in backgrounds], backgrounds
+        if self._styleIndex is not None:
+            # keep commands alive, so that its id is not reused
+            self._styleIndex[key] = commands, index
+        return index
+
+    def getStyleCommands(self):
+        """Returns the style commands with the background styles shifted and snipped.
+
+        The commands of a view are shared with the table it was cut from,
+        shifting and snipping only records the rows to keep, which are
+        applied here.
+        """
+        shift, low, high = self._background
+        if low is None and high is None:
+            return self._tableStyleCommands
+
+        positions, others, firstRows, backgrounds = self.background_index()
+        lo = 0 if low is None else bisect_right(firstRows, low)
+        hi = len(firstRows) if high is None else bisect_left(firstRows, high)
+        selected = sorted(
+            (position, command) for row, position, command in backgrounds[lo:hi]
+            if (low is None or command[2][1] > low) and
+            (high is None or command[2][1] < high))
+
+        # keep the order of all commands, only backgrounds out of range are left out
+        commands = []
+        i = 0
+        for position, command in selected:
+            j = bisect_left(positions, position)
+            commands.extend(others[i:j])
+            commands.append((command[0], (command[1][0], command[1][1] - shift),
+                             (command[2][0], command[2][1] - shift)) + tuple(command[3:]))
+            i = j
+        commands.extend(others[i:])
+        return commands
+
+    def shift_background_styles(self, n):
+        """Shift background style commands after splitting.
+
+        Background rows are moved up by ``n``, those above the second row are
+        dropped.
+        """
+        shift, low, high = self._background
+        shift += n
+        self._background = shift, shift if low is None else max(low, shift), high
 
     def snip_background_styles(self, n):
-        """Trim background style commands at split position."""
-        out_styles = []
-        tableStyleCommands = []
-        for command in self.tableStyleCommands:
-            if command[0] == "BACKGROUND":
-                if command[1][1] < n and command[2][1] < n:
-                    tableStyleCommands.append(command)
-                    # print(new_command)
-            else:
-                tableStyleCommands.append(command)
-        self.tableStyleCommands = tableStyleCommands
+        """Trim background style commands at split position.
+
+        Backgrounds reaching row ``n`` or below are dropped.
+        """
+        shift, low, high = self._background
+        self._background = shift, low, n + shift if high is None else min(high, n + shift)
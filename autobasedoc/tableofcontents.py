@@ -8,15 +8,67 @@ tableofcontents
 
 .. moduleauthor:: Johannes Eckstein
 
+The page numbers of an :class:`AutoTableOfContents` can be deferred: with
+:meth:`~AutoTableOfContents.deferPages` each page number is drawn as a
+reference to a form, which :meth:`~AutoTableOfContents.drawDeferredPages`
+defines once the pages of the entries are known. Together with entries
+predicted before the build, the document is laid out only once.
 """
+from itertools import count
+
 from reportlab import rl_config
-from reportlab.platypus import Table, Paragraph, PageBreak
+from reportlab.platypus import Table, Paragraph, PageBreak, Spacer
 from reportlab.platypus.tableofcontents import TableOfContents, drawPageNumbers
 
+from autobasedoc import next_id
+
 class AutoTableOfContents(TableOfContents):
 
+    _ids = count(0)
+    _deferred = None
+
     def __init__(self):
         super(AutoTableOfContents, self).__init__()
+        self._id = next_id(AutoTableOfContents)
+
+    def beforeBuild(self):
+        """
+        a pass of multiBuild draws the page numbers of the last pass
+        """
+        self._deferred = None
+        super(AutoTableOfContents, self).beforeBuild()
+
+    def deferPages(self, entries):
+        """
+        lays out the table with entries, given as (level, text, key),
+        and draws the page numbers when :meth:`drawDeferredPages` is called
+        """
+        self._lastEntries = [(level, text, 0, key) for level, text, key in entries]
+        self.clearEntries()
+        self._deferred = {}
+
+    def predicted(self):
+        """
+        returns True if the entries of the build are the deferred ones
+        """
+        return ([entry[:2] + entry[3:] for entry in self._entries] ==
+                [entry[:2] + entry[3:] for entry in self._lastEntries])
+
+    def drawDeferredPages(self, canvas):
+        """
+        defines the forms of the deferred page numbers on canvas
+        and stops deferring
+        """
+        for name, (index, style, dot, x, y, availWidth, availHeight) in sorted(self._deferred.items()):
+            page = self._entries[index][2]
+            if self.formatter: page = self.formatter(page)
+            canvas.beginForm(name, -availWidth, y - 2 * style.leading,
+                             2 * availWidth, y + 2 * style.leading)
+            canvas._curr_tx_info = {'cur_x': x, 'cur_y': y}
+            drawPageNumbers(canvas, style, [(page, None)], availWidth, availHeight, dot)
+            canvas.endForm()
+        self._lastEntries = self._entries[:]
+        self._deferred = None
 
     def wrap(self, availWidth, availHeight):
         "All table properties should be known by now."
@@ -33,25 +85,37 @@ class AutoTableOfContents(TableOfContents):
         def drawTOCEntryEnd(canvas, kind, label):
             '''Callback to draw dots and page numbers after each entry.'''
             label = label.split(',')
-            page, level, key = int(label[0]), int(label[1]), eval(label[2],{})
+            page, level, key, index = int(label[0]), int(label[1]), eval(label[2],{}), int(label[3])
             style = self.getLevelStyle(level)
             if self.dotsMinLevel >= 0 and level >= self.dotsMinLevel:
                 dot = ' . '
             else:
                 dot = ''
+            if self._deferred is not None:
+                name = 'abdToc%dPage%d' % (self._id, index)
+                x, y = canvas._curr_tx_info['cur_x'], canvas._curr_tx_info['cur_y']
+                self._deferred[name] = index, style, dot, x, y, availWidth, availHeight
+                canvas.doForm(name)
+                if key:
+                    canvas.linkRect('', key, (x, y, availWidth, y + style.leading), relative=1)
+                return
             if self.formatter: page = self.formatter(page)
             drawPageNumbers(canvas, style, [(page, key)], availWidth, availHeight, dot)
-        self.canv.drawTOCEntryEnd = drawTOCEntryEnd
+        if hasattr(self.canv, 'setNamedCB'):
+            # reportlab 4 looks up onDraw callbacks by name only
+            self.canv.setNamedCB('drawTOCEntryEnd', drawTOCEntryEnd)
+        else:
+            self.canv.drawTOCEntryEnd = drawTOCEntryEnd
 
         tableData = []
-        for (level, text, pageNum, key) in _tempEntries:
+        for index, (level, text, pageNum, key) in enumerate(_tempEntries):
             style = self.getLevelStyle(level)
             if key:
                 text = '<a href="#%s">%s</a>' % (key, text)
                 keyVal = repr(key).replace(',','\\x2c').replace('"','\\x2c')
             else:
                 keyVal = None
-            para = Paragraph('%s<onDraw name="drawTOCEntryEnd" label="%d,%d,%s"/>' % (text, pageNum, level, keyVal), style)
+            para = Paragraph('%s<onDraw name="drawTOCEntryEnd" label="%d,%d,%s,%d"/>' % (text, pageNum, level, keyVal, index), style)
             if style.spaceBefore:
                 tableData.append([Spacer(1, style.spaceBefore),])
             tableData.append([para,])
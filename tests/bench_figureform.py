@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark for figures drawn as forms against figures saved to PDF
+
+draws a line plot and a scatter plot with n points in both ways and prints
+the time to create the flowable, the time to draw it on a canvas and save
+the document, and the size of the document::
+
+    python tests/bench_figureform.py 10000 100000 1000000
+"""
+import os
+import sys
+import time
+from io import BytesIO
+
+__root__ = os.path.dirname(__file__)
+
+importpath = os.path.realpath(os.path.join(__root__, "../"))
+
+sys.path.append(importpath)
+
+import numpy as np
+
+from reportlab.pdfgen import canvas
+
+import autobasedoc.autoplot as ap
+from autobasedoc.pdfimage import PdfImage, xobj_cache
+from autobasedoc.figureform import FigureForm
+
+
+def makeFigure(kind, points):
+    """
+    returns a figure with a line or a scatter plot of points points
+    """
+    rng = np.random.RandomState(0)
+    fig, ax = ap.plt.subplots(figsize=(6, 3))
+    x = np.linspace(0, 1, points)
+    y = np.cumsum(rng.randn(points))
+    if kind == "line":
+        ax.plot(x, y, lw=0.5)
+    else:
+        ax.plot(x, y, ".", ms=1)
+    ax.set_title("%d points" % points)
+    return fig
+
+
+def savedPdfImage(fig):
+    """
+    the fallback path: save the figure to PDF and parse it again
+    """
+    imgax = BytesIO()
+    fig.savefig(imgax, format='PDF')
+    return PdfImage(imgax)
+
+
+def measure(fig, factory):
+    """
+    returns (create seconds, draw and save seconds, bytes)
+    """
+    start = time.perf_counter()
+    img = factory(fig)
+    created = time.perf_counter()
+
+    out = BytesIO()
+    canv = canvas.Canvas(out, invariant=1)
+    img.drawOn(canv, 0, 0)
+    canv.showPage()
+    canv.save()
+    return created - start, time.perf_counter() - created, len(out.getvalue())
+
+
+def main(counts):
+    print("%8s %8s %8s %10s %10s %12s" % ("path", "plot", "points",
+                                         "create", "draw+save", "bytes"))
+    # every figure is new, the cache would only hold on to memory
+    xobj_cache().resize(0)
+    for points in counts:
+        for kind in ("line", "scatter"):
+            fig = makeFigure(kind, points)
+            for name, factory in (("pdf", savedPdfImage), ("form", FigureForm)):
+                create, draw, size = measure(fig, factory)
+                print("%8s %8s %8d %10.3f %10.3f %12d" % (name, kind, points,
+                                                          create, draw, size))
+            ap.plt.close(fig)
+
+
+if __name__ == "__main__":
+
+    main([int(x) for x in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark for the time to import autobasedoc
+
+imports the given modules in fresh processes and prints the fastest import
+time of each, with the modules of the heavy dependencies it loaded.
+autobasedoc.autorpt must load neither matplotlib nor svglib or img2pdf, they
+are imported on first use of the plotting and SVG functions. The script
+exits with 1 if an import takes longer than the budget or autorpt loads
+one of them::
+
+    python tests/bench_import.py
+    python tests/bench_import.py --budget 400 autobasedoc.autorpt autobasedoc.autoplot
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+__root__ = os.path.dirname(__file__)
+
+importpath = os.path.realpath(os.path.join(__root__, "../"))
+
+heavy = ["matplotlib", "matplotlib.pyplot", "svglib", "img2pdf", "numpy", "pdfrw"]
+
+# modules autorpt must not load
+lazy = ["matplotlib", "svglib", "img2pdf"]
+
+script = """
+import sys, time, json
+start = time.perf_counter()
+import %s
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [name for name in %r if name in sys.modules]]))
+"""
+
+
+def measure(module, repeat):
+    """
+    returns the fastest import time of module in a new process
+    and the heavy modules it loaded
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([importpath] + [p for p in [
+        env.get("PYTHONPATH")] if p])
+    best = None
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c",
+                                          script % (module, heavy)], env=env)
+        seconds, loaded = json.loads(output.decode().splitlines()[-1])
+        if best is None or seconds < best[0]:
+            best = seconds, loaded
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("modules", nargs="*",
+                        default=["autobasedoc.autorpt", "autobasedoc.autoplot"])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="imports per module, the fastest one counts")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="milliseconds the import of autorpt may take")
+    args = parser.parse_args(argv)
+
+    failed = False
+    print("%24s %10s  %s" % ("module", "ms", "loaded"))
+    for module in args.modules:
+        seconds, loaded = measure(module, args.repeat)
+        status = ""
+        if module == "autobasedoc.autorpt":
+            eager = [name for name in lazy if name in loaded]
+            if eager:
+                status = " imports %s" % ", ".join(eager)
+            if args.budget is not None and 1000 * seconds > args.budget:
+                status += " over the budget of %.0f ms" % args.budget
+            failed = failed or bool(status)
+        print("%24s %10.1f  %s%s" % (module, 1000 * seconds, " ".join(loaded), status))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
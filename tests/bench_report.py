@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark for the generation of whole reports
+
+builds synthetic documents of about the given page counts and prints the
+wall time, the peak resident memory and the size of the output per
+document. The documents are
+
+* text: paragraphs with headings and a table of contents
+* table: StyledTables of 200 rows
+* plot: figures of autoPdfImg, three per page
+* pageinfo: text with three headers and three footers with page numbers
+* columns: text on later pages of two columns, see getMultiColumnTemplate
+
+Every document is built ``--repeat`` times, each time in a process of its
+own so that the peak memory is the one of that document, and the fastest
+build counts. The documents are built with ``invariant=1`` and the same
+content in every run, their sizes only change with the code. With
+``--incremental`` the pages are written while they are laid out, see
+:mod:`autobasedoc.incremental`, these results are compared with their own
+baseline entries.
+
+The results are compared with a baseline, ``bench_report_baseline.json`` next
+to this file by default, and the script exits with 1 if a document took more
+time, memory or bytes than the baseline and the tolerance allow. ``--save``
+stores the results as the baseline instead. The baseline in the repository
+is a reference for the default page counts, its sizes in bytes hold on every
+machine, but times and memory are only comparable on the same machine. So
+the first run on a machine, and the first one after checking out the code
+to compare with, is the one with ``--save``. Without a baseline file the
+script exits with 2, documents without a baseline entry are marked
+``no baseline``::
+
+    python tests/bench_report.py --save 10 100 1000
+    python tests/bench_report.py 10 100 1000
+    python tests/bench_report.py --kinds text,table 10000
+    python tests/bench_report.py --incremental 10 100 1000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+__root__ = os.path.dirname(__file__)
+
+importpath = os.path.realpath(os.path.join(__root__, "../"))
+
+sys.path.append(importpath)
+
+kinds = ["text", "table", "plot", "pageinfo", "columns"]
+
+defaultBaseline = os.path.join(__root__, "bench_report_baseline.json")
+
+# measures compared with the baseline
+measures = ("seconds", "rss", "bytes")
+
+words = ("report layout frame page table figure value result measurement "
+         "analysis sample series average deviation section summary").split()
+
+# paragraphs of 60 words per page, about as many as fit on a page of A4,
+# twice as many on the pages of two columns
+paragraphsPerPage = {"text": 14, "pageinfo": 14, "columns": 28}
+
+# rows of a StyledTable per page
+rowsPerPage = 42
+
+figuresPerPage = 3
+
+
+def sentence(rng, count=60):
+    return " ".join(rng.choice(words) for _ in range(count)).capitalize() + "."
+
+
+def textStory(ar, styles, pages, rng, kind="text"):
+    """
+    returns pages of paragraphs, a chapter of ten pages each
+    """
+    story = [ar.AutoTableOfContents()]
+    for page in range(pages):
+        if page % 10 == 0:
+            story.extend(ar.doHeading("Chapter %d" % (page // 10 + 1), styles.h1))
+        story.extend(ar.Paragraph(sentence(rng), styles.normal)
+                     for _ in range(paragraphsPerPage[kind]))
+    return story
+
+
+def tableStory(ar, styles, pages, rng, kind="table"):
+    """
+    returns tables of 200 rows, rowsPerPage rows per page
+    """
+    story = []
+    rows = pages * rowsPerPage
+    for start in range(0, rows, 200):
+        table = ar.StyledTable(gridded=True)
+        for row in range(start, min(rows, start + 200)):
+            table.addTableLine([row, rng.choice(words), "%.3f" % rng.random(),
+                                rng.randint(0, 10**6)])
+        table.addTableHeader(["row", "word", "value", "count"])
+        story.append(table.as_flowable)
+    return story
+
+
+def plotStory(ar, styles, pages, rng, kind="plot"):
+    """
+    returns figures with a caption, figuresPerPage per page
+    """
+    import autobasedoc.autoplot as ap
+
+    @ap.autoPdfImg
+    def benchFigure(seed):
+        figureRng = random.Random(seed)
+        fig, ax = ap.subplots(figsize=(6, 3))
+        ax.plot([figureRng.random() for _ in range(200)], lw=0.5)
+        ax.set_title("figure %d" % seed)
+        return fig
+
+    story = []
+    for figure in range(figuresPerPage * pages):
+        story.append(benchFigure(figure))
+        story.append(ar.Paragraph("Figure %d" % figure, styles.normal))
+    return story
+
+
+def pageInfos(doc):
+    for pos in "lcr":
+        doc.addPageInfo(typ="header", pos=pos, text="Header %s" % pos,
+                        frame="Later", line=pos == "c")
+        doc.addPageInfo(typ="footer", pos=pos, text="Page ", frame="Later",
+                        addPageNumber=True, line=pos == "c")
+
+
+def makeDoc(ar, kind, filename, incremental=False):
+    """
+    returns the document template of kind
+    """
+    doc = ar.AutoDocTemplate(filename, invariant=1, incremental=incremental,
+                             onFirstPage=(ar.drawFirstPortrait, 0),
+                             onLaterPages=(ar.drawLaterPortrait,
+                                           2 if kind == "columns" else 0),
+                             title="bench_report %s" % kind)
+    if kind == "pageinfo":
+        pageInfos(doc)
+    return doc
+
+
+stories = {"text": textStory, "table": tableStory, "plot": plotStory,
+           "pageinfo": textStory, "columns": textStory}
+
+
+def run(kind, pages, incremental=False):
+    """
+    builds the document of kind with about pages pages in this process,
+    returns its measures
+    """
+    import autobasedoc.autorpt as ar
+
+    styles = ar.Styles()
+    styles.registerStyles()
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "%s.pdf" % kind)
+        start = time.perf_counter()
+        doc = makeDoc(ar, kind, filename, incremental)
+        doc.multiBuild(stories[kind](ar, styles, pages, random.Random(0), kind))
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(filename)
+
+    rss = None
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        if sys.platform != "darwin":
+            rss *= 1024
+    return {"pages": doc.page, "seconds": seconds, "rss": rss, "bytes": size}
+
+
+def runApart(kind, pages, repeat=1, incremental=False):
+    """
+    runs kind repeat times in new processes, returns the measures
+    of the fastest run
+    """
+    results = []
+    command = [sys.executable, os.path.abspath(__file__), "--run", kind, str(pages)]
+    if incremental:
+        command.append("--incremental")
+    for _ in range(repeat):
+        output = subprocess.check_output(command)
+        results.append(json.loads(output.decode().splitlines()[-1]))
+    return min(results, key=lambda result: result["seconds"])
+
+
+def compare(result, base, tolerance):
+    """
+    returns the measures of result exceeding base by more than tolerance
+    """
+    worse = []
+    for measure in measures:
+        if result.get(measure) is None or base.get(measure) is None:
+            continue
+        if result[measure] > base[measure] * (1 + tolerance):
+            worse.append(measure)
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("counts", type=int, nargs="*", default=[10, 100, 1000],
+                        help="page counts of the documents")
+    parser.add_argument("--kinds", default=",".join(kinds),
+                        help="comma separated kinds of documents, of %s" % ", ".join(kinds))
+    parser.add_argument("--baseline", default=defaultBaseline,
+                        help="the baseline file")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the baseline")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="builds per document, the fastest one counts")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative increase of a measure counted as regression")
+    parser.add_argument("--incremental", action="store_true",
+                        help="write the pages while they are laid out")
+    parser.add_argument("--run", nargs=2, metavar=("KIND", "PAGES"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        print(json.dumps(run(args.run[0], int(args.run[1]), args.incremental)))
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.save:
+        print("no baseline %s, store one with --save first" % args.baseline)
+        return 2
+
+    print("%10s %8s %8s %10s %10s %12s  %s" % ("kind", "pages", "built", "seconds",
+                                               "rss[MB]", "bytes", "baseline"))
+    results = dict(baseline) if args.save else {}
+    regressions = []
+    missing = []
+    for kind in args.kinds.split(","):
+        for pages in args.counts:
+            name = "%s/%d" % (kind, pages)
+            if args.incremental:
+                name += "/incremental"
+            result = results[name] = runApart(kind, pages, args.repeat, args.incremental)
+            base = baseline.get(name)
+            if base is None:
+                status = "no baseline"
+                if not args.save:
+                    missing.append(name)
+            else:
+                worse = compare(result, base, args.tolerance)
+                status = ("worse " + ",".join(worse)) if worse else "ok"
+                if worse:
+                    regressions.append(name)
+                status += " (%.3fs)" % base["seconds"]
+            print("%10s %8d %8d %10.3f %10s %12d  %s" % (
+                kind, pages, result["pages"], result["seconds"],
+                "-" if result["rss"] is None else "%.1f" % (result["rss"] / 2.**20),
+                result["bytes"], status))
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print("baseline saved to %s" % args.baseline)
+        return 0
+    if missing:
+        print("no baseline for %s, store it with --save" % ", ".join(missing))
+    if regressions:
+        print("regressions: %s" % ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
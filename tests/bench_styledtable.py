@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark for splitting large StyledTables across frames
+
+paginates tables of growing length and prints the time per row. Splitting
+with one measurement of the rows scales linearly, the 'naive' mode (one
+row less and one fresh wrap per step, as split_table_iterative did before)
+is quadratic and only run up to 500 rows. The 'measure' column is the one
+wrap of the whole table, it grows slightly faster than linear since
+reportlab looks up every row in a list while sizing a Table. The 'split'
+column is the time of one split_table call in the middle of the table,
+which does not depend on the size of the table::
+
+    python tests/bench_styledtable.py 500 1000 2000 5000 10000
+"""
+import os
+import sys
+import copy
+import time
+
+__root__ = os.path.dirname(__file__)
+
+importpath = os.path.realpath(os.path.join(__root__, "../"))
+
+sys.path.append(importpath)
+
+from reportlab.platypus import Frame
+from reportlab.lib.units import cm
+
+from test_styledtable import makeTable
+
+naiveLimit = 500
+
+
+def naiveSplitTable(table, n):
+    """
+    the former split_table, copying the whole table twice
+    """
+    table_copy_up = copy.deepcopy(table)
+    table_copy_down = copy.deepcopy(table)
+    table_copy_down.tableData = table.tableData[n:]
+    table_copy_down.tableData.insert(0, table.tableData[0])
+    table_copy_up.tableData = table.tableData[0:n]
+    return table_copy_up, table_copy_down
+
+
+def naiveSplit(table, frameInfo, availableHeight):
+    """
+    the former split_table_iterative
+    """
+    maxHeight = availableHeight - table.spaceBefore * cm - table.spaceAfter * cm
+    n = len(table.tableData) - 1
+    table_copy_up, table_copy_down = naiveSplitTable(table, n)
+    while table_copy_up.getTableHeight(frameInfo) > maxHeight * 0.9:
+        n -= 1
+        if n >= 1:
+            table_copy_up, table_copy_down = naiveSplitTable(table, n)
+        else:
+            break
+    table_copy_down.shift_background_styles(n-1)
+    table_copy_up.snip_background_styles(n)
+    return table_copy_up, table_copy_down
+
+
+def paginate(table, frameInfo, naive=False):
+    """
+    returns the parts of table, one per frame
+    """
+    if not naive:
+        return table.split_table_pages(frameInfo, frameInfo._aH)
+
+    parts = []
+    while table.getTableHeight(frameInfo) > frameInfo._aH * 0.9:
+        up, table = naiveSplit(table, frameInfo, frameInfo._aH)
+        parts.append(up)
+    return parts + [table]
+
+
+def main(counts):
+    frame = Frame(0, 0, 17 * cm, 25 * cm)
+    print("%8s %8s %8s %10s %10s %12s %10s" % ("mode", "rows", "parts", "measure",
+                                              "seconds", "ms/row", "split[us]"))
+    for naive in (False, True):
+        for rows in counts:
+            if naive and rows > naiveLimit:
+                continue
+            table = makeTable(rows)
+            start = time.perf_counter()
+            table.getRowHeights(frame)
+            measure = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parts = paginate(table, frame, naive=naive)
+            seconds = time.perf_counter() - start
+
+            splitter = naiveSplitTable if naive else type(table).split_table
+            start = time.perf_counter()
+            for i in range(100):
+                splitter(table, rows // 2)
+            split = (time.perf_counter() - start) / 100
+            print("%8s %8d %8d %10.3f %10.3f %12.3f %10.1f" % (
+                "naive" if naive else "bisect", rows, len(parts), measure,
+                seconds, 1000 * seconds / rows, 1e6 * split))
+
+
+if __name__ == "__main__":
+
+    main([int(x) for x in sys.argv[1:]] or [500, 1000, 2000, 5000, 10000])
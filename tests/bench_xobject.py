@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark for header logos drawn on every page
+
+builds documents with a PdfImage logo in the header of every page and prints
+build time and file size per page count. With every logo emitted once per
+document the bytes per page stay flat as the page count grows, while the
+'naive' mode (one freshly parsed logo per page, as before the XObject cache and the
+form registry)
+grows by the size of the logo on every page::
+
+    python tests/bench_xobject.py 10 100 1000
+"""
+import os
+import sys
+import time
+from io import BytesIO
+
+__root__ = os.path.dirname(__file__)
+
+importpath = os.path.realpath(os.path.join(__root__, "../"))
+
+sys.path.append(importpath)
+
+from pdfrw.toreportlab import makerl
+
+import autobasedoc.autorpt as ar
+from autobasedoc.autorpt import base_fonts, addPlugin
+from autobasedoc.pdfimage import PdfImage, xobj_cache, convert_px_to_pdf_image_obj
+
+logo_path = os.path.join(__root__, "grafics", "color_logo.png")
+
+
+def drawFirstPage(canv, doc):
+    """
+    first page with header and footer
+    """
+    canv.saveState()
+    frame, pagesize = doc.getFrame(doc.template_id)
+    canv.setPageSize(pagesize)
+    canv.setFont(base_fonts()["normal"], doc.fontSize)
+    addPlugin(canv, doc, frame=frame)
+    canv.restoreState()
+
+
+def drawLaterPage(canv, doc):
+    """
+    later pages with header and footer
+    """
+    canv.saveState()
+    frame, pagesize = doc.getFrame(doc.template_id)
+    canv.setPageSize(pagesize)
+    canv.setFont(base_fonts()["normal"], doc.fontSize)
+    addPlugin(canv, doc, frame=frame)
+    canv.restoreState()
+
+
+class NaivePdfImage(PdfImage):
+    """
+    a logo that is parsed again for every page and drawn without the registry
+    """
+
+    def drawOn(self, canv, x, y, _sW=0):
+        fresh = PdfImage(convert_px_to_pdf_image_obj(logo_path),
+                         width=self.drawWidth, height=self.drawHeight)
+        canv.saveState()
+        canv.translate(x, y)
+        canv.scale(fresh.drawWidth / fresh._w, fresh.drawHeight / fresh._h)
+        canv.doForm(makerl(canv, fresh.xobj))
+        canv.restoreState()
+
+
+def buildReport(pages, naive=False):
+    """
+    returns (seconds, bytes) for a report with pages pages
+    """
+    out = BytesIO()
+    doc = ar.AutoDocTemplate(out,
+                             onFirstPage=(drawFirstPage, 0),
+                             onLaterPages=(drawLaterPage, 0))
+    logoClass = NaivePdfImage if naive else PdfImage
+    for frame in ("First", "Later"):
+        logo = logoClass(convert_px_to_pdf_image_obj(logo_path),
+                         width=2 * ar.cm, height=1 * ar.cm)
+        doc.addPageInfo(typ="header", pos="r", image=logo, frame=frame)
+        doc.addPageInfo(typ="footer", pos="c", text="Page ",
+                        addPageNumber=True, frame=frame)
+
+    styles = ar.Styles()
+    styles.registerStyles()
+    story = []
+    for page in range(pages):
+        story.append(ar.Paragraph("page %d" % page, styles.normal))
+        story.append(ar.PageBreak())
+
+    start = time.perf_counter()
+    doc.build(story)
+    return time.perf_counter() - start, len(out.getvalue())
+
+
+def main(counts):
+    print("%8s %8s %10s %12s %12s" % ("mode", "pages", "seconds", "bytes", "bytes/page"))
+    maxsize = xobj_cache().maxsize
+    for naive in (False, True):
+        # the naive mode reproduces the old behaviour: no cache, no registry
+        xobj_cache().resize(0 if naive else maxsize)
+        for pages in counts:
+            xobj_cache().clear()
+            seconds, size = buildReport(pages, naive=naive)
+            print("%8s %8d %10.3f %12d %12.1f" % ("naive" if naive else "shared",
+                                                 pages, seconds, size,
+                                                 size / float(pages)))
+
+
+if __name__ == "__main__":
+
+    main([int(x) for x in sys.argv[1:]] or [10, 100, 1000])
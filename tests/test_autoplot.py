@@ -7,7 +7,14 @@ Created on Wed Oct 14 16:50:28 2015
 import numpy as np
 import os
 import sys
+import shutil
+import tempfile
 import unittest
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from reportlab.pdfgen import canvas
 
 __root__ = os.path.dirname(__file__)
 
@@ -22,6 +29,7 @@ import autobasedoc.autorpt as ar
 import autobasedoc.autoplot as ap
 from autobasedoc.autorpt import addPlugin
 from autobasedoc import _baseFontNames
+import autobasedoc.figureform as figureform
 
 fpath = os.path.join(ar.__font_dir__, 'calibri.ttf')
 font = ap.ft2font.FT2Font(fpath)
@@ -392,6 +400,259 @@ class Test_AutoBaseDoc(unittest.TestCase):
         self.doc.multiBuild(self.contents)
 
 
+plotCalls = []
+
+
+@ap.autoPdfImg
+def sizedFigure(width, data=(3, 1, 2)):  #[inch]
+    plotCalls.append(width)
+    fig, ax = ap.plt.subplots(figsize=(width, 2))
+    ax.plot(data)
+    return fig
+
+
+@ap.autoPdfImage
+def sizedLegendFigure(width):  #[inch]
+    fig, ax = ap.plt.subplots(figsize=(width, 2))
+    ax.plot([1, 2, 3], [3, 1, 2], label="legendlabel")
+    handles, labels = ax.get_legend_handles_labels()
+    leg_fig = ap.plt.figure(figsize=(width, 0.5))
+    leg = leg_fig.legend(handles, labels, loc='center', frameon=False)
+    return fig, leg_fig, leg
+
+
+@ap.autoPdfImg
+def hatchedFigure(width):  #[inch]
+    fig, ax = ap.plt.subplots(figsize=(width, 2))
+    ax.bar([1, 2, 3], [3, 1, 2], hatch="//")
+    return fig
+
+
+class Test_FigureForm(unittest.TestCase):
+    """
+    figures are drawn as forms without a PDF round-trip
+    """
+
+    def setUp(self):
+        ap.figureForms = True
+
+    def tearDown(self):
+        ap.figureForms = False
+
+    def test_sameSize(self):
+        img = sizedFigure(3)
+        ap.figureForms = False
+        ref = sizedFigure(3)
+
+        self.assertIsInstance(img, ap.FigureForm)
+        self.assertNotIsInstance(ref, ap.FigureForm)
+        self.assertEqual((img._w, img._h), (ref._w, ref._h))
+
+    def test_pathOperators(self):
+        path = ap.matplotlib.path.Path([(0, 0), (1, 2), (3, 1), (0, 0)], [1, 2, 2, 79])
+        transform = ap.matplotlib.transforms.Affine2D().scale(10.5)
+        operators = figureform.path_operators(path, transform)
+
+        # without matplotlib's private convert_to_string
+        convert, figureform.convert_to_string = figureform.convert_to_string, None
+        try:
+            self.assertEqual(figureform.path_operators(path, transform), operators)
+        finally:
+            figureform.convert_to_string = convert
+
+    def test_optIn(self):
+        ap.figureForms = False
+        self.assertNotIsInstance(sizedFigure(2), ap.FigureForm)
+
+    def test_pdfImage(self):
+        img = sizedFigure(3)
+        ap.figureForms = False
+        ref = sizedFigure(3)
+
+        # page and xobj are read from the figure saved to PDF on demand
+        self.assertIsNone(img._xobj)
+        self.assertEqual([float(v) for v in img.page.inheritable.MediaBox],
+                         [float(v) for v in ref.page.inheritable.MediaBox])
+        self.assertEqual([float(v) for v in img.xobj.BBox],
+                         [float(v) for v in ref.xobj.BBox])
+
+    def test_oneFormPerDocument(self):
+        img = sizedFigure(2, data=np.random.rand(1000))
+        img1, leg = sizedLegendFigure(2)
+
+        canv = canvas.Canvas(BytesIO())
+        for page in range(3):
+            img.drawOn(canv, 0, 0)
+            img1.drawOn(canv, 0, 200)
+            leg.drawOn(canv, 0, 400)
+            canv.showPage()
+
+        self.assertEqual(len(canv._doc._autobasedoc_forms), 3)
+
+    def test_fallback(self):
+        self.assertNotIsInstance(hatchedFigure(2), ap.FigureForm)
+
+    def test_build(self):
+        story = [sizedFigure(width) for width in (4, 2)]
+        doc = ar.AutoDocTemplate(BytesIO(),
+                                 onFirstPage=(ar.drawFirstPortrait, 0),
+                                 onLaterPages=(ar.drawLaterPortrait, 0))
+        doc.build(story)
+
+
+class Test_FigurePool(unittest.TestCase):
+    """
+    figures rendered in worker processes keep the story order
+    """
+
+    def test_poolFigures(self):
+        widths = [4, 2, 3, 1]
+        with ap.FigurePool(processes=2, maxtasksperchild=1):
+            story = [sizedFigure(width) for width in widths]
+            img, leg = sizedLegendFigure(5)
+
+            self.assertTrue(all(isinstance(f, ap.FuturePdfImage) for f in story))
+
+            story += [img, leg]
+
+            doc = ar.AutoDocTemplate(BytesIO(),
+                                     onFirstPage=(ar.drawFirstPortrait, 0),
+                                     onLaterPages=(ar.drawLaterPortrait, 0))
+            doc.build(story[:])
+
+        ap.resolveFigures(story)
+        self.assertTrue(all(isinstance(f, ap.PdfImage) for f in story))
+        self.assertEqual([f._w / 72. for f in story[:4]], widths)
+        self.assertEqual(story[4]._w / 72., 5)
+
+
+@ap.autoPdfImg
+def objectFigure(seed):  #[inch]
+    rng = np.random.RandomState(seed)
+    fig, ax = ap.subplots(figsize=(3, 2))
+    ax.plot(rng.randn(200).cumsum(), lw=0.5)
+    ax.set_title("figure %d" % seed)
+    return fig
+
+
+class Test_ObjectOriented(unittest.TestCase):
+    """
+    figures of ap.figure and ap.subplots are rendered without pyplot
+    """
+
+    def setUp(self):
+        ap.figureForms = True
+
+    def tearDown(self):
+        ap.figureForms = False
+
+    def test_threads(self):
+        figures = ap.plt.get_fignums()
+        serial = [objectFigure(seed)._renderer.ops for seed in range(12)]
+        with ThreadPoolExecutor(4) as pool:
+            threaded = [img._renderer.ops for img in pool.map(objectFigure, range(12))]
+
+        self.assertEqual(threaded, serial)
+        self.assertEqual(ap.plt.get_fignums(), figures)
+
+    def test_closesOwnFigures(self):
+        other = ap.plt.figure()
+        try:
+            sizedFigure(2)
+            self.assertEqual(ap.plt.get_fignums(), [other.number])
+        finally:
+            ap.plt.close(other)
+
+    def test_withoutPyplot(self):
+        code = """
+import sys
+sys.path.insert(0, %r)
+import autobasedoc.autoplot as ap
+
+@ap.autoPdfImg
+def plot(width):
+    fig, ax = ap.subplots(figsize=(width, 2))
+    ax.bar([1, 2, 3], [3, 1, 2], hatch="//")
+    ax.plot([1, 2, 3])
+    return fig
+
+ap.figureForms = True
+plot(2)
+ap.figureForms = False
+plot(3)
+print("matplotlib.pyplot" in sys.modules)
+""" % importpath
+        output = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(output.decode().split()[-1], "False")
+
+
+class Test_FigureCache(unittest.TestCase):
+    """
+    figures are only rendered once for the same arguments
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        del plotCalls[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cacheHit(self):
+        with ap.FigureCache(self.tmpdir) as cache:
+            img1 = sizedFigure(3, data=np.arange(5.))
+            img2 = sizedFigure(3, data=np.arange(5.))
+            img3 = sizedFigure(2)
+            img, leg = sizedLegendFigure(2)
+            img, leg = sizedLegendFigure(2)
+
+        self.assertEqual(len(plotCalls), 2)
+        self.assertEqual(img1._w, img2._w)
+        self.assertIsInstance(leg, ap.PdfImage)
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 3)
+        self.assertEqual(stats["entries"], 4)
+
+    def test_persistent(self):
+        with ap.FigureCache(self.tmpdir):
+            sizedFigure(2)
+        with ap.FigureCache(self.tmpdir) as cache:
+            sizedFigure(2)
+
+        self.assertEqual(plotCalls, [2])
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_invalidate(self):
+        with ap.FigureCache(self.tmpdir) as cache:
+            sizedFigure(2)
+            sizedLegendFigure(2)
+            cache.invalidate(sizedFigure)
+            sizedFigure(2)
+
+        self.assertEqual(plotCalls, [2, 2])
+        self.assertEqual(cache.stats()["entries"], 3)
+
+    def test_eviction(self):
+        with ap.FigureCache(self.tmpdir, maxbytes=1) as cache:
+            sizedFigure(1)
+            sizedFigure(2)
+
+        stats = cache.stats()
+        self.assertEqual(stats["evictions"], 2)
+        self.assertEqual(stats["entries"], 0)
+
+    def test_pool(self):
+        with ap.FigureCache(self.tmpdir) as cache:
+            with ap.FigurePool(processes=1):
+                ap.resolveFigures([sizedFigure(2)])
+            img = sizedFigure(2)
+
+        self.assertIsInstance(img, ap.PdfImage)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+
 if __name__ == "__main__":
 
     unittest.main()
@@ -7,7 +7,15 @@ Created on Wed Oct 14 16:50:28 2015
 import numpy as np
 import os
 import sys
+import shutil
+import tempfile
+import subprocess
+import re
+import zlib
+import base64
+from concurrent.futures import ThreadPoolExecutor
 import unittest
+from io import BytesIO
 from faker import Faker
 
 __root__ = os.path.dirname(__file__)
@@ -23,6 +31,7 @@ import autobasedoc.autorpt as ar
 import autobasedoc.autoplot as ap
 from autobasedoc.autorpt import addPlugin
 from autobasedoc import base_fonts
+from reportlab.pdfbase import pdfmetrics
 
 fpath = os.path.join(ar.__font_dir__, 'calibri.ttf')
 font = ap.ft2font.FT2Font(fpath)
@@ -292,6 +301,521 @@ class Test_AutoBaseDoc(unittest.TestCase):
         self.doc.multiBuild(self.contents)
 
 
+class Test_StreamingBuild(unittest.TestCase):
+    """
+    documents are built from iterables of flowables, pulled while laying out
+    """
+
+    def setUp(self):
+        self.styles = ar.Styles()
+        self.styles.registerStyles()
+
+    def makeDoc(self):
+        return ar.AutoDocTemplate(BytesIO(),
+                                  onFirstPage=(drawFirstPortrait, 0),
+                                  onLaterPages=(drawLaterPortrait, 0))
+
+    def story(self, doc, pages=None):
+        """
+        yields paragraphs, headings kept with the next paragraph and tables
+        """
+        for i in range(300):
+            if pages is not None:
+                pages.append(getattr(doc, "page", 0))
+            if i % 50 == 0:
+                heading = ar.Paragraph("Chapter %d" % i, self.styles.h1)
+                heading.keepWithNext = 1
+                yield heading
+            if i % 100 == 10:
+                table = ar.StyledTable(gridded=True)
+                for row in range(60):
+                    table.addTableLine(["%d" % row, "cell %d" % row])
+                table.addTableHeader(["row", "cell"])
+                yield table.as_flowable
+            yield ar.Paragraph("paragraph %d " % i * 8, self.styles.normal)
+
+    def test_sameAsList(self):
+        listed = self.makeDoc()
+        story = list(self.story(listed))
+        listed.build(story)
+        streamed = self.makeDoc()
+        streamed.build(self.story(streamed))
+
+        self.assertEqual(story, [])
+        self.assertEqual(streamed.page, listed.page)
+        self.assertGreater(streamed.page, 10)
+
+    def test_lazy(self):
+        doc = self.makeDoc()
+        pages = []
+        doc.build(self.story(doc, pages))
+
+        # every flowable is pulled when the layout reaches its page
+        self.assertEqual(pages[0], 0)
+        self.assertEqual(pages, sorted(pages))
+        self.assertGreaterEqual(pages[-1], doc.page - 1)
+
+    def test_stream(self):
+        stream = ar.FlowableStream(iter(range(10)))
+        stream[0:0] = ["a", "b"]
+        stream.insert(1, "c")
+        del stream[0]
+
+        self.assertEqual(stream[:4], ["c", "b", 0, 1])
+        del stream[:3]
+        self.assertEqual(stream[0], 1)
+        self.assertEqual(len(stream._buffer), 1)
+        del stream[:]
+        self.assertEqual(len(stream), 0)
+        self.assertRaises(IndexError, stream.__getitem__, 0)
+
+
+class Test_TocPrediction(unittest.TestCase):
+    """
+    documents with a table of contents are laid out once
+    """
+
+    def setUp(self):
+        self.styles = ar.Styles()
+        self.styles.registerStyles()
+
+    def build(self, predictToc, hidden=False):
+        """
+        returns (passes, doc, toc) of a document with a table of contents,
+        with hidden, a heading is not at the top level of the story
+        """
+        doc = ar.AutoDocTemplate(BytesIO(),
+                                 onFirstPage=(drawFirstPortrait, 0),
+                                 onLaterPages=(drawLaterPortrait, 0))
+        toc = ar.doTableOfContents()
+        story = [ar.Paragraph("Title", self.styles.title), ar.PageBreak(),
+                 toc, ar.PageBreak()]
+        for i in range(80):
+            story.extend(ar.doHeading("Chapter %d" % i, self.styles.h1))
+            story.append(ar.Paragraph("text %d " % i * 100, self.styles.normal))
+        if hidden:
+            # too high to be kept together, its flowables are laid out one by one
+            story.append(ar.KeepTogether(list(ar.doHeading("Hidden", self.styles.h2)) +
+                                         [ar.Paragraph("long " * 3000, self.styles.normal)]))
+        return doc.multiBuild(story, predictToc=predictToc), doc, toc
+
+    def entries(self, toc):
+        """
+        the entries without the bookmark keys, which differ between documents
+        """
+        return [entry[:3] for entry in toc._entries]
+
+    def test_onePass(self):
+        passes, doc, toc = self.build(True)
+        multiPasses, multiDoc, multiToc = self.build(False)
+
+        self.assertEqual(passes, 1)
+        self.assertGreater(multiPasses, 1)
+        self.assertEqual(self.entries(toc), self.entries(multiToc))
+        self.assertEqual(doc.page, multiDoc.page)
+        # the table of contents spans pages
+        self.assertGreater(toc._entries[0][2], 3)
+        self.assertIn(b"abdToc", doc.filename.getvalue())
+
+    def test_fallback(self):
+        passes, doc, toc = self.build(True, hidden=True)
+        multiPasses, multiDoc, multiToc = self.build(False, hidden=True)
+
+        self.assertGreater(passes, 1)
+        self.assertEqual(toc._entries[-1][1], "Hidden")
+        self.assertEqual(self.entries(toc), self.entries(multiToc))
+        self.assertEqual(doc.page, multiDoc.page)
+        self.assertNotIn(b"abdToc", doc.filename.getvalue())
+
+    def test_noBookmarks(self):
+        story = [ar.AutoTableOfContents(), ar.PageBreak(),
+                 ar.Paragraph("text", self.styles.normal)]
+        pdfs = []
+        for predictToc in (True, False):
+            doc = ar.AutoDocTemplate(BytesIO(), invariant=1,
+                                     onFirstPage=(drawFirstPortrait, 0),
+                                     onLaterPages=(drawLaterPortrait, 0))
+            doc.multiBuild(story[:], predictToc=predictToc)
+            pdfs.append(doc.filename.getvalue())
+
+        # the placeholder entry is not predicted
+        self.assertEqual(pdfs[0], pdfs[1])
+        self.assertNotIn(b"abdToc", pdfs[0])
+
+
+class Test_TemplateLookup(unittest.TestCase):
+    """
+    page templates and frames are looked up by prefix in an index
+    """
+
+    def setUp(self):
+        self.doc = ar.AutoDocTemplate(BytesIO(),
+                                      onFirstPage=(ar.drawFirstPortrait, 0),
+                                      onLaterPages=(ar.drawLaterPortrait, 2))
+
+    def scan(self, prefix, last=False):
+        templates = self.doc.pageTemplates[::-1] if last else self.doc.pageTemplates
+        return [t for t in templates if t.id.startswith(prefix)][0]
+
+    def test_templates(self):
+        for prefix in ("", "F", "First", "LaterPortrait", "Later"):
+            self.assertIs(self.doc.getTemplate(prefix), self.scan(prefix))
+            self.assertIs(self.doc.getTemplate(prefix, last=True), self.scan(prefix, last=True))
+        self.assertEqual(self.doc.getTemplate("Later", as_name=True), "LaterPortrait")
+
+    def test_added(self):
+        template = self.doc.getMultiColumnTemplate(frameCount=2, template_id="LaterL",
+                                                   pagesize_landscape=True)
+        self.doc.addPageTemplates(template)
+
+        self.assertIs(self.doc.getTemplate("LaterL"), template)
+        self.assertIs(self.doc.getTemplate("Later", last=True), template)
+        self.assertIsNot(self.doc.getTemplate("Later"), template)
+
+    def test_frames(self):
+        frame, pagesize = self.doc.getFrame("LaterPortrait")
+        self.assertTrue(frame.id.startswith("LaterPortrait"))
+        # the columns of the later pages come first
+        self.assertEqual(self.doc.getFrame("LaterPortrait", orientation="Portrait1")[0].id,
+                         self.doc.getTemplate("LaterPortrait").frames[1].id)
+        self.assertIsNone(self.doc.getFrame("LaterPortrait", orientation="Landscape"))
+
+    def test_templateId(self):
+        ids = []
+
+        def callback(canv, doc):
+            ids.append(doc.template_id)
+
+        for template in self.doc.pageTemplates:
+            template.onPage = callback
+        styles = ar.Styles()
+        styles.registerStyles()
+        self.doc.build([ar.Paragraph("page", styles.normal), ar.PageBreak(),
+                        ar.Paragraph("page", styles.normal)])
+        # the id of the template, not the name of the callback
+        self.assertEqual(ids, ["FirstPortrait", "LaterPortrait"])
+
+        def outsideBuilding():
+            return self.doc.template_id
+        # outside of a build, the name of the caller
+        self.assertEqual(outsideBuilding(), "outsideBuilding")
+
+
+class Test_Reproducible(unittest.TestCase):
+    """
+    frame ids are numbered and invariant documents are written byte for byte
+    """
+
+    def makeDoc(self, **kwargs):
+        return ar.AutoDocTemplate(BytesIO(),
+                                  onFirstPage=(ar.drawFirstPortrait, 0),
+                                  onLaterPages=(ar.drawLaterPortrait, 2),
+                                  **kwargs)
+
+    def frameIds(self, doc):
+        return [frame.id for template in doc.pageTemplates for frame in template.frames]
+
+    def test_frameIds(self):
+        ids = self.frameIds(self.makeDoc())
+
+        self.assertEqual(ids, self.frameIds(self.makeDoc()))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids[:3], ["FirstPortrait_0", "Portrait0_1", "Portrait1_2"])
+
+    def build(self):
+        styles = ar.Styles()
+        styles.registerStyles()
+        doc = self.makeDoc(invariant=1, title="Reproducible")
+        doc.addPageInfo(typ="footer", pos="r", text="Page ", frame="Later",
+                        addPageNumber=True)
+        story = [ar.Paragraph("paragraph %d" % i, styles.normal) for i in range(3)]
+        story += [ar.PageBreak(), ar.Paragraph("second page", styles.normal)]
+        doc.build(story)
+        return doc.filename.getvalue()
+
+    def test_invariant(self):
+        self.assertEqual(self.build(), self.build())
+
+
+class Test_DocumentContext(unittest.TestCase):
+    """
+    documents built at once in threads, each in its own context
+    """
+
+    def setVollkorn(self):
+        ar.setTtfFonts('Vollkorn', ar.__font_dir__,
+                       normal=('Vollkorn', 'Vollkorn-Regular.ttf'),
+                       bold=('VollkornBd', 'Vollkorn-Bold.ttf'),
+                       italic=('VollkornIt', 'Vollkorn-Italic.ttf'),
+                       bold_italic=('VollkornBI', 'Vollkorn-BoldItalic.ttf'))
+
+    def report(self, vollkorn):
+        with ar.DocumentContext() as context:
+            if vollkorn:
+                self.setVollkorn()
+            styles = ar.Styles()
+            styles.registerStyles()
+            doc = ar.AutoDocTemplate(BytesIO(), invariant=1, context=context,
+                                     producer="vollkorn" if vollkorn else None,
+                                     onFirstPage=(ar.drawFirstPortrait, 0),
+                                     onLaterPages=(ar.drawLaterPortrait, 0))
+            doc.addPageInfo(typ="footer", pos="r", text="Page ", frame="Later",
+                            addPageNumber=True)
+            story = [ar.AutoTableOfContents()]
+            for chapter in range(3):
+                story.extend(ar.doHeading("Chapter %d" % chapter, styles.h1))
+                story += [ar.Paragraph("text " * 400, styles.normal), ar.PageBreak()]
+        doc.multiBuild(story)
+        return doc.filename.getvalue()
+
+    def test_fonts(self):
+        with ar.DocumentContext():
+            self.setVollkorn()
+            self.assertEqual(ar.base_fonts()["normal"], "Vollkorn")
+            self.assertEqual(ar._baseFontNames["normal"], "Vollkorn")
+            font = pdfmetrics.getFont("Vollkorn")
+            # the fonts are registered once, builds in other threads keep them
+            self.setVollkorn()
+            self.assertIs(pdfmetrics.getFont("Vollkorn"), font)
+        self.assertEqual(ar.base_fonts()["normal"], "Helvetica")
+        self.assertEqual(ar._baseFontNames["normal"], "Helvetica")
+
+        with ar.DocumentContext(fontprop=fontprop):
+            self.assertIs(ap.fontProperties(), fontprop)
+        self.assertIsNot(ap.fontProperties(), fontprop)
+
+    def test_threads(self):
+        with ThreadPoolExecutor(4) as pool:
+            pdfs = list(pool.map(self.report, [True, False] * 4))
+
+        # every document has its own fonts, producer and bookmark ids
+        self.assertEqual(len(set(pdfs[0::2])), 1)
+        self.assertEqual(len(set(pdfs[1::2])), 1)
+        self.assertIn(b"Vollkorn", pdfs[0])
+        self.assertNotIn(b"Vollkorn", pdfs[1])
+        self.assertEqual(re.findall(rb"/Producer \((\w+)", pdfs[0]), [b"vollkorn"])
+        self.assertEqual(re.findall(rb"/Producer \((\w+)", pdfs[1]), [b"ReportLab"])
+        self.assertEqual(pdfs[0], self.report(True))
+
+
+def pageTexts(pdf):
+    """
+    returns the PDF bytes pdf with its compressed streams decompressed
+    """
+    texts = [pdf]
+    for match in re.finditer(rb"stream\r?\n(.*?)endstream", pdf, re.S):
+        data = match.group(1)
+        if data.rstrip().endswith(b"~>"):
+            data = base64.a85decode(data.rstrip()[:-2])
+        try:
+            texts.append(zlib.decompress(data))
+        except zlib.error:
+            pass
+    return b"\n".join(texts)
+
+
+class Test_SectionCache(unittest.TestCase):
+    """
+    rebuilds reuse the pages of unchanged chapters
+    """
+
+    def setUp(self):
+        self.styles = ar.Styles()
+        self.styles.registerStyles()
+        self.directory = tempfile.mkdtemp()
+        self.cache = ar.SectionCache(self.directory)
+        self.last = self.cache.stats()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, longer=None, cache=True, footer=None):
+        """
+        returns a document of 20 chapters with a table of contents, the
+        chapter longer spans two pages, with footer on the later pages
+        """
+        if footer is None:
+            doc = ar.AutoDocTemplate(BytesIO(),
+                                     onFirstPage=(drawFirstPortrait, 0),
+                                     onLaterPages=(drawLaterPortrait, 0))
+        else:
+            doc = ar.AutoDocTemplate(BytesIO(),
+                                     onFirstPage=(ar.drawFirstPortrait, 0),
+                                     onLaterPages=(ar.drawLaterPortrait, 0))
+            doc.addPageInfo(typ="footer", pos="c", text=footer, frame="Later")
+        if cache:
+            doc.sectionCache = self.cache
+        story = [ar.Paragraph("Title", self.styles.title), ar.PageBreak(),
+                 ar.doTableOfContents(), ar.PageBreak()]
+        for i in range(20):
+            story.extend(ar.doHeading("Chapter %d" % i, self.styles.h1))
+            story.append(ar.Paragraph("text %d " % i * (1500 if i == longer else 300),
+                                      self.styles.normal))
+            story.append(ar.PageBreak())
+        doc.multiBuild(story)
+        return doc
+
+    def stats(self):
+        """
+        returns the units reused and laid out since the last call
+        """
+        stats = self.cache.stats()
+        result = (stats["reused"] - self.last["reused"],
+                  stats["laidOut"] - self.last["laidOut"])
+        self.last = stats
+        return result
+
+    def test_rebuild(self):
+        first = self.build()
+        self.assertEqual(self.stats(), (0, 21))
+
+        again = self.build()
+        # the title with the table of contents and the last chapter are laid out
+        self.assertEqual(self.stats(), (19, 2))
+        self.assertEqual(again.page, first.page)
+        self.assertGreater(os.path.getsize(self.cache._manifest), 0)
+
+        fresh = self.build(cache=False)
+        self.assertEqual(again.page, fresh.page)
+
+        # the pages of a rebuild are cached with their table of contents entries
+        third = self.build()
+        self.assertEqual(self.stats(), (19, 2))
+        toc = third._indexingFlowables[0]
+        self.assertEqual([entry[:3] for entry in toc._entries][-1], (0, "Chapter 19", 22))
+
+    def test_changedChapter(self):
+        self.build()
+        self.stats()
+
+        changed = self.build(longer=10)
+        # the chapters after the longer one start on other pages
+        self.assertEqual(self.stats(), (10, 11))
+        self.assertEqual(changed.page, self.build(longer=10, cache=False).page)
+
+        self.build(longer=10)
+        self.assertEqual(self.stats(), (19, 2))
+
+    def test_decoration(self):
+        self.build(footer="FOOTERAAA")
+        self.stats()
+
+        changed = self.build(footer="FOOTERBBB")
+        # the pages of the other footer are not reused
+        self.assertEqual(self.stats(), (0, 21))
+        pdf = pageTexts(changed.filename.getvalue())
+        self.assertNotIn(b"FOOTERAAA", pdf)
+        self.assertIn(b"FOOTERBBB", pdf)
+
+        again = self.build(footer="FOOTERBBB")
+        self.assertEqual(self.stats(), (19, 2))
+        self.assertNotIn(b"FOOTERAAA", pageTexts(again.filename.getvalue()))
+
+    def test_clear(self):
+        self.build()
+        self.cache.clear()
+        self.assertEqual(self.cache.stats()["reused"], 0)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class Test_ParallelBuild(unittest.TestCase):
+    """
+    chapters laid out in other processes are stitched into the document
+    """
+
+    def setUp(self):
+        self.styles = ar.Styles()
+        self.styles.registerStyles()
+
+    def build(self, processes=None, parallel=True, cache=None, footer=None):
+        """
+        returns (passes, doc, toc) of a document with chapters of one to
+        three pages, with footer on the later pages
+        """
+        doc = ar.AutoDocTemplate(BytesIO(),
+                                 onFirstPage=(drawFirstPortrait, 0),
+                                 onLaterPages=(ar.drawLaterPortrait, 0))
+        if footer is not None:
+            doc.addPageInfo(typ="footer", pos="c", text=footer, frame="Later")
+        doc.sectionCache = cache
+        toc = ar.doTableOfContents()
+        story = [ar.Paragraph("Title", self.styles.title), ar.PageBreak(),
+                 toc, ar.PageBreak()]
+        for i in range(12):
+            story.extend(ar.doHeading("Chapter %d" % i, self.styles.h1))
+            story.append(ar.Paragraph("text %d " % i * (300 + 1500 * (i % 3)),
+                                      self.styles.normal))
+            story.append(ar.PageBreak())
+        if parallel:
+            passes = doc.parallelBuild(story, processes=processes)
+        else:
+            passes = doc.multiBuild(story)
+        return passes, doc, toc
+
+    def entries(self, toc):
+        return [entry[:3] for entry in toc._entries]
+
+    def test_inProcess(self):
+        passes, doc, toc = self.build(processes=1)
+        serialPasses, serialDoc, serialToc = self.build(parallel=False)
+
+        self.assertEqual(passes, 1)
+        self.assertEqual(doc.page, serialDoc.page)
+        self.assertEqual(self.entries(toc), self.entries(serialToc))
+        # the temporary section cache is removed
+        self.assertIsNone(doc.sectionCache)
+
+    def test_processes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = ar.SectionCache(directory)
+            passes, doc, toc = self.build(processes=2, cache=cache)
+            serialPasses, serialDoc, serialToc = self.build(parallel=False)
+
+            self.assertEqual(doc.page, serialDoc.page)
+            self.assertEqual(self.entries(toc), self.entries(serialToc))
+            # all chapters but the last one are taken from the cache
+            self.assertEqual(cache.stats()["reused"], 11)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_decoration(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = ar.SectionCache(directory)
+            self.build(processes=1, cache=cache, footer="FOOTERAAA")
+            passes, doc, toc = self.build(processes=1, cache=cache, footer="FOOTERBBB")
+
+            # the chapters are laid out again with the new footer
+            self.assertEqual(cache.stats()["reused"], 22)
+            pdf = pageTexts(doc.filename.getvalue())
+            self.assertNotIn(b"FOOTERAAA", pdf)
+            self.assertIn(b"FOOTERBBB", pdf)
+        finally:
+            shutil.rmtree(directory)
+
+
+class Test_LazyImports(unittest.TestCase):
+    """
+    matplotlib, svglib and img2pdf are imported on first use
+    """
+
+    def imported(self, code):
+        code = ("import sys; sys.path.insert(0, %r); %s; print(' '.join(sorted(sys.modules)))"
+                % (importpath, code))
+        return subprocess.check_output([sys.executable, "-c", code]).decode().split()
+
+    def test_autorpt(self):
+        modules = self.imported("import autobasedoc.autorpt as ar")
+
+        for name in ("matplotlib", "autobasedoc.autoplot", "svglib", "img2pdf"):
+            self.assertNotIn(name, modules)
+
+    def test_firstUse(self):
+        modules = self.imported("import autobasedoc.autorpt as ar; ar.ap.plt")
+        self.assertIn("matplotlib.pyplot", modules)
+
+
 if __name__ == "__main__":
 
     unittest.main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+tests for writing the pages of a document while it is built,
+with AutoDocTemplate(incremental=True)
+"""
+import os
+import sys
+import tempfile
+import unittest
+from io import BytesIO
+
+__root__ = os.path.dirname(__file__)
+
+folder = "../"
+
+importpath = os.path.realpath(os.path.join(__root__, folder))
+
+sys.path.append(importpath)
+
+from pdfrw import PdfReader
+
+import autobasedoc.autorpt as ar
+from autobasedoc import DocumentContext
+from autobasedoc.incremental import IncrementalCanvas
+
+
+class Recording(object):
+    """
+    a file object that can not seek, keeping the page laid out at every write
+    """
+
+    def __init__(self, doc=None):
+        self.doc = doc
+        self.data = BytesIO()
+        self.pages = []
+
+    def write(self, data):
+        self.pages.append(getattr(self.doc, "page", None))
+        self.data.write(data)
+
+
+class Test_Incremental(unittest.TestCase):
+    """
+    pages are written as they are finished, the documents are the same
+    """
+
+    def setUp(self):
+        self.styles = ar.Styles()
+        self.styles.registerStyles()
+
+    def story(self):
+        story = [ar.doTableOfContents()]
+        for chapter in range(3):
+            story.extend(ar.doHeading("Chapter %d" % chapter, self.styles.h1))
+            story.extend(ar.Paragraph("text " * 300, self.styles.normal)
+                         for _ in range(6))
+            story.append(ar.PageBreak())
+        return story
+
+    def build(self, filename, incremental=True, **kwargs):
+        context = DocumentContext()
+        doc = ar.AutoDocTemplate(filename, invariant=1, incremental=incremental,
+                                 context=context,
+                                 onFirstPage=(ar.drawFirstPortrait, 0),
+                                 onLaterPages=(ar.drawLaterPortrait, 0))
+        doc.addPageInfo(typ="footer", pos="r", text="Page ", frame="Later",
+                        addPageNumber=True)
+        if isinstance(filename, Recording):
+            filename.doc = doc
+        # the tables of contents are numbered in the context
+        with context:
+            story = self.story()
+        doc.passes = doc.multiBuild(story, **kwargs)
+        return doc
+
+    def pages(self, pdf):
+        reader = PdfReader(fdata=pdf)
+        return ([page.Contents.stream for page in reader.pages],
+                reader.Root.Outlines.Count)
+
+    def test_pages(self):
+        expected = self.build(BytesIO(), incremental=False).filename.getvalue()
+        output = Recording()
+        doc = self.build(output)
+
+        self.assertEqual(doc.passes, 1)
+        self.assertIsInstance(doc.canv, IncrementalCanvas)
+        self.assertEqual(self.pages(output.data.getvalue()), self.pages(expected))
+        # the pages are written while the document is laid out
+        self.assertLess(output.pages[1], doc.page)
+        for page in doc.canv._doc.Pages.pages:
+            self.assertIsNone(page.Contents)
+
+    def test_passes(self):
+        expected = self.build(BytesIO(), incremental=False, predictToc=False)
+        self.assertGreater(expected.passes, 1)
+        expected = self.pages(expected.filename.getvalue())
+
+        doc = self.build(BytesIO(), predictToc=False)
+        self.assertEqual(self.pages(doc.filename.getvalue()), expected)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "incremental.pdf")
+            self.build(filename, predictToc=False)
+            with open(filename, "rb") as f:
+                self.assertEqual(self.pages(f.read()), expected)
+
+        # a file that can not seek is not rewound for another pass
+        with self.assertRaises(ar.LayoutError):
+            self.build(Recording(), predictToc=False)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+tests for the header and footer draw plans of pageinfo.addPlugin
+"""
+import gc
+import os
+import sys
+import copy
+import unittest
+from io import BytesIO
+
+__root__ = os.path.dirname(__file__)
+
+folder = "../"
+
+importpath = os.path.realpath(os.path.join(__root__, folder))
+
+sys.path.append(importpath)
+
+from reportlab.pdfgen import canvas
+
+import autobasedoc.autorpt as ar
+from autobasedoc.pageinfo import compilePlugin, _planKey
+
+
+class RecordingCanvas(canvas.Canvas):
+    """
+    a canvas keeping the strings, lines and forms drawn, per page
+    """
+
+    def __init__(self, *args, **kwargs):
+        canvas.Canvas.__init__(self, *args, **kwargs)
+        self.drawn = [[]]
+
+    def drawString(self, x, y, text, *args, **kwargs):
+        self.drawn[-1].append(("l", x, y, text))
+        return canvas.Canvas.drawString(self, x, y, text, *args, **kwargs)
+
+    def drawCentredString(self, x, y, text, *args, **kwargs):
+        self.drawn[-1].append(("c", x, y, text))
+        return canvas.Canvas.drawCentredString(self, x, y, text, *args, **kwargs)
+
+    def drawRightString(self, x, y, text, *args, **kwargs):
+        self.drawn[-1].append(("r", x, y, text))
+        return canvas.Canvas.drawRightString(self, x, y, text, *args, **kwargs)
+
+    def line(self, x1, y1, x2, y2):
+        self.drawn[-1].append(("line", x1, y1, x2, y2))
+        return canvas.Canvas.line(self, x1, y1, x2, y2)
+
+    def doForm(self, name):
+        self.drawn[-1].append(("form", name))
+        return canvas.Canvas.doForm(self, name)
+
+    def showPage(self):
+        self.drawn.append([])
+        return canvas.Canvas.showPage(self)
+
+
+class Test_DrawPlans(unittest.TestCase):
+    """
+    page infos are compiled once per frame and drawn from the plan
+    """
+
+    def setUp(self):
+        self.styles = ar.Styles()
+        self.styles.registerStyles()
+        self.doc = ar.AutoDocTemplate(BytesIO(),
+                                      onFirstPage=(ar.drawFirstPortrait, 0),
+                                      onLaterPages=(ar.drawLaterPortrait, 0))
+        self.doc.addPageInfo(typ="header", pos="c", text="Title page", frame="First")
+        self.doc.addPageInfo(typ="header", pos="l", text="Report", line=True, frame="Later")
+        self.doc.addPageInfo(typ="footer", pos="r", text="Page ", frame="Later",
+                             addPageNumber=True)
+
+    def build(self):
+        story = [ar.Paragraph("page %d" % i, self.styles.normal) for i in range(4)]
+        for i in range(3, 0, -1):
+            story.insert(i, ar.PageBreak())
+        canvases = []
+
+        def canvasmaker(*args, **kwargs):
+            canvases.append(RecordingCanvas(*args, **kwargs))
+            return canvases[-1]
+
+        self.doc.build(story, canvasmaker=canvasmaker)
+        return canvases[0].drawn[:4]
+
+    def test_pages(self):
+        pages = self.build()
+        texts = [[op[-1] for op in page if op[0] in "lcr"] for page in pages]
+
+        # the static texts are drawn once, into the form of their frame
+        self.assertEqual(texts, [["Title page"], ["Report", "Page 2"],
+                                 ["Page 3"], ["Page 4"]])
+        forms = [[op[1] for op in page if op[0] == "form"] for page in pages]
+        self.assertEqual(len(forms[1]), 1)
+        self.assertNotEqual(forms[0], forms[1])
+        self.assertEqual(forms[1], forms[2])
+        self.assertEqual(forms[1], forms[3])
+
+        frame = self.doc.getFrame("LaterPortrait")[0]
+        footers = [op for page in pages[1:] for op in page if op[0] == "r"]
+        self.assertEqual(set(op[1:3] for op in footers),
+                         {(frame._width - frame._rightPadding,
+                           frame._bottomPadding + self.doc.bottomM)})
+        self.assertIn(b"abdPageInfo", self.doc.filename.getvalue())
+
+    def test_compiledOnce(self):
+        self.build()
+        # one plan for the first and one for the later pages
+        self.assertEqual(len(self.doc._pageInfoPlans), 2)
+
+        self.doc.addPageInfo(typ="footer", pos="l", text="draft", frame="Later")
+        pages = self.build()
+        self.assertIn(("l", "draft"), [(op[0], op[-1]) for op in pages[1]])
+        self.assertEqual(len(self.doc._pageInfoPlans), 2)
+
+    def test_planKey(self):
+        frame = self.doc.getFrame("LaterPortrait")[0]
+        key = _planKey(self.doc, frame)
+
+        # the plans are keyed on content, not on ids that may be reused
+        self.doc.pageInfos = copy.deepcopy(self.doc.pageInfos)
+        gc.collect()
+        self.assertEqual(_planKey(self.doc, copy.deepcopy(frame)), key)
+
+        self.doc.pageInfos["Laterfooter____r"].text = "Seite "
+        self.assertNotEqual(_planKey(self.doc, frame), key)
+        pages = self.build()
+        self.assertIn(("r", "Seite 2"), [(op[0], op[-1]) for op in pages[1]])
+
+    def test_frameName(self):
+        frame = self.doc.getFrame("LaterPortrait")[0]
+        plan = compilePlugin(self.doc, frame)
+
+        self.assertEqual(compilePlugin(self.doc, frame, "Later"), plan)
+        self.assertEqual(len(plan), 3)
+        self.assertEqual([op[0] for op in compilePlugin(self.doc, frame, "First")],
+                         ["string"])
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+tests for the PdfImage / PdfAsset flowables and the parsed XObject cache
+"""
+import gc
+import os
+import sys
+import zlib
+import tempfile
+import unittest
+from io import BytesIO
+
+__root__ = os.path.dirname(__file__)
+
+folder = "../"
+
+importpath = os.path.realpath(os.path.join(__root__, folder))
+
+sys.path.append(importpath)
+
+from reportlab.pdfgen import canvas
+from pdfrw import PdfReader
+from pdfrw.buildxobj import pagexobj
+
+from autobasedoc.pdfimage import (PdfImage, PdfAsset, xobj_cache, form_name,
+                                  convert_px_to_pdf_image_obj)
+from autobasedoc.mappedpdf import MappedPdf, first_page
+
+img_path = os.path.join(__root__, "grafics", "color_logo.png")
+
+
+def makePdfBuffer(text="logo"):
+    """
+    returns a BytesIO holding a one page pdf with text on it
+    """
+    buf = BytesIO()
+    canv = canvas.Canvas(buf, pagesize=(200, 100), invariant=1)
+    canv.drawString(10, 10, text)
+    canv.showPage()
+    canv.save()
+    return buf
+
+
+def makeCompressedPdf(fname):
+    """
+    writes a pdf keeping its page in an object stream, with a cross reference
+    stream and a page tree of two levels, the page inheriting its MediaBox
+    """
+    content = zlib.compress(b"BT /F1 12 Tf 10 10 Td (compressed) Tj ET")
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [3 0 R] /Count 1 /MediaBox [0 0 200 100] >>",
+               b"<< /Type /Pages /Kids [4 0 R] /Count 1 /Parent 2 0 R >>",
+               b"<< /Type /Page /Parent 3 0 R /Contents 5 0 R /Resources"
+               b" << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> >>"]
+    header, body = [], b""
+    for number, obj in enumerate(objects, 1):
+        header.append(b"%d %d" % (number, len(body)))
+        body += obj + b" "
+    header = b" ".join(header) + b" "
+    stream = zlib.compress(header + body)
+
+    pdf = b"%PDF-1.5\n"
+    offsets = {}
+    offsets[5] = len(pdf)
+    pdf += (b"5 0 obj << /Length %d /Filter /FlateDecode >> stream\n" % len(content) +
+            content + b"\nendstream endobj\n")
+    offsets[6] = len(pdf)
+    pdf += (b"6 0 obj << /Type /ObjStm /N 4 /First %d /Length %d /Filter /FlateDecode >>"
+            b" stream\n" % (len(header), len(stream)) + stream + b"\nendstream endobj\n")
+    offsets[7] = len(pdf)
+    rows = [bytes([0, 0, 0, 0])]
+    rows += [bytes([2, 0, 6, index]) for index in range(4)]
+    rows += [bytes([1]) + offsets[n].to_bytes(2, "big") + b"\0" for n in (5, 6, 7)]
+    xref = zlib.compress(b"".join(rows))
+    pdf += (b"7 0 obj << /Type /XRef /Size 8 /W [1 2 1] /Root 1 0 R /Length %d"
+            b" /Filter /FlateDecode >> stream\n" % len(xref) + xref + b"\nendstream endobj\n")
+    pdf += b"startxref\n%d\n%%%%EOF\n" % offsets[7]
+    with open(fname, "wb") as f:
+        f.write(pdf)
+
+
+class Test_MappedPdf(unittest.TestCase):
+    """
+    files are read through a memory map, parsing only the first page
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+        xobj_cache().clear()
+
+    def assertSameXObject(self, fname):
+        mapped = pagexobj(first_page(fname))
+        read = pagexobj(PdfReader(fname, decompress=False).pages[0])
+        self.assertEqual(mapped.stream, read.stream)
+        self.assertEqual(mapped.BBox, read.BBox)
+        self.assertEqual(mapped.Filter, read.Filter)
+        self.assertEqual(sorted(mapped.Resources.keys()), sorted(read.Resources.keys()))
+
+    def test_firstPage(self):
+        fname = os.path.join(self.directory.name, "pages.pdf")
+        canv = canvas.Canvas(fname, pagesize=(200, 100), invariant=1)
+        for page in range(20):
+            canv.drawString(10, 10, "page %d" % page)
+            canv.showPage()
+        canv.save()
+
+        self.assertSameXObject(fname)
+        with MappedPdf(fname) as pdf:
+            pdf.first_page()
+            # the content and font of the first page, not the other pages
+            self.assertLess(len(pdf.objects), 5)
+            self.assertGreater(len(pdf.offsets), 40)
+
+    def test_objectStreams(self):
+        fname = os.path.join(self.directory.name, "compressed.pdf")
+        makeCompressedPdf(fname)
+
+        self.assertSameXObject(fname)
+        page = first_page(fname)
+        self.assertEqual(page.inheritable.MediaBox, ["0", "0", "200", "100"])
+        # the content stream is kept compressed
+        self.assertEqual(page.Contents.Filter, "/FlateDecode")
+
+    def test_embedded(self):
+        fname = os.path.join(self.directory.name, "compressed.pdf")
+        makeCompressedPdf(fname)
+        out = BytesIO()
+        canv = canvas.Canvas(out)
+        PdfAsset(fname).drawOn(canv, 0, 0)
+        canv.showPage()
+        canv.save()
+
+        form = PdfReader(fdata=out.getvalue()).pages[0].Resources.XObject
+        stream = list(form.values())[0].stream
+        self.assertIn("compressed", zlib.decompress(stream.encode("latin-1")).decode())
+
+
+class Test_XObjectCache(unittest.TestCase):
+    """
+    the same pdf bytes should only be parsed once
+    """
+
+    def setUp(self):
+        self.maxsize = xobj_cache().maxsize
+        xobj_cache().clear()
+
+    def tearDown(self):
+        xobj_cache().resize(self.maxsize)
+        xobj_cache().clear()
+
+    def test_sameBytesHit(self):
+        img1 = PdfImage(makePdfBuffer())
+        img2 = PdfImage(makePdfBuffer())
+
+        self.assertIs(img1.xobj, img2.xobj)
+        self.assertEqual(xobj_cache().stats()["hits"], 1)
+        self.assertEqual(xobj_cache().stats()["misses"], 1)
+
+    def test_differentBytesMiss(self):
+        img1 = PdfImage(makePdfBuffer("one"))
+        img2 = PdfImage(makePdfBuffer("two"))
+
+        self.assertIsNot(img1.xobj, img2.xobj)
+        self.assertEqual(xobj_cache().stats()["misses"], 2)
+
+    def test_eviction(self):
+        xobj_cache().resize(2)
+        for text in ("one", "two", "three"):
+            PdfImage(makePdfBuffer(text))
+
+        stats = xobj_cache().stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_disabled(self):
+        xobj_cache().resize(0)
+        img1 = PdfImage(makePdfBuffer())
+        img2 = PdfImage(makePdfBuffer())
+
+        self.assertIsNot(img1.xobj, img2.xobj)
+        self.assertEqual(len(xobj_cache()), 0)
+
+    def test_assetFromPath(self):
+        fname = os.path.join(__root__, "grafics", "out.pdf")
+        asset1 = PdfAsset(fname)
+        asset2 = PdfAsset(fname)
+
+        self.assertIs(asset1.xobj, asset2.xobj)
+        self.assertEqual(xobj_cache().stats()["hits"], 1)
+
+    def test_pxImage(self):
+        img = PdfImage(convert_px_to_pdf_image_obj(img_path))
+        self.assertGreater(img.drawWidth, 0)
+
+    def test_documentsNotRetained(self):
+        """
+        a cached XObject must not keep finished documents alive
+        """
+        img = PdfImage(makePdfBuffer())
+
+        canv = canvas.Canvas(BytesIO())
+        img.drawOn(canv, 0, 0)
+        canv.showPage()
+        canv.save()
+        del canv
+        gc.collect()
+
+        self.assertEqual(len(img.xobj.derived_rl_obj), 0)
+
+
+class Test_FormRegistry(unittest.TestCase):
+    """
+    every distinct pdf should become one Form XObject per document
+    """
+
+    def setUp(self):
+        self.maxsize = xobj_cache().maxsize
+
+    def tearDown(self):
+        xobj_cache().resize(self.maxsize)
+        xobj_cache().clear()
+
+    def test_sameContentOneForm(self):
+        # without the cache every PdfImage gets its own XObject
+        xobj_cache().resize(0)
+        img1 = PdfImage(makePdfBuffer())
+        img2 = PdfImage(makePdfBuffer())
+        self.assertIsNot(img1.xobj, img2.xobj)
+
+        canv = canvas.Canvas(BytesIO())
+        self.assertEqual(form_name(canv, img1.xobj), form_name(canv, img2.xobj))
+
+    def test_fileSizeFlat(self):
+        """
+        drawing the same image on more pages only adds the page streams
+        """
+        def pdfSize(pages):
+            out = BytesIO()
+            canv = canvas.Canvas(out, invariant=1)
+            for page in range(pages):
+                PdfImage(makePdfBuffer()).drawOn(canv, 0, 0)
+                canv.showPage()
+            canv.save()
+            return len(out.getvalue())
+
+        xobj_cache().resize(0)
+        size1, size2, size3 = pdfSize(1), pdfSize(2), pdfSize(3)
+        self.assertAlmostEqual(size3 - size2, size2 - size1, delta=8)
+        self.assertLess(size3 - size2, size1)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
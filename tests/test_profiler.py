@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+tests for the layout timings of profiler.LayoutProfiler
+"""
+import os
+import sys
+import json
+import unittest
+from io import BytesIO, StringIO
+
+__root__ = os.path.dirname(__file__)
+
+folder = "../"
+
+importpath = os.path.realpath(os.path.join(__root__, folder))
+
+sys.path.append(importpath)
+
+import autobasedoc.autorpt as ar
+from autobasedoc.profiler import LayoutProfiler
+
+
+class Test_LayoutProfiler(unittest.TestCase):
+    """
+    builds are timed per flowable type and page, and left as they were
+    """
+
+    def setUp(self):
+        self.styles = ar.Styles()
+        self.styles.registerStyles()
+
+    def build(self, profiler=None):
+        doc = ar.AutoDocTemplate(BytesIO(), invariant=1,
+                                 onFirstPage=(ar.drawFirstPortrait, 0),
+                                 onLaterPages=(ar.drawLaterPortrait, 0))
+        doc.addPageInfo(typ="footer", pos="r", text="Page ", frame="Later",
+                        addPageNumber=True)
+        doc.profiler = profiler
+        table = ar.StyledTable(gridded=True)
+        for row in range(120):
+            table.addTableLine([str(row), "a", "b"])
+        table.addTableHeader(["row", "a", "b"])
+        story = [ar.Paragraph("text " * 300, self.styles.normal) for i in range(5)]
+        story += [table.as_flowable, ar.PageBreak(),
+                  ar.Paragraph("last page", self.styles.normal)]
+        doc.build(story)
+        return doc
+
+    def test_timings(self):
+        profiler = LayoutProfiler()
+        doc = self.build(profiler)
+
+        tables = profiler.flowables["Table"]
+        self.assertGreater(tables["splits"], 0)
+        # tables not split for lack of room are postponed to the next frame
+        self.assertGreater(tables["postponed"], 0)
+        self.assertEqual(tables["split"][0], tables["splits"] + tables["postponed"])
+        self.assertEqual(profiler.flowables["Paragraph"]["draw"][0], 6)
+        self.assertEqual([page for p, page, seconds in profiler.pages],
+                         list(range(1, doc.page + 1)))
+        self.assertEqual(profiler.calls["onPage"][0], doc.page)
+        self.assertEqual(profiler.calls["addPlugin"][0], doc.page)
+        self.assertIn("Table", profiler.report())
+
+    def test_uninstrumented(self):
+        doc = self.build(LayoutProfiler())
+
+        self.assertNotIn("handle_flowable", doc.__dict__)
+        for template in doc.pageTemplates:
+            self.assertNotEqual(template.onPage.__name__, "timedOnPage")
+            for frame in template.frames:
+                self.assertNotIn("add", frame.__dict__)
+                self.assertNotIn("split", frame.__dict__)
+        self.assertEqual(doc.filename.getvalue(), self.build().filename.getvalue())
+
+    def test_export(self):
+        profiler = LayoutProfiler()
+        self.build(profiler)
+        data, trace = StringIO(), StringIO()
+        profiler.dump(data)
+        profiler.dumpTrace(trace)
+
+        data = json.loads(data.getvalue())
+        self.assertEqual(data["passes"], 1)
+        self.assertEqual(set(data["flowables"]["Table"]),
+                         {"handle", "wrap", "draw", "split", "splits", "postponed"})
+        events = json.loads(trace.getvalue())["traceEvents"]
+        self.assertEqual(set(event["ph"] for event in events), {"X"})
+        self.assertEqual(len([event for event in events if event["cat"] == "page"]),
+                         len(data["pages"]))
+
+
+if __name__ == "__main__":
+
+    unittest.main()
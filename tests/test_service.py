@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+tests for rendering story descriptions with service.ReportService
+"""
+import os
+import sys
+import json
+import socket
+import asyncio
+import unittest
+
+__root__ = os.path.dirname(__file__)
+
+folder = "../"
+
+importpath = os.path.realpath(os.path.join(__root__, folder))
+
+sys.path.append(importpath)
+
+from pdfrw import PdfReader
+from reportlab.platypus import Flowable
+
+from autobasedoc.service import (ReportService, ServiceBusy, renderDescription,
+                                 serve, element, elements)
+
+
+def description(paragraphs=20, title="Report"):
+    return {"title": title, "invariant": 1,
+            "pageInfos": [{"typ": "footer", "pos": "r", "text": "Page ",
+                           "frame": "Later", "addPageNumber": True}],
+            "story": [{"code": "toc"},
+                      {"code": "heading", "arguments": {"text": "Results"}}] +
+                     [{"code": "paragraph", "arguments": {"text": "text " * 200}}
+                      for _ in range(paragraphs)] +
+                     [{"code": "table", "arguments": {"rows": [[1, 2.5, "a"]] * 50,
+                                                      "header": ["n", "x", "s"]}}]}
+
+
+class Failing(Flowable):
+    """
+    a flowable whose layout fails with error
+    """
+
+    def __init__(self, error):
+        Flowable.__init__(self)
+        self.error = error
+
+    def wrap(self, availWidth, availHeight):
+        raise self.error
+
+
+class Test_ReportService(unittest.TestCase):
+    """
+    descriptions are rendered on the executor, concurrency and the queue
+    of waiting requests are limited
+    """
+
+    def test_render(self):
+        pdf = renderDescription(description())
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+        async def main():
+            service = ReportService(concurrency=2)
+            try:
+                rendered = await asyncio.gather(*[service.render(description())
+                                                  for _ in range(4)])
+                streamed = b"".join([chunk async for chunk in service.stream(description())])
+                # without a table of contents the pages are written as they are finished
+                incremental = b"".join([chunk async for chunk in service.stream(noToc)])
+            finally:
+                service.close()
+            return rendered, streamed, incremental
+
+        noToc = dict(description(), story=description()["story"][1:])
+        rendered, streamed, incremental = asyncio.run(main())
+        self.assertEqual(set(rendered), {pdf})
+        self.assertEqual(streamed, pdf)
+        self.assertEqual([page.Contents.stream for page in PdfReader(fdata=incremental).pages],
+                         [page.Contents.stream for page in
+                          PdfReader(fdata=renderDescription(noToc)).pages])
+
+    def test_backPressure(self):
+        async def main():
+            service = ReportService(concurrency=1, queueSize=1, chunkSize=1024,
+                                    buffers=2)
+            try:
+                chunks = service.stream(description())
+                first = await chunks.__anext__()
+                self.assertEqual(len(first), 1024)
+                # the build waits for the client
+                await asyncio.sleep(0.1)
+                self.assertEqual(service.running, 1)
+
+                waiting = asyncio.ensure_future(service.render(description(1)))
+                await asyncio.sleep(0)
+                self.assertEqual(service.waiting, 1)
+                with self.assertRaises(ServiceBusy):
+                    await service.render(description(1))
+
+                # closing the stream early aborts its build
+                await chunks.aclose()
+                self.assertTrue((await waiting).startswith(b"%PDF"))
+                self.assertEqual((service.running, service.waiting), (0, 0))
+            finally:
+                service.close()
+
+        asyncio.run(main())
+
+    def test_unknownElement(self):
+        async def main():
+            service = ReportService(concurrency=1)
+            try:
+                with self.assertRaises(ValueError):
+                    async for chunk in service.stream({"story": [{"code": "nothing"}]}):
+                        pass
+                self.assertEqual(service.running, 0)
+            finally:
+                service.close()
+
+        asyncio.run(main())
+
+
+class Test_Server(unittest.TestCase):
+    """
+    the HTTP server streams the PDF of a posted description
+    """
+
+    def test_post(self):
+        import http.client
+
+        async def main():
+            service = ReportService(concurrency=2)
+            server = await serve(service, port=0)
+            port = server.sockets[0].getsockname()[1]
+
+            def post(body):
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                connection.request("POST", "/render", body)
+                response = connection.getresponse()
+                return response.status, response.read()
+
+            loop = asyncio.get_running_loop()
+            try:
+                results = await asyncio.gather(
+                    *[loop.run_in_executor(None, post, json.dumps(description()))
+                      for _ in range(3)],
+                    loop.run_in_executor(None, post, "{"))
+            finally:
+                server.close()
+                await server.wait_closed()
+                service.close()
+            return results
+
+        results = asyncio.run(main())
+        pdf = renderDescription(description())
+        self.assertEqual(results[:3], [(200, pdf)] * 3)
+        self.assertEqual(results[3][0], 400)
+
+    def test_failedBuild(self):
+
+        @element("failing")
+        def failing(styles, kind):
+            return [Failing({"value": ValueError, "runtime": RuntimeError}[kind]("failed"))]
+
+        def failingDescription(kind):
+            return {"story": [{"code": "paragraph", "arguments": {"text": "text " * 200}}
+                              for _ in range(20)] +
+                             [{"code": "failing", "arguments": {"kind": kind}}]}
+
+        async def main():
+            service = ReportService(concurrency=2, chunkSize=256)
+            server = await serve(service, port=0)
+            port = server.sockets[0].getsockname()[1]
+
+            def post(body):
+                body = json.dumps(body).encode()
+                with socket.create_connection(("127.0.0.1", port), timeout=60) as connection:
+                    connection.sendall(b"POST /render HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s"
+                                       % (len(body), body))
+                    response = b""
+                    while True:
+                        data = connection.recv(65536)
+                        if not data:
+                            return response
+                        response += data
+
+            loop = asyncio.get_running_loop()
+            try:
+                return await asyncio.gather(
+                    loop.run_in_executor(None, post, {"story": [{"code": "unknown"}]}),
+                    *[loop.run_in_executor(None, post, failingDescription(kind))
+                      for kind in ("value", "runtime")])
+            finally:
+                server.close()
+                await server.wait_closed()
+                service.close()
+
+        try:
+            invalid, value, runtime = asyncio.run(main())
+        finally:
+            del elements["failing"]
+
+        self.assertTrue(invalid.startswith(b"HTTP/1.1 400 "))
+        # the PDF was being sent, the response is cut off instead
+        for response in (value, runtime):
+            self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+            self.assertEqual(response.count(b"HTTP/1.1"), 1)
+            self.assertIn(b"%PDF", response)
+            self.assertFalse(response.endswith(b"0\r\n\r\n"))
+
+
+if __name__ == "__main__":
+
+    unittest.main()
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+tests for splitting StyledTable across frames
+"""
+import os
+import sys
+import unittest
+from io import BytesIO
+
+__root__ = os.path.dirname(__file__)
+
+folder = "../"
+
+importpath = os.path.realpath(os.path.join(__root__, folder))
+
+sys.path.append(importpath)
+
+import numpy as np
+
+from reportlab.platypus import Frame
+
+import autobasedoc.autorpt as ar
+from autobasedoc.styledtable import ColumnarRows
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+def makeTable(rows, cols=4):
+    """
+    returns a StyledTable with a header and rows lines, every third line
+    with two lines of text and every other line with a background
+    """
+    table = ar.StyledTable(gridded=True)
+    for row in range(rows):
+        line = ["%d.%d" % (row, col) for col in range(cols)]
+        if row % 3 == 0:
+            line[-1] += "\nsecond line"
+        table.addTableLine(line)
+        if row % 2:
+            table.addTableStyleCommand(("BACKGROUND", [0, row + 1], [-1, row + 1],
+                                        ar.colors.lightgrey))
+    table.addTableHeader(["col%d" % col for col in range(cols)])
+    return table
+
+
+class Test_SplitTable(unittest.TestCase):
+    """
+    tables are split with one measurement of the rows
+    """
+
+    def setUp(self):
+        self.frame = Frame(0, 0, 400, 600)
+
+    def height(self, table):
+        return table.as_flowable.wrap(self.frame._aW, self.frame._aH)[1]
+
+    def test_rowHeights(self):
+        table = makeTable(20)
+        self.assertAlmostEqual(sum(table.getRowHeights(self.frame)),
+                               self.height(table))
+
+    def test_splitIterative(self):
+        table = makeTable(100)
+        up, down = table.split_table_iterative(self.frame, 300)
+
+        self.assertLessEqual(self.height(up), 300 * 0.9)
+        self.assertGreater(self.height(table.split_table(up.linesCount() + 1)[0]),
+                           300 * 0.9)
+        self.assertEqual(up.tableData + down.tableData[1:], table.tableData)
+        self.assertEqual(down.tableData[0], table.tableData[0])
+
+    def test_splitPages(self):
+        table = makeTable(500)
+        parts = table.split_table_pages(self.frame, 200)
+
+        self.assertLessEqual(self.height(parts[0]), 200 * 0.9)
+        for part in parts[1:]:
+            self.assertEqual(part.tableData[0], table.tableData[0])
+            self.assertLessEqual(self.height(part), self.frame._aH * 0.9)
+
+        rows = parts[0].tableData + [row for part in parts[1:]
+                                     for row in part.tableData[1:]]
+        self.assertEqual(rows, table.tableData)
+
+    def test_splitPagesFits(self):
+        table = makeTable(5)
+        self.assertEqual(table.split_table_pages(self.frame, 600), [table])
+
+    def test_backgroundShifted(self):
+        table = makeTable(100)
+        parts = table.split_table_pages(self.frame, 200)
+
+        for part in parts[1:]:
+            for command in part.tableStyleCommands:
+                if command[0] == "BACKGROUND":
+                    row = command[1][1]
+                    self.assertTrue(0 < row < part.linesCount())
+                    # the original rows with a background are the odd ones
+                    self.assertIn(part.tableData[row][0].split(".")[0][-1],
+                                  "13579")
+        # the original table is not modified
+        self.assertEqual(table.tableStyleCommands[-3][1], [0, 100])
+
+
+class Test_TableViews(unittest.TestCase):
+    """
+    parts of a table share its rows until they are changed
+    """
+
+    def test_splitShares(self):
+        table = makeTable(100)
+        rows = table.tableData
+        up, down = table.split_table(40)
+
+        self.assertIs(up._tableData, rows)
+        self.assertIs(down._tableData, rows)
+        self.assertEqual((up.linesCount(), down.linesCount()), (40, 62))
+        self.assertEqual(down.colsCount(), 4)
+
+    def test_partsIndependent(self):
+        table = makeTable(20)
+        rows = list(table.tableData)
+        commands = list(table.tableStyleCommands)
+        up, down = table.split_table(10)
+        down.shift_background_styles(9)
+
+        up.addTableLine(["up"] * 4)
+        down.addTableStyleCommand(("BACKGROUND", (0, 1), (-1, 1), ar.colors.red))
+        table.addTableLine(["table"] * 4)
+
+        self.assertEqual(table.tableData, rows + [["table"] * 4])
+        self.assertEqual(table.tableStyleCommands, commands)
+        self.assertEqual(up.tableData, rows[:10] + [["up"] * 4])
+        self.assertEqual(down.tableData, rows[:1] + rows[10:])
+        self.assertEqual(down.tableStyleCommands[-1][1], (0, 1))
+
+    def test_splitOfPart(self):
+        table = makeTable(30)
+        rows = table.tableData
+        up, down = table.split_table(10)
+        down.shift_background_styles(9)
+        up2, down2 = down.split_table(5)
+        down2.shift_background_styles(4)
+
+        self.assertEqual(up2.tableData, rows[:1] + rows[10:14])
+        self.assertEqual(down2.tableData, rows[:1] + rows[14:])
+        backgrounds = [command for command in down2.tableStyleCommands
+                       if command[0] == "BACKGROUND"]
+        # the first row left is the odd row 13, below the header of down2
+        self.assertEqual(backgrounds[0][1][1], 1)
+        self.assertEqual(down2.tableData[1][0], "13.0")
+
+
+class Test_ColumnWidth(unittest.TestCase):
+    """
+    columns are estimated as a whole, with the same result as cell by cell
+    """
+
+    def cellByCell(self, table, data):
+        widths = {}
+        for line in data:
+            for i, cell in enumerate(line):
+                widths[i] = max(widths.get(i, 0), table.widthEstim(cell))
+        return [widths[i] for i in range(len(widths))]
+
+    def test_mixedColumns(self):
+        table = ar.StyledTable()
+        data = [["a\nlonger line", 1, 0.0, None],
+                ["WWW", 2**70, -0.0, 1.5],
+                ["", True, float("nan"), "text"],
+                [7]]
+        self.assertEqual(table.columnWidthEstim(data), self.cellByCell(table, data))
+
+    def test_manyNumbers(self):
+        table = ar.StyledTable()
+        data = [[i * 1.25, i * 7, "row%d" % (i % 13)] for i in range(-500, 500)]
+        data.append([1e-300, -123456789, "the widest text of all"])
+        self.assertEqual(table.columnWidthEstim(data), self.cellByCell(table, data))
+
+    def test_sample(self):
+        table = ar.StyledTable()
+        data = [["header", "h"]] + [[i, "x"] for i in range(1000)]
+        data[-1][1] = "a much wider cell"
+
+        table.widthSample = 10
+        widths = table.columnWidthEstim(data)
+        self.assertEqual(widths[0], table.widthEstim("header"))
+        self.assertLess(widths[1], table.widthEstim("a much wider cell"))
+        self.assertEqual(table.columnWidthEstim(data, sample=0),
+                         self.cellByCell(table, data))
+
+
+class Test_ColumnarData(unittest.TestCase):
+    """
+    columnar data is only turned into rows for the parts that are laid out
+    """
+
+    def setUp(self):
+        self.frame = Frame(0, 0, 400, 600)
+        self.data = np.arange(60.).reshape(20, 3)
+
+    def rowsOf(self, data, padding=False):
+        rows = [["%.1f" % row[0]] + row[1:].tolist() for row in data]
+        if padding:
+            rows = [[""] + row for row in rows]
+        return rows
+
+    def test_rows(self):
+        table = ar.StyledTable(leftTablePadding=1)
+        table.setColumnarData(self.data, formatters={0: "%.1f"}, header=True)
+
+        self.assertIsInstance(table._tableData, ColumnarRows)
+        self.assertEqual(table.linesCount(), 21)
+        self.assertEqual(table.colsCount(), 4)
+        self.assertEqual(table._tableData[0], ["", "0", "1", "2"])
+        self.assertEqual(table._tableData[1:], self.rowsOf(self.data, padding=True))
+        self.assertEqual(table._tableData[-1], ["", "57.0", 58.0, 59.0])
+
+    def test_sameAsLists(self):
+        table = ar.StyledTable()
+        table.setColumnarData(self.data, formatters=["%.1f"], header=True)
+        table.addTableLine(["sum", 1.5, "total"])
+        table.measureRows = 6
+        lists = ar.StyledTable()
+        lists.setTableData(self.rowsOf(self.data))
+        lists.addTableHeader(["0", "1", "2"])
+        lists.addTableLine(["sum", 1.5, "total"])
+
+        self.assertEqual(list(table._tableData), lists.tableData)
+        self.assertEqual(table.columnWidthEstim(table._tableData),
+                         lists.columnWidthEstim(lists.tableData))
+        self.assertEqual(table.getRowHeights(self.frame),
+                         lists.getRowHeights(self.frame))
+
+    def test_pagesLazy(self):
+        table = ar.StyledTable()
+        table.setColumnarData(np.random.rand(3000, 4), header=True)
+        parts = table.split_table_pages(self.frame, 200)
+        parts[1].as_flowable
+
+        # the table itself has not been turned into lists of rows
+        self.assertIsInstance(table._tableData, ColumnarRows)
+        self.assertEqual(sum(part.linesCount() - 1 for part in parts), 3000)
+        self.assertEqual(parts[1].tableData[0], ["0", "1", "2", "3"])
+
+    def test_flowable(self):
+        table = ar.StyledTable(gridded=True)
+        table.setColumnarData(self.data, formatters=["%.1f"], header=True)
+        styled = ar.StyledTable(gridded=True)
+        styled.setColumnarData(self.data, header=True)
+
+        # small enough not to be split, the table is laid out as a whole
+        self.assertEqual(table.split_table_pages(self.frame, 600), [table])
+        flowable = table.as_flowable
+        self.assertEqual(flowable._cellvalues[1:], self.rowsOf(self.data))
+        self.assertEqual(len(styled.layoutStyledTable(colWidths=[-1, 2, 2])._cellvalues), 21)
+        self.assertEqual(len(styled.layoutFullWidthTable(self.frame)._cellvalues), 21)
+
+        out = BytesIO()
+        doc = ar.AutoDocTemplate(out, onFirstPage=(ar.drawFirstPortrait, 0),
+                                 onLaterPages=(ar.drawLaterPortrait, 0))
+        doc.multiBuild([flowable])
+        self.assertTrue(out.getvalue().startswith(b"%PDF"))
+
+    def test_structured(self):
+        data = np.zeros(3, dtype=[("name", "U5"), ("value", "f8")])
+        data["name"] = ["a", "b", "c"]
+        rows = ColumnarRows(data, formatters={"value": "%.3f"})
+
+        self.assertEqual(rows.names, ["name", "value"])
+        self.assertEqual(rows[:], [["a", "0.000"], ["b", "0.000"], ["c", "0.000"]])
+
+    @unittest.skipIf(pd is None, "pandas is not installed")
+    def test_dataFrame(self):
+        df = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+        rows = ColumnarRows(df)
+
+        self.assertEqual(rows.names, ["a", "b"])
+        self.assertEqual(rows[:], [[1, "x"], [2, "y"]])
+
+        table = ar.StyledTable()
+        table.setColumnarData(df, formatters={"a": "%.2f"}, header=True)
+        self.assertEqual(table.as_flowable._cellvalues, [["a", "b"], ["1.00", "x"], ["2.00", "y"]])
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_arrow(self):
+        table = pa.table({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+        rows = ColumnarRows(table)
+
+        self.assertEqual(rows.names, ["a", "b"])
+        self.assertEqual(rows[1:], [[2, "y"], [3, "z"]])
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_arrowChunks(self):
+        # columns of several chunks with nulls can not be read without copies
+        table = pa.Table.from_batches([
+            pa.record_batch({"a": [1.5, None], "b": ["x", None]}),
+            pa.record_batch({"a": [3.0, 4.0], "b": ["z", "w"]})])
+        rows = ColumnarRows(table, formatters={"a": lambda values: ["%s" % v for v in values]})
+
+        self.assertEqual(table.column("a").num_chunks, 2)
+        self.assertEqual(rows[1:3], [["nan", None], ["3.0", "z"]])
+        self.assertEqual(rows[:], [["1.5", "x"], ["nan", None], ["3.0", "z"], ["4.0", "w"]])
+
+
+if __name__ == "__main__":
+
+    unittest.main()